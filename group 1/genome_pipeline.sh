@@ -7,8 +7,8 @@ set -euo pipefail
 ############################################
 
 ENV_NAME="genome-pipeline"
-THREADS=6
-PARALLEL_JOBS=2   # Number of genomes to process in parallel
+TOTAL_CORES="${TOTAL_CORES:-$(nproc)}"   # Cores shared by all samples
+MAX_SAMPLES="${MAX_SAMPLES:-4}"          # Genomes in flight at once
 MAIN_DIR="results_parallel"
 DB_DIR="$HOME/.antismash"
 
@@ -53,108 +53,255 @@ if [[ ${#R1_FILES[@]} -eq 0 ]]; then
 fi
 
 # ------------------------------------------------------
-# 4. Define function to process one sample
+# 4. Core scheduler
 # ------------------------------------------------------
-run_sample() {
-    R1="$1"
-    R2="$2"
-    SAMPLE="$3"
-    SAMPLE_DIR="$4"
-    LOG_DIR="$5"
-    THREADS="$6"
+# Cores are handed out per step, not per sample: a step waits for at least
+# its minimum and gets every free core up to its maximum, so a sample in a
+# single-threaded phase holds one core and the rest go to whoever is
+# waiting. Waiting steps queue by priority, then arrival; the minimum of
+# every step ahead in the queue is reserved, so a SPAdes or antiSMASH run
+# gets its cores before new short steps, and short steps only backfill
+# what is left over. The free count lives in one file guarded by flock.
+#
+# Step: "priority min max" (priority 0 is served first)
+declare -A STEP_CORES=(
+    [fastqc]="2 1 2"
+    [fastp]="1 2 4"
+    [spades]="0 4 16"
+    [quast]="2 1 4"
+    [prokka]="1 2 8"
+    [antismash]="0 4 16"
+)
 
-    echo "====================================="
-    echo "    STARTING SAMPLE: $SAMPLE"
-    echo "====================================="
+SCHED_DIR=$(mktemp -d "${TMPDIR:-/tmp}/genome_pipeline.XXXXXX")
+trap 'rm -rf "$SCHED_DIR"' EXIT
+echo "$TOTAL_CORES 0" > "$SCHED_DIR/free"   # free cores, next ticket number
+mkdir -p "$SCHED_DIR/waiting"
+: > "$SCHED_DIR/lock"
+: > "$SCHED_DIR/steps"
 
-    mkdir -p "${SAMPLE_DIR}/fastqc_raw" \
-             "${SAMPLE_DIR}/fastp_output" \
-             "${SAMPLE_DIR}/fastqc_trimmed" \
-             "${SAMPLE_DIR}/spades_output" \
-             "${SAMPLE_DIR}/quast_output" \
-             "${SAMPLE_DIR}/prokka_output" \
-             "${SAMPLE_DIR}/antismash_output"
+# Usage: acquire_cores PRIORITY MIN MAX  → prints the number of cores granted
+acquire_cores() {
+    local prio=$1 min=$2 max=$3 ticket grant
+    (( min > TOTAL_CORES )) && min=$TOTAL_CORES
+    (( max > TOTAL_CORES )) && max=$TOTAL_CORES
+
+    # Take a ticket; names sort by priority, then arrival
+    ticket=$(
+        exec 9>>"$SCHED_DIR/lock"
+        flock 9
+        read -r free next < "$SCHED_DIR/free"
+        echo "$free $(( next + 1 ))" > "$SCHED_DIR/free"
+        printf -v ticket '%d-%08d' "$prio" "$next"
+        echo "$min" > "$SCHED_DIR/waiting/$ticket"
+        echo "$ticket"
+    )
+
+    until grant=$(
+        exec 9>>"$SCHED_DIR/lock"
+        flock 9
+        read -r free next < "$SCHED_DIR/free"
+        reserved=0
+        for waiter in "$SCHED_DIR"/waiting/*; do
+            [[ "${waiter##*/}" < "$ticket" ]] || break
+            reserved=$(( reserved + $(< "$waiter") ))
+        done
+        avail=$(( free - reserved ))
+        (( avail >= min )) || exit 1
+        grant=$(( avail < max ? avail : max ))
+        echo "$(( free - grant )) $next" > "$SCHED_DIR/free"
+        rm -f "$SCHED_DIR/waiting/$ticket"
+        echo "$grant"
+    ); do
+        sleep 1
+    done
+    echo "$grant"
+}
 
-    # 1. FastQC raw
-    fastqc "$R1" "$R2" -o "${SAMPLE_DIR}/fastqc_raw" \
-        2>&1 | tee "${LOG_DIR}/${SAMPLE}_fastqc_raw.log"
+# Usage: release_cores N
+release_cores() {
+    (
+        flock 9
+        read -r free next < "$SCHED_DIR/free"
+        echo "$(( free + $1 )) $next" > "$SCHED_DIR/free"
+    ) 9>>"$SCHED_DIR/lock"
+}
+
+# Sets CHILDREN_CPU to the CPU seconds (user + sys) of this shell's finished
+# child processes; `times` has to run in this shell, not in a $(...) subshell
+children_cpu() {
+    local file="$SCHED_DIR/times.$BASHPID"
+    times > "$file"
+    CHILDREN_CPU=$(awk 'NR == 2 {
+        s = 0
+        for (i = 1; i <= 2; i++) { split($i, t, "m"); s += t[1] * 60 + t[2] }
+        print s
+    }' "$file")
+}
 
-    # 2. fastp trimming
+# Usage: run_step SAMPLE STEP FUNC [args...]  → FUNC gets the granted cores as $1
+# Records sample, step, cores, wall and CPU seconds for the utilisation report
+run_step() {
+    local sample=$1 step=$2 func=$3
+    shift 3
+    local prio min max cores start cpu rc=0
+    read -r prio min max <<< "${STEP_CORES[$step]}"
+    cores=$(acquire_cores "$prio" "$min" "$max")
+    echo "[$sample] $step on $cores core(s)"
+    start=$(date +%s.%N)
+    children_cpu
+    cpu=$CHILDREN_CPU
+    "$func" "$cores" "$@" || rc=$?
+    release_cores "$cores"
+    children_cpu
+    awk -v s="$sample" -v t="$step" -v c="$cores" -v start="$start" -v now="$(date +%s.%N)" \
+        -v cpu0="$cpu" -v cpu1="$CHILDREN_CPU" \
+        'BEGIN { printf "%s %s %d %.2f %.2f\n", s, t, c, now - start, cpu1 - cpu0 }' >> "$SCHED_DIR/steps"
+    return $rc
+}
+
+# Usage: utilisation_report WALL_SECONDS
+utilisation_report() {
+    awk -v total="$TOTAL_CORES" -v wall="$1" '
+        { alloc += $3 * $4; cpu += $5; n[$2]++; w[$2] += $4; a[$2] += $3 * $4; c[$2] += $5 }
+        END {
+            if (wall <= 0) wall = 1
+            printf "Cores: %d   wall time: %.0fs\n", total, wall
+            printf "Cores allocated: %.0f%% of the node   CPU actually used: %.0f%%\n\n",
+                100 * alloc / (total * wall), 100 * cpu / (total * wall)
+            printf "%-10s %5s %10s %12s %10s %11s\n", "step", "runs", "wall_s", "core_s", "cpu_s", "efficiency"
+            for (s in n)
+                printf "%-10s %5d %10.0f %12.0f %10.0f %10.0f%%\n", s, n[s], w[s], a[s], c[s],
+                    (a[s] > 0 ? 100 * c[s] / a[s] : 0)
+        }' "$SCHED_DIR/steps"
+}
+
+# ------------------------------------------------------
+# 5. Steps of one sample (each gets its core count as $1)
+# ------------------------------------------------------
+step_fastqc_raw() {
+    fastqc -t "$1" "$R1" "$R2" -o "${SAMPLE_DIR}/fastqc_raw" \
+        > "${LOG_DIR}/${SAMPLE}_fastqc_raw.log" 2>&1
+}
+
+step_fastp() {
     fastp \
         -i "$R1" -I "$R2" \
         -o "${SAMPLE_DIR}/fastp_output/${SAMPLE}_R1_trimmed.fastq.gz" \
         -O "${SAMPLE_DIR}/fastp_output/${SAMPLE}_R2_trimmed.fastq.gz" \
         -h "${SAMPLE_DIR}/fastp_output/${SAMPLE}_fastp.html" \
         -j "${SAMPLE_DIR}/fastp_output/${SAMPLE}_fastp.json" \
-        -q 20 -u 30 -n 5 -l 50 -w 4 \
-        2>&1 | tee "${LOG_DIR}/${SAMPLE}_fastp.log"
+        -q 20 -u 30 -n 5 -l 50 -w "$1" \
+        > "${LOG_DIR}/${SAMPLE}_fastp.log" 2>&1
+}
 
-    # 3. FastQC trimmed
-    fastqc \
+step_fastqc_trimmed() {
+    fastqc -t "$1" \
         "${SAMPLE_DIR}/fastp_output/${SAMPLE}_R1_trimmed.fastq.gz" \
         "${SAMPLE_DIR}/fastp_output/${SAMPLE}_R2_trimmed.fastq.gz" \
         -o "${SAMPLE_DIR}/fastqc_trimmed" \
-        2>&1 | tee "${LOG_DIR}/${SAMPLE}_fastqc_trimmed.log"
+        > "${LOG_DIR}/${SAMPLE}_fastqc_trimmed.log" 2>&1
+}
 
-    # 4. SPAdes assembly
+step_spades() {
     spades.py \
         -1 "${SAMPLE_DIR}/fastp_output/${SAMPLE}_R1_trimmed.fastq.gz" \
         -2 "${SAMPLE_DIR}/fastp_output/${SAMPLE}_R2_trimmed.fastq.gz" \
         -o "${SAMPLE_DIR}/spades_output" \
-        -t ${THREADS} --isolate \
-        2>&1 | tee "${LOG_DIR}/${SAMPLE}_spades.log"
-
-    ASSEMBLY="${SAMPLE_DIR}/spades_output/contigs.fasta"
-    if [[ ! -f "$ASSEMBLY" ]]; then
-        echo "❌ Assembly missing for $SAMPLE — skipping remaining steps."
-        return
-    fi
+        -t "$1" --isolate \
+        > "${LOG_DIR}/${SAMPLE}_spades.log" 2>&1
+}
 
-    # 5. QUAST
+step_quast() {
     quast "$ASSEMBLY" \
         -o "${SAMPLE_DIR}/quast_output" \
-        -t ${THREADS} \
-        2>&1 | tee "${LOG_DIR}/${SAMPLE}_quast.log"
+        -t "$1" \
+        > "${LOG_DIR}/${SAMPLE}_quast.log" 2>&1
+}
 
-    # 6. Prokka
+step_prokka() {
     prokka "$ASSEMBLY" \
         --outdir "${SAMPLE_DIR}/prokka_output" \
         --prefix "$SAMPLE" \
-        --cpus ${THREADS} \
+        --cpus "$1" \
         --kingdom Bacteria \
         --complaint\
         --fast \
         --force \
-        2>&1 | tee "${LOG_DIR}/${SAMPLE}_prokka.log"
-
-    GBK="${SAMPLE_DIR}/prokka_output/${SAMPLE}.gbk"
-    if [[ ! -f "$GBK" ]]; then
-        echo "❌ Prokka failed for $SAMPLE — skipping antiSMASH"
-        return
-    fi
+        > "${LOG_DIR}/${SAMPLE}_prokka.log" 2>&1
+}
 
-    # 7. antiSMASH
+step_antismash() {
     antismash "$GBK" \
         --databases "$DB_DIR" \
         --output-dir "${SAMPLE_DIR}/antismash_output" \
         --genefinding-tool none \
         --taxon bacteria \
-        --cpus ${THREADS} \
+        --cpus "$1" \
         --cb-general --cb-subclusters --cb-knownclusters \
         --asf --pfam2go \
-        2>&1 | tee "${LOG_DIR}/${SAMPLE}_antismash.log"
+        > "${LOG_DIR}/${SAMPLE}_antismash.log" 2>&1
+}
+
+# ------------------------------------------------------
+# 6. Process one sample (runs as a background job)
+# ------------------------------------------------------
+run_sample() {
+    R1="$1"
+    R2="$2"
+    SAMPLE="$3"
+    SAMPLE_DIR="$4"
+    LOG_DIR="$5"
+    # A failing tool ends its step, not the sample
+    set +e
+
+    echo "====================================="
+    echo "    STARTING SAMPLE: $SAMPLE"
+    echo "====================================="
+
+    mkdir -p "${SAMPLE_DIR}/fastqc_raw" \
+             "${SAMPLE_DIR}/fastp_output" \
+             "${SAMPLE_DIR}/fastqc_trimmed" \
+             "${SAMPLE_DIR}/spades_output" \
+             "${SAMPLE_DIR}/quast_output" \
+             "${SAMPLE_DIR}/prokka_output" \
+             "${SAMPLE_DIR}/antismash_output"
+
+    run_step "$SAMPLE" fastqc step_fastqc_raw
+    run_step "$SAMPLE" fastp step_fastp
+    run_step "$SAMPLE" fastqc step_fastqc_trimmed
+    run_step "$SAMPLE" spades step_spades
+
+    ASSEMBLY="${SAMPLE_DIR}/spades_output/contigs.fasta"
+    if [[ ! -f "$ASSEMBLY" ]]; then
+        echo "❌ Assembly missing for $SAMPLE — skipping remaining steps."
+        return
+    fi
+
+    run_step "$SAMPLE" quast step_quast
+    run_step "$SAMPLE" prokka step_prokka
+
+    GBK="${SAMPLE_DIR}/prokka_output/${SAMPLE}.gbk"
+    if [[ ! -f "$GBK" ]]; then
+        echo "❌ Prokka failed for $SAMPLE — skipping antiSMASH"
+        return
+    fi
+
+    run_step "$SAMPLE" antismash step_antismash
 
     echo "✔ COMPLETED SAMPLE: $SAMPLE"
 }
 
-export -f run_sample
-
 # ------------------------------------------------------
-# 5. Build parallel job list
+# 7. Run the samples, at most MAX_SAMPLES at a time
 # ------------------------------------------------------
-JOB_FILE="parallel_jobs.txt"
-rm -f "$JOB_FILE"
+echo
+echo "==========================================="
+echo " RUNNING UP TO ${MAX_SAMPLES} SAMPLES ON ${TOTAL_CORES} CORES"
+echo "==========================================="
+echo
 
+RUN_START=$(date +%s)
 for R1 in "${R1_FILES[@]}"; do
     if [[ "$R1" == *_R1* ]]; then
         R2="${R1/_R1/_R2}"
@@ -166,19 +313,18 @@ for R1 in "${R1_FILES[@]}"; do
 
     [[ -f "$R2" ]] || continue
 
-    echo "$R1 $R2 $SAMPLE $MAIN_DIR/$SAMPLE $MAIN_DIR/logs $THREADS" >> "$JOB_FILE"
+    while (( $(jobs -rp | wc -l) >= MAX_SAMPLES )); do
+        wait -n || true
+    done
+    run_sample "$R1" "$R2" "$SAMPLE" "$MAIN_DIR/$SAMPLE" "$MAIN_DIR/logs" &
 done
+wait
 
-# ------------------------------------------------------
-# 6. Run samples in parallel
-# ------------------------------------------------------
 echo
-echo "==========================================="
-echo " RUNNING ${PARALLEL_JOBS} SAMPLES IN PARALLEL"
-echo "==========================================="
-echo
-
-parallel --colsep ' ' -j "$PARALLEL_JOBS" run_sample :::: "$JOB_FILE"
+echo "====================================="
+echo " CORE UTILISATION"
+echo "====================================="
+utilisation_report $(( $(date +%s) - RUN_START )) | tee "$MAIN_DIR/logs/utilisation.txt"
 
 echo
 echo "====================================="
@@ -37,11 +37,20 @@ fi
 
 R1="$1"; R2="$2"; PREFIX="$3"; KOFAM_DIR="$4"; PATHWAY_DIR="$5"
 PROJECT_DIR="$(pwd)"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 WORKDIR="${PROJECT_DIR}/CoG_run_${PREFIX}"
 OUTDIR="${WORKDIR}/out/${PREFIX}"
 LOGDIR="${WORKDIR}/logs"
 mkdir -p "$WORKDIR" "$OUTDIR" "$LOGDIR"
 
+# SPAdes threads and memory are planned from the trimmed reads and past runs
+# by group 5's spades_planner.py; SPADES_THREADS caps the threads and
+# SPADES_MEM_GB is used when the planner fails
+SPADES_PLANNER="${SPADES_PLANNER:-${SCRIPT_DIR}/../group 5/spades_planner.py}"
+SPADES_HISTORY="${SPADES_HISTORY:-${XDG_CACHE_HOME:-$HOME/.cache}/cog_pipeline/spades_history.tsv}"
+SPADES_THREADS="${SPADES_THREADS:-4}"
+SPADES_MEM_GB="${SPADES_MEM_GB:-8}"
+
 MASTER_LOG="${LOGDIR}/pipeline.log"
 exec > >(tee -a "$MASTER_LOG") 2>&1
 
@@ -53,7 +62,7 @@ info "WORKDIR = $WORKDIR"
 info "KOFAM_DIR = $KOFAM_DIR"
 info "PATHWAY_DIR = $PATHWAY_DIR"
 
-TOTAL_STEPS=16
+TOTAL_STEPS=11
 STEP=0
 draw_progress $STEP $TOTAL_STEPS
 
@@ -112,7 +121,17 @@ STEP=$((STEP+1)); info "STEP $STEP/$TOTAL_STEPS: SPAdes"
 mkdir -p "${OUTDIR}_spades"
 CONTIGS="${OUTDIR}_spades/contigs.fasta"
 if run_env spades.py --version >/dev/null 2>&1; then
-  run_env spades.py -1 "${R1_CLEAN}" -2 "${R2_CLEAN}" -o "${OUTDIR}_spades" --threads 4 --memory 8 > "${LOGDIR}/spades.log" 2>&1 || warn "spades warnings (see ${LOGDIR}/spades.log)"
+  SPADES_PLAN="${OUTDIR}_spades_plan.json"
+  spades_run=(run_env python "${SPADES_PLANNER}" run --plan "${SPADES_PLAN}" --history "${SPADES_HISTORY}" --sample "${PREFIX}" --)
+  if ! IFS=' ' read -r spades_threads spades_mem _ < <(run_env python "${SPADES_PLANNER}" plan "${R1_CLEAN}" "${R2_CLEAN}" \
+      --fastp-json "${OUTDIR}_fastp/report.json" --history "${SPADES_HISTORY}" \
+      --max-threads "${SPADES_THREADS}" --out "${SPADES_PLAN}" 2> "${LOGDIR}/spades_plan.log"); then
+    # Run SPAdes directly: "run" needs numpy just like "plan"
+    warn "SPAdes planner failed (see ${LOGDIR}/spades_plan.log) - using --threads ${SPADES_THREADS} --memory ${SPADES_MEM_GB}"
+    spades_threads="${SPADES_THREADS}"; spades_mem="${SPADES_MEM_GB}"; spades_run=(run_env)
+  fi
+  info "SPAdes: ${spades_threads} threads, ${spades_mem} GB"
+  "${spades_run[@]}" spades.py -1 "${R1_CLEAN}" -2 "${R2_CLEAN}" -o "${OUTDIR}_spades" --threads "${spades_threads}" --memory "${spades_mem}" > "${LOGDIR}/spades.log" 2>&1 || warn "spades warnings (see ${LOGDIR}/spades.log)"
 else
   warn "spades missing - skipping assembly"
 fi
@@ -206,72 +225,26 @@ else
 fi
 draw_progress $STEP $TOTAL_STEPS
 
-# ---------- Extract unique KO list ----------
-STEP=$((STEP+1)); info "STEP $STEP/$TOTAL_STEPS: Extract KO ids"
+# ---------- KO -> pathway join ----------
+# One pass over the filtered KOfam table writes the KO list, KO -> pathway
+# table, clean KO table, master table and pathway counts (kegg_join.py)
+STEP=$((STEP+1)); info "STEP $STEP/$TOTAL_STEPS: Join KOs with KEGG pathways"
 KO_LIST="${OUTDIR}_kofam/${PREFIX}_KO_list.txt"
-if [[ -f "${KOFAM_FILTER}" && -s "${KOFAM_FILTER}" ]]; then
-  cut -f3 "${KOFAM_FILTER}" | sort -u > "${KO_LIST}" || true
-  info "KO list -> ${KO_LIST}"
-else
-  warn "KOfam filtered file missing/empty; KO list not created"
-fi
-draw_progress $STEP $TOTAL_STEPS
-
-# ---------- KO -> pathway mapping ----------
-STEP=$((STEP+1)); info "STEP $STEP/$TOTAL_STEPS: KO -> pathway mapping"
-KO_PATH_FILTERED="${OUTDIR}_kofam/${PREFIX}_ko_pathway_filtered.tab"
-KO_PATH_CLEAN="${OUTDIR}_kofam/${PREFIX}_ko_pathway_clean.tsv"
-if [[ -f "${KO_LIST}" && -f "${PATHWAY_DIR%/}/ko_to_pathway.tab" ]]; then
-  grep -Ff "${KO_LIST}" "${PATHWAY_DIR%/}/ko_to_pathway.tab" > "${KO_PATH_FILTERED}" || true
-  grep 'map' "${KO_PATH_FILTERED}" > "${KO_PATH_FILTERED}.map" || true
-  sed 's/ko://; s/path://;' "${KO_PATH_FILTERED}.map" > "${KO_PATH_CLEAN}" || true
-  info "KO->path mapping clean -> ${KO_PATH_CLEAN}"
-else
-  warn "KO list or ko_to_pathway.tab missing - cannot map"
-fi
-draw_progress $STEP $TOTAL_STEPS
-
-# ---------- Add pathway titles ----------
-STEP=$((STEP+1)); info "STEP $STEP/$TOTAL_STEPS: Add pathway titles"
-KO_PATH_FINAL="${OUTDIR}_kofam/${PREFIX}_ko_pathway_final.tsv"
-if [[ -f "${KO_PATH_CLEAN}" && -f "${PATHWAY_DIR%/}/pathway_titles.tab" ]]; then
-  awk -F'\t' 'NR==FNR{title[$1]=$2;next}{print $1"\t"$2"\t"title[$2]}' "${PATHWAY_DIR%/}/pathway_titles.tab" "${KO_PATH_CLEAN}" > "${KO_PATH_FINAL}" || true
-  info "KO pathway final -> ${KO_PATH_FINAL}"
-else
-  warn "KO_path_clean or pathway_titles.tab missing - skipping"
-fi
-draw_progress $STEP $TOTAL_STEPS
-
-# ---------- Clean KOfam/Kegg table ----------
-STEP=$((STEP+1)); info "STEP $STEP/$TOTAL_STEPS: Clean KOfam/Kegg table"
-KOFAM_CLEAN_FINAL="${OUTDIR}_kofam/${PREFIX}_kegg_clean_final.tsv"
-if [[ -f "${KOFAM_FILTER}" ]]; then
-  awk -F'\t' '{ gsub(/"/,"",$7); print $2"\t"$3"\t"$7 }' "${KOFAM_FILTER}" > "${KOFAM_CLEAN_FINAL}" || true
-  info "Kegg clean final -> ${KOFAM_CLEAN_FINAL}"
-else
-  warn "Filtered KOfam missing; skipping"
-fi
-draw_progress $STEP $TOTAL_STEPS
-
-# ---------- Join KO with pathway into master ----------
-STEP=$((STEP+1)); info "STEP $STEP/$TOTAL_STEPS: Join KO with pathways"
 MASTER_Kegg_Path="${OUTDIR}_kofam/${PREFIX}_kegg_pathways.tsv"
-if [[ -f "${KO_PATH_FINAL}" && -f "${KOFAM_CLEAN_FINAL}" ]]; then
-  awk -F'\t' 'BEGIN{OFS="\t"} NR==FNR{map[$1]=$2"\t"$3; next} {print $0, (map[$2]?map[$2]:"NA\tNA")}' "${KO_PATH_FINAL}" "${KOFAM_CLEAN_FINAL}" > "${MASTER_Kegg_Path}" || true
-  info "Joined master -> ${MASTER_Kegg_Path}"
-else
-  warn "Inputs to join missing; skipping join"
-fi
-draw_progress $STEP $TOTAL_STEPS
-
-# ---------- Generate pathway counts (Step 14) ----------
-STEP=$((STEP+1)); info "STEP $STEP/$TOTAL_STEPS: Generate pathway counts (KEGG-style)"
 PATHWAY_COUNTS="${OUTDIR}_kofam/${PREFIX}_pathway_counts.tsv"
-if [[ -f "${KO_PATH_FINAL}" ]]; then
-  awk -F'\t' '{ count[$2]++; name[$2]=$3 } END { for (p in count) print p "\t" name[p] "\t" count[p] }' "${KO_PATH_FINAL}" | sort > "${PATHWAY_COUNTS}"
-  info "Pathway counts -> ${PATHWAY_COUNTS}"
+if [[ -f "${KOFAM_FILTER}" && -s "${KOFAM_FILTER}" && -f "${PATHWAY_DIR%/}/ko_to_pathway.tab" && -f "${PATHWAY_DIR%/}/pathway_titles.tab" ]]; then
+  if run_env python "${SCRIPT_DIR}/kegg_join.py" \
+      --ko-pathway "${PATHWAY_DIR%/}/ko_to_pathway.tab" \
+      --titles "${PATHWAY_DIR%/}/pathway_titles.tab" \
+      --sample "${PREFIX}" "${KOFAM_FILTER}" "${OUTDIR}_kofam" > "${LOGDIR}/kegg_join.log" 2>&1; then
+    info "KO list -> ${KO_LIST}"
+    info "Joined master -> ${MASTER_Kegg_Path}"
+    info "Pathway counts -> ${PATHWAY_COUNTS}"
+  else
+    warn "KEGG pathway join failed (see ${LOGDIR}/kegg_join.log)"
+  fi
 else
-  warn "KO pathway final missing; cannot produce pathway counts"
+  warn "KOfam filtered file, ko_to_pathway.tab or pathway_titles.tab missing - cannot map"
 fi
 draw_progress $STEP $TOTAL_STEPS
 
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+"""
+KEGG Pathway Join
+
+Maps the high-confidence KOfam assignments of one or more samples to KEGG
+pathways. ko_to_pathway.tab and pathway_titles.tab are compiled once into
+kegg_index.sqlite next to them (rebuilt when either file changes) and opened
+read-only, so a run only reads the index pages of the KOs it looks up. Where
+that directory is not writable the index is built in memory for the run. Each
+sample's filtered KOfam detail TSV is read once and every output table is
+written from that single pass. KOs are matched on the exact ID, so K00001
+never picks up the pathways of K000010.
+
+Per sample, into OUTDIR:
+  PREFIX_KO_list.txt            unique KO IDs
+  PREFIX_ko_pathway_final.tsv   KO, pathway, pathway title
+  PREFIX_kegg_clean_final.tsv   gene, KO, KO definition
+  PREFIX_kegg_pathways.tsv      gene, KO, definition, pathway, title (one row per pathway, NA if none)
+  PREFIX_pathway_counts.tsv     pathway, title, number of KOs
+
+Usage: python3 kegg_join.py --ko-pathway ko_to_pathway.tab --titles pathway_titles.tab [--index FILE]
+                            --sample PREFIX KEGG_FILTERED.tsv OUTDIR [--sample ...]
+"""
+
+import os
+import sys
+import fcntl
+import sqlite3
+import argparse
+
+INDEX_SCHEMA_VERSION = 1
+
+def strip_prefix(value):
+    """Drop KEGG's "ko:" / "path:" database prefix."""
+    return value.split(':', 1)[1] if ':' in value else value
+
+def iter_ko_pathways(path):
+    """(KO, map pathway ID) pairs from KEGG's link/pathway/ko table, in file order."""
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 2:
+                continue
+            pathway = strip_prefix(fields[1])
+            # Only the reference maps; the same pathways are listed again as koNNNNN
+            if pathway.startswith('map'):
+                yield strip_prefix(fields[0]), pathway
+
+def iter_titles(path):
+    """(pathway ID, title) pairs from KEGG's list/pathway table."""
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 2:
+                yield strip_prefix(fields[0]), fields[1]
+
+def source_stamp(*paths):
+    """Schema version plus size and mtime of every source table."""
+    parts = [str(INDEX_SCHEMA_VERSION)]
+    for path in paths:
+        st = os.stat(path)
+        parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+    return ' '.join(parts)
+
+def populate_index(conn, ko_pathway_path, titles_path):
+    """Create the index tables on conn and fill them from both KEGG tables."""
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE ko_pathway (ko TEXT, pos INTEGER, pathway TEXT)")
+    conn.execute("CREATE TABLE titles (pathway TEXT PRIMARY KEY, title TEXT) WITHOUT ROWID")
+    conn.executemany("INSERT INTO ko_pathway VALUES (?, ?, ?)",
+                     ((ko, pos, pathway) for pos, (ko, pathway) in enumerate(iter_ko_pathways(ko_pathway_path))))
+    conn.executemany("INSERT OR REPLACE INTO titles VALUES (?, ?)", iter_titles(titles_path))
+    # Covering index: a KO's pathways, in file order, without touching the table
+    conn.execute("CREATE INDEX ko_pathway_by_ko ON ko_pathway (ko, pos, pathway)")
+    conn.execute("INSERT INTO meta VALUES ('source', ?)", (source_stamp(ko_pathway_path, titles_path),))
+    conn.commit()
+
+def build_index(index_path, ko_pathway_path, titles_path):
+    """Compile both KEGG tables into index_path (written under a temporary name)."""
+    tmp = f"{index_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        populate_index(conn, ko_pathway_path, titles_path)
+    finally:
+        conn.close()
+    os.replace(tmp, index_path)
+
+class KeggIndex:
+    """Read-only KO -> pathway and pathway -> title lookups on the compiled index."""
+
+    def __init__(self, index_path, ko_pathway_path, titles_path):
+        self.index_path = index_path
+        self.stamp = source_stamp(ko_pathway_path, titles_path)
+        self.conn = self._open_checked()
+        if self.conn is None:
+            try:
+                with open(f"{index_path}.lock", 'a') as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    # Another sample's run may have built it while we waited
+                    self.conn = self._open_checked()
+                    if self.conn is None:
+                        build_index(index_path, ko_pathway_path, titles_path)
+                        self.conn = self._open_checked()
+            except (OSError, sqlite3.Error) as e:
+                # The KEGG directory may be read-only or shared: index in memory for this run
+                print(f"Warning: cannot write {index_path} ({e}); indexing in memory", file=sys.stderr)
+                self.conn = sqlite3.connect(':memory:')
+                populate_index(self.conn, ko_pathway_path, titles_path)
+        if self.conn is None:
+            raise OSError(f"could not build {index_path}")
+        self._pathways = {}
+        self._titles = {}
+
+    def _open_checked(self):
+        """The index opened read-only, or None if it is missing or out of date."""
+        try:
+            conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True)
+        except sqlite3.Error:
+            return None
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+            if row and row[0] == self.stamp:
+                return conn
+        except sqlite3.Error:
+            pass
+        conn.close()
+        return None
+
+    def pathways(self, ko):
+        """The KO's map pathway IDs, in ko_to_pathway.tab order."""
+        if ko not in self._pathways:
+            self._pathways[ko] = [row[0] for row in self.conn.execute(
+                "SELECT pathway FROM ko_pathway WHERE ko = ? ORDER BY pos", (ko,))]
+        return self._pathways[ko]
+
+    def title(self, pathway):
+        if pathway not in self._titles:
+            row = self.conn.execute("SELECT title FROM titles WHERE pathway = ?", (pathway,)).fetchone()
+            self._titles[pathway] = row[0] if row else ''
+        return self._titles[pathway]
+
+def join_sample(prefix, kofam_path, outdir, index):
+    """Write all KEGG tables of one sample; returns (genes, KOs, pathways)."""
+    paths = {name: os.path.join(outdir, f"{prefix}_{name}") for name in
+             ('KO_list.txt', 'ko_pathway_final.tsv', 'kegg_clean_final.tsv',
+              'kegg_pathways.tsv', 'pathway_counts.tsv')}
+    kos = set()
+    genes = 0
+
+    with open(kofam_path) as f, \
+         open(paths['kegg_clean_final.tsv'], 'w') as clean, \
+         open(paths['kegg_pathways.tsv'], 'w') as master:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            # detail-tsv: significance, gene, KO, threshold, score, E-value, definition
+            if len(fields) < 7 or fields[0] != '*':
+                continue
+            gene, ko = fields[1], fields[2]
+            definition = fields[6].replace('"', '')
+            genes += 1
+            kos.add(ko)
+            clean.write(f"{gene}\t{ko}\t{definition}\n")
+            for pathway in index.pathways(ko) or ('NA',):
+                title = index.title(pathway) if pathway != 'NA' else 'NA'
+                master.write(f"{gene}\t{ko}\t{definition}\t{pathway}\t{title}\n")
+
+    counts = {}
+    with open(paths['KO_list.txt'], 'w') as ko_list, \
+         open(paths['ko_pathway_final.tsv'], 'w') as final:
+        for ko in sorted(kos):
+            ko_list.write(f"{ko}\n")
+            for pathway in index.pathways(ko):
+                final.write(f"{ko}\t{pathway}\t{index.title(pathway)}\n")
+                counts[pathway] = counts.get(pathway, 0) + 1
+
+    with open(paths['pathway_counts.tsv'], 'w') as out:
+        for pathway in sorted(counts):
+            out.write(f"{pathway}\t{index.title(pathway)}\t{counts[pathway]}\n")
+
+    return genes, len(kos), len(counts)
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Map KOfam KO assignments to KEGG pathways.")
+    parser.add_argument('--ko-pathway', required=True, help="ko_to_pathway.tab (rest.kegg.jp/link/pathway/ko)")
+    parser.add_argument('--titles', required=True, help="pathway_titles.tab (rest.kegg.jp/list/pathway)")
+    parser.add_argument('--index', default=None,
+                        help="compiled index (default: kegg_index.sqlite next to ko_to_pathway.tab)")
+    parser.add_argument('--sample', nargs=3, action='append', required=True,
+                        metavar=('PREFIX', 'KEGG_FILTERED', 'OUTDIR'))
+    args = parser.parse_args()
+
+    try:
+        index_path = args.index or os.path.join(os.path.dirname(os.path.abspath(args.ko_pathway)), "kegg_index.sqlite")
+        index = KeggIndex(index_path, args.ko_pathway, args.titles)
+        for prefix, kofam_path, outdir in args.sample:
+            genes, kos, pathways = join_sample(prefix, kofam_path, outdir, index)
+            print(f"{prefix}: {genes} genes, {kos} KOs, {pathways} pathways")
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error: KEGG pathway join failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
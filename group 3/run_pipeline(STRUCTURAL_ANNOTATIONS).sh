@@ -11,6 +11,9 @@ OUTPUT_DIR="/mnt/d/cogfinal"
 THREADS=4
 MEMORY=8
 PROTEINS="/mnt/d/cog1/prodigal/prodigal.proteins.faa"
+# fastp's report has the FastQC metrics of the raw and the trimmed reads from
+# its single pass (MultiQC reads it); set RUN_FASTQC=1 for a FastQC pass as well
+RUN_FASTQC="${RUN_FASTQC:-0}"
 
 echo "🚀 Pipeline started at $(date)"
 echo "Input folder: $MAIN_DIR"
@@ -40,14 +43,16 @@ for R1 in "$MAIN_DIR"/*_R1_001.fastq.gz; do
     done
 
     # 1️⃣ FASTQC
-    echo "Running FastQC..."
-    fastqc -o "$OUTDIR/fastqc" "$R1" "$R2"
+    if [[ "$RUN_FASTQC" == "1" ]]; then
+        echo "Running FastQC..."
+        fastqc -o "$OUTDIR/fastqc" "$R1" "$R2"
+    fi
 
-    # 2️⃣ FASTP
+    # 2️⃣ FASTP (trimmed reads stay gzipped; SPAdes reads them as they are)
     echo "Running fastp..."
     fastp -i "$R1" -I "$R2" \
-          -o "$OUTDIR/fastp/clean_R1.fastq" \
-          -O "$OUTDIR/fastp/clean_R2.fastq" \
+          -o "$OUTDIR/fastp/clean_R1.fastq.gz" \
+          -O "$OUTDIR/fastp/clean_R2.fastq.gz" \
           -h "$OUTDIR/fastp/fastp.html" \
           -j "$OUTDIR/fastp/fastp.json"
 
@@ -57,8 +62,8 @@ for R1 in "$MAIN_DIR"/*_R1_001.fastq.gz; do
 
     # 4️⃣ SPADES
     echo "Running SPAdes assembly..."
-    spades.py -1 "$OUTDIR/fastp/clean_R1.fastq" \
-              -2 "$OUTDIR/fastp/clean_R2.fastq" \
+    spades.py -1 "$OUTDIR/fastp/clean_R1.fastq.gz" \
+              -2 "$OUTDIR/fastp/clean_R2.fastq.gz" \
               -o "$OUTDIR/spades" \
               --threads $THREADS \
               --memory $MEMORY
@@ -7,96 +7,312 @@ read acc_file
 echo "Enter the main output folder path:"
 read main_outdir
 
+# Tools (override to use other installs, or stand-ins for testing)
+FASTERQ_DUMP="${FASTERQ_DUMP:-/home/tmp_data/ngs/sra/bin/fasterq-dump}"
+FASTP="${FASTP:-/home/tmp_data/ngs/fastp}"
+FASTQC="${FASTQC:-/home/tmp_data/ngs/FastQC/fastqc}"
+SPADES="${SPADES:-/home/tmp_data/ngs/SPAdes-4.2.0-Linux/bin/spades.py}"
+QUAST="${QUAST:-/home/tmp_data/ngs/quast/quast.py}"
+PROKKA="${PROKKA:-prokka}"
+DIAMOND="${DIAMOND:-/home/tmp_data/ngs/diamond}"
+DIAMOND_DB="${DIAMOND_DB:-/home/tmp_data/group4/uniprot_sprot}"
+
+# Accessions flow through four stages - fetch (fasterq-dump | fastp),
+# assemble (SPAdes + QUAST), annotate (Prokka) and DIAMOND - each with its
+# own workers, joined by queues of at most QUEUE_SIZE waiting accessions.
+# Downloads of later accessions overlap the assembly of earlier ones, so a
+# long list runs at the pace of the slowest stage; the queue bound keeps
+# the reads waiting for SPAdes from filling the disk.
+FETCH_WORKERS="${FETCH_WORKERS:-2}"
+# Cores shared by the assemblies; one assembly takes at least 2, so this
+# bounds the assemble workers (the SPAdes planner below decides how many run)
+ASSEMBLE_CORES="${ASSEMBLE_CORES:-$(nproc)}"
+ASSEMBLE_WORKERS="${ASSEMBLE_WORKERS:-$(( ASSEMBLE_CORES / 2 > 0 ? ASSEMBLE_CORES / 2 : 1 ))}"
+ANNOTATE_WORKERS="${ANNOTATE_WORKERS:-1}"
+DIAMOND_WORKERS="${DIAMOND_WORKERS:-1}"
+QUEUE_SIZE="${QUEUE_SIZE:-2}"
+# Threads per worker of each stage
+FETCH_THREADS="${FETCH_THREADS:-4}"
+ASSEMBLE_THREADS="${ASSEMBLE_THREADS:-12}"   # most threads one assembly gets
+DIAMOND_THREADS="${DIAMOND_THREADS:-12}"
+
+# SPAdes threads and memory are planned per accession from its clean reads
+# by group 5's spades_planner.py, which also says how many assemblies of
+# that size fit in ASSEMBLE_CORES and ASSEMBLE_MEM_GB at once. An assembly
+# starts only while fewer than that many run and its planned cores and
+# memory are free, so several small genomes share the node and a large one
+# does not get OOM-killed next to them. Without the planner (or numpy),
+# each assembly uses ASSEMBLE_THREADS and SPADES_MEM_GB, one at a time.
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+SPADES_PLANNER="${SPADES_PLANNER:-$SCRIPT_DIR/../group 5/spades_planner.py}"
+SPADES_HISTORY="${SPADES_HISTORY:-${XDG_CACHE_HOME:-$HOME/.cache}/proteomics/spades_history.tsv}"
+SPADES_MEM_GB="${SPADES_MEM_GB:-12}"
+ASSEMBLE_MEM_GB="${ASSEMBLE_MEM_GB:-$(awk '/^MemAvailable:/ {printf "%d", $2 / 1048576}' /proc/meminfo)}"
+
+# DIAMOND is split into shards of SHARD_THREADS cores by group 7's shard_search.py
+SHARD_SEARCH="${SHARD_SEARCH:-$SCRIPT_DIR/../group 7/shard_search.py}"
+SHARD_THREADS="${SHARD_THREADS:-4}"
+
+# fastp's reports already hold the FastQC metrics of the raw and the clean
+# reads; set RUN_FASTQC=1 to also run FastQC on the clean reads
+RUN_FASTQC="${RUN_FASTQC:-0}"
+
+# fasterq-dump streams each spot (both mates, one after the other) straight
+# into fastp, so neither the raw reads nor the clean reads are ever written
+# uncompressed. fastp computes the quality, GC, duplication and adapter
+# metrics of the reads before and after trimming in that same pass.
+# Usage: stream_reads ACC OUTDIR THREADS
+stream_reads() {
+  local acc=$1 outdir=$2 threads=$3
+  "$FASTERQ_DUMP" "$acc" --split-spot --stdout \
+    -t "$outdir/fasterqdump_results" -e "$threads" \
+  | "$FASTP" --stdin --interleaved_in \
+    -o "$outdir/fastp_results/clean_1.fastq.gz" \
+    -O "$outdir/fastp_results/clean_2.fastq.gz" \
+    -h "$outdir/fastp_results/fastp_report.html" \
+    -j "$outdir/fastp_results/fastp_report.json" \
+    --thread "$threads"
+  local status=("${PIPESTATUS[@]}")
+  if [ "${status[0]}" -ne 0 ]; then
+    echo "fasterq-dump failed for $acc"
+    return "${status[0]}"
+  fi
+  if [ "${status[1]}" -ne 0 ]; then
+    echo "fastp failed for $acc"
+    return "${status[1]}"
+  fi
+}
+
 # Create main output directory if it doesn't exist
 mkdir -p "$main_outdir"
 
-# Loop through each accession in the file
-while read acc; do
-  # Skip empty lines
-  [[ -z "$acc" ]] && continue
+# ---------------------------------------------------------------------------
+# Bounded queues between the stages. A queue is a FIFO of accession lines
+# plus a FIFO holding one token per free slot; both are opened read-write
+# here, so they stay open while workers come and go. A push takes a token
+# (and waits while the queue is full), a pop gives it back. Workers of a
+# stage share the item FIFO under a lock, so each line goes to one worker.
+# ---------------------------------------------------------------------------
+QUEUE_DIR=$(mktemp -d "$main_outdir/.queues.XXXXXX")
+QUEUE_END="__end__"
+declare -A QUEUE_ITEMS QUEUE_SLOTS
 
-  echo "==============================================="
-  echo "Starting pipeline for accession: $acc"
-  echo "==============================================="
+# Usage: queue_open NAME CAPACITY
+queue_open() {
+  local name=$1 capacity=$2 fd i
+  mkfifo "$QUEUE_DIR/$name.items" "$QUEUE_DIR/$name.slots"
+  exec {fd}<>"$QUEUE_DIR/$name.items"
+  QUEUE_ITEMS[$name]=$fd
+  exec {fd}<>"$QUEUE_DIR/$name.slots"
+  QUEUE_SLOTS[$name]=$fd
+  for ((i = 0; i < capacity; i++)); do
+    printf x >&"$fd"
+  done
+}
 
-  outdir="$main_outdir/$acc"
-  mkdir -p "$outdir/fasterqdump_results" "$outdir/fastqc_result" \
-           "$outdir/fastp_results" "$outdir/spades_result" \
-           "$outdir/quast_result" "$outdir/prokka_result" "$outdir/diamond_results"
+# Usage: queue_push NAME ACC
+queue_push() {
+  local token
+  read -r -n 1 token <&"${QUEUE_SLOTS[$1]}"
+  printf '%s\n' "$2" >&"${QUEUE_ITEMS[$1]}"
+}
 
-  echo "---------------------------------------------"
-  echo "Running fasterq-dump for accession: $acc"
-  echo "---------------------------------------------"
+# Usage: queue_pop NAME VAR  → 1 once the queue has been closed
+queue_pop() {
+  local line
+  {
+    flock 9
+    IFS= read -r line <&"${QUEUE_ITEMS[$1]}"
+  } 9> "$QUEUE_DIR/$1.lock"
+  [ "$line" = "$QUEUE_END" ] && return 1
+  printf x >&"${QUEUE_SLOTS[$1]}"
+  printf -v "$2" '%s' "$line"
+}
 
-  /home/tmp_data/ngs/sra/bin/fasterq-dump "$acc" -O "$outdir/fasterqdump_results" || { echo "fasterq-dump failed for $acc"; continue; }
+# Usage: queue_close NAME WORKERS  → one end marker per reading worker
+queue_close() {
+  local i
+  for ((i = 0; i < $2; i++)); do
+    printf '%s\n' "$QUEUE_END" >&"${QUEUE_ITEMS[$1]}"
+  done
+}
 
-  echo "---------------------------------------------"
-  echo "Running FastQC..."
-  echo "---------------------------------------------"
+# ---------------------------------------------------------------------------
+# Assemblies running at once, and the cores and memory they hold, in one
+# file guarded by flock: "running cores memory_gb"
+# ---------------------------------------------------------------------------
+echo "0 0 0" > "$QUEUE_DIR/assembly"
 
-  /home/tmp_data/ngs/FastQC/fastqc "$outdir/fasterqdump_results/${acc}_1.fastq" "$outdir/fasterqdump_results/${acc}_2.fastq" -o "$outdir/fastqc_result"
-  echo "---------------------------------------------"
-  echo "Running fastp..."
-  echo "---------------------------------------------"
+# Usage: assembly_acquire THREADS MEMORY_GB CONCURRENCY
+# Waits until fewer than CONCURRENCY assemblies run and THREADS cores and
+# MEMORY_GB are free; with nothing running, any plan is let through
+assembly_acquire() {
+  local threads=$1 mem_gb=$2 concurrency=$3
+  until (
+    flock 9
+    read -r running cores mem < "$QUEUE_DIR/assembly"
+    if [ "$running" -gt 0 ]; then
+      [ "$running" -lt "$concurrency" ] &&
+        [ $(( cores + threads )) -le "$ASSEMBLE_CORES" ] &&
+        [ $(( mem + mem_gb )) -le "$ASSEMBLE_MEM_GB" ] || exit 1
+    fi
+    echo "$(( running + 1 )) $(( cores + threads )) $(( mem + mem_gb ))" > "$QUEUE_DIR/assembly"
+  ) 9>> "$QUEUE_DIR/assembly.lock"; do
+    sleep 5
+  done
+}
 
-  /home/tmp_data/ngs/fastp \
-    -i "$outdir/fasterqdump_results/${acc}_1.fastq" \
-    -I "$outdir/fasterqdump_results/${acc}_2.fastq" \
-    -o "$outdir/fastp_results/clean_1.fastq" \
-    -O "$outdir/fastp_results/clean_2.fastq" \
-    -h "$outdir/fastp_results/fastp_report.html" \
-    -j "$outdir/fastp_results/fastp_report.json" \
-    --thread 12 || { echo "fastp failed for $acc"; continue; }
+# Usage: assembly_release THREADS MEMORY_GB
+assembly_release() {
+  (
+    flock 9
+    read -r running cores mem < "$QUEUE_DIR/assembly"
+    echo "$(( running - 1 )) $(( cores - $1 )) $(( mem - $2 ))" > "$QUEUE_DIR/assembly"
+  ) 9>> "$QUEUE_DIR/assembly.lock"
+}
 
-  /home/tmp_data/ngs/FastQC/fastqc "$outdir/fastp_results/clean_1.fastq" "$outdir/fastp_results/clean_2.fastq" -o "$outdir/fastqc_result"
+# Usage: start_workers STAGE_FUNC WORKERS IN_QUEUE [OUT_QUEUE]  → PIDs in WORKER_PIDS
+# Accessions a stage fails on go to failed_accessions.txt and no further
+start_workers() {
+  local func=$1 workers=$2 in=$3 out=${4:-} i
+  WORKER_PIDS=()
+  for ((i = 0; i < workers; i++)); do
+    (
+      while queue_pop "$in" acc; do
+        if "$func" "$acc"; then
+          if [ -n "$out" ]; then
+            queue_push "$out" "$acc"
+          fi
+        else
+          echo "$acc" >> "$main_outdir/failed_accessions.txt"
+        fi
+      done
+    ) < /dev/null &
+    WORKER_PIDS+=($!)
+  done
+}
 
-  echo "---------------------------------------------"
-  echo "Running SPAdes..."
-  echo "---------------------------------------------"
+# ---------------------------------------------------------------------------
+# Stages; each takes an accession and returns non-zero if it failed
+# ---------------------------------------------------------------------------
+fetch_stage() {
+  local acc=$1 outdir="$main_outdir/$1"
+  mkdir -p "$outdir/fasterqdump_results" "$outdir/fastqc_result" \
+           "$outdir/fastp_results" "$outdir/spades_result" \
+           "$outdir/quast_result" "$outdir/prokka_result" "$outdir/diamond_results" "$outdir/logs"
 
-  /home/tmp_data/ngs/SPAdes-4.2.0-Linux/bin/spades.py \
-    -1 "$outdir/fastp_results/clean_1.fastq" \
-    -2 "$outdir/fastp_results/clean_2.fastq" \
-    -o "$outdir/spades_result" \
-    --threads 12 \
-    --memory 12 \
-    --careful || { echo "SPAdes failed for $acc"; continue; }
+  echo "[$acc] Streaming fasterq-dump into fastp"
+  stream_reads "$acc" "$outdir" "$FETCH_THREADS" 2> "$outdir/logs/fetch.log" || return 1
 
-  echo "---------------------------------------------"
-  echo "Running QUAST..."
-  echo "---------------------------------------------"
+  if [ "$RUN_FASTQC" = "1" ]; then
+    "$FASTQC" "$outdir/fastp_results/clean_1.fastq.gz" "$outdir/fastp_results/clean_2.fastq.gz" \
+      -o "$outdir/fastqc_result" > "$outdir/logs/fastqc.log" 2>&1
+  fi
+}
 
-  /home/tmp_data/ngs/quast/quast.py \
-    "$outdir/spades_result/contigs.fasta" \
-    -o "$outdir/quast_result" \
-    -t 12 || { echo "QUAST failed for $acc"; continue; }
+assemble_stage() {
+  local acc=$1 outdir="$main_outdir/$1"
+  local plan="$outdir/spades_plan.json" threads mem_gb concurrency
+  local record=("python3" "$SPADES_PLANNER" run --plan "$plan" --history "$SPADES_HISTORY" --sample "$acc" --)
+  if ! read -r threads mem_gb concurrency < <(python3 "$SPADES_PLANNER" plan \
+      "$outdir/fastp_results/clean_1.fastq.gz" "$outdir/fastp_results/clean_2.fastq.gz" \
+      --fastp-json "$outdir/fastp_results/fastp_report.json" --history "$SPADES_HISTORY" \
+      --max-threads "$ASSEMBLE_THREADS" --cores "$ASSEMBLE_CORES" --memory-gb "$ASSEMBLE_MEM_GB" \
+      --out "$plan" 2> "$outdir/logs/spades_plan.log"); then
+    echo "[$acc] SPAdes planner failed (see logs/spades_plan.log) - using $ASSEMBLE_THREADS threads, ${SPADES_MEM_GB}GB"
+    threads=$ASSEMBLE_THREADS mem_gb=$SPADES_MEM_GB concurrency=1
+    record=()
+  fi
+
+  assembly_acquire "$threads" "$mem_gb" "$concurrency"
+  echo "[$acc] Running SPAdes ($threads threads, ${mem_gb}GB, up to $concurrency assemblies of this size at once)"
+  local failed="SPAdes"
+  if "${record[@]}" "$SPADES" \
+    -1 "$outdir/fastp_results/clean_1.fastq.gz" \
+    -2 "$outdir/fastp_results/clean_2.fastq.gz" \
+    -o "$outdir/spades_result" \
+    --threads "$threads" \
+    --memory "$mem_gb" \
+    --careful > "$outdir/logs/spades.log" 2>&1; then
+    echo "[$acc] Running QUAST"
+    failed="QUAST"
+    "$QUAST" \
+      "$outdir/spades_result/contigs.fasta" \
+      -o "$outdir/quast_result" \
+      -t "$threads" > "$outdir/logs/quast.log" 2>&1 && failed=""
+  fi
+  assembly_release "$threads" "$mem_gb"
 
-  echo "---------------------------------------------"
-  echo "Running Prokka..."
-  echo "---------------------------------------------"
+  if [ -n "$failed" ]; then
+    echo "$failed failed for $acc"
+    return 1
+  fi
+}
 
-  prokka \
+annotate_stage() {
+  local acc=$1 outdir="$main_outdir/$1"
+  echo "[$acc] Running Prokka"
+  "$PROKKA" \
     "$outdir/spades_result/contigs.fasta" \
     --outdir "$outdir/prokka_result" --force \
-    --prefix prokka_annotated || { echo "Prokka failed for $acc"; continue; }
+    --prefix prokka_annotated > "$outdir/logs/prokka.log" 2>&1 || { echo "Prokka failed for $acc"; return 1; }
+}
 
-  echo "---------------------------------------------"
-  echo "Running DIAMOND BLASTp..."
-  echo "---------------------------------------------"
-
-  /home/tmp_data/ngs/diamond blastp \
-    -d "/home/tmp_data/group4/uniprot_sprot" \
-    -q "$outdir/prokka_result/prokka_annotated.faa" \
-    -o "$outdir/diamond_results/diamond_results.csv" \
+diamond_stage() {
+  local acc=$1 outdir="$main_outdir/$1"
+  echo "[$acc] Running DIAMOND BLASTp"
+  python3 "$SHARD_SEARCH" \
+    --query "$outdir/prokka_result/prokka_annotated.faa" \
+    --out "$outdir/diamond_results/diamond_results.csv" \
+    --cpu "$DIAMOND_THREADS" --shard-cpu "$SHARD_THREADS" \
+    --tmpdir "$outdir/diamond_results" -- \
+    "$DIAMOND" blastp -q {query} -o {out} --threads {threads} \
+    -d "$DIAMOND_DB" \
     --outfmt 6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore stitle \
     --max-target-seqs 1 \
-    --evalue 1e-5 \
-    --threads 12 || { echo "DIAMOND failed for $acc"; continue; }
+    --evalue 1e-5 > "$outdir/logs/diamond.log" 2>&1 || { echo "DIAMOND failed for $acc"; return 1; }
+
+  echo "[$acc] Pipeline completed successfully, results in: $outdir"
+}
+
+# ---------------------------------------------------------------------------
+# Run: all stages start at once and each closes its successor's queue when
+# its last worker is done
+# ---------------------------------------------------------------------------
+rm -f "$main_outdir/failed_accessions.txt"
+queue_open fetch "$QUEUE_SIZE"
+queue_open assemble "$QUEUE_SIZE"
+queue_open annotate "$QUEUE_SIZE"
+queue_open diamond "$QUEUE_SIZE"
 
-  echo "Pipeline completed successfully for: $acc"
-  echo "Results stored in: $outdir"
-  echo "---------------------------------------------"
+start_workers fetch_stage "$FETCH_WORKERS" fetch assemble
+fetch_pids=("${WORKER_PIDS[@]}")
+start_workers assemble_stage "$ASSEMBLE_WORKERS" assemble annotate
+assemble_pids=("${WORKER_PIDS[@]}")
+start_workers annotate_stage "$ANNOTATE_WORKERS" annotate diamond
+annotate_pids=("${WORKER_PIDS[@]}")
+start_workers diamond_stage "$DIAMOND_WORKERS" diamond
+diamond_pids=("${WORKER_PIDS[@]}")
 
+# Feed the accessions; this waits whenever the fetch queue is full
+while read -r acc; do
+  # Skip empty lines
+  [[ -z "$acc" ]] && continue
+  queue_push fetch "$acc"
 done < "$acc_file"
 
-echo "All genomes processed successfully!"
+queue_close fetch "$FETCH_WORKERS"
+wait "${fetch_pids[@]}"
+queue_close assemble "$ASSEMBLE_WORKERS"
+wait "${assemble_pids[@]}"
+queue_close annotate "$ANNOTATE_WORKERS"
+wait "${annotate_pids[@]}"
+queue_close diamond "$DIAMOND_WORKERS"
+wait "${diamond_pids[@]}"
+rm -rf "$QUEUE_DIR"
+
+if [ -s "$main_outdir/failed_accessions.txt" ]; then
+  echo "Finished; $(wc -l < "$main_outdir/failed_accessions.txt") accession(s) failed, see $main_outdir/failed_accessions.txt"
+else
+  echo "All genomes processed successfully!"
+fi
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+"""
+AMR Presence/Absence Matrix
+
+Builds the sample x AMR gene matrix straight from the per-sample AMRFinder
+TSVs. Each file is read once, line by line, and only the gene symbol column
+is kept. Every sample's genes are stored as one bit-packed row (one bit per
+gene, 8 genes per byte). The matrix is saved as a compressed .npz of the
+packed rows plus the sample and gene names, so later steps load it without
+parsing any text.
+
+Hamming distances between samples XOR the packed rows and count the set bits
+(popcount), so clustering 10,000 isolates never creates a dense integer
+matrix.
+
+Usage:
+    python3 amr_matrix.py build [--out amr_presence_absence.npz] [--tsv amr_presence_absence.tsv]
+                                [--glob '*/amr/*_amrfinder.tsv' | SAMPLE=FILE ...]
+"""
+
+import os
+import sys
+import csv
+import glob
+import argparse
+
+import numpy as np
+
+# Gene symbol column of the AMRFinder output, by preference (lower case)
+GENE_COLUMNS = ("gene_symbol", "gene symbol", "element symbol", "gene", "protein_id", "protein_identifier")
+DEFAULT_GLOB = os.path.join("*", "amr", "*_amrfinder.tsv")
+
+# Set bits in every byte value, for numpy versions without bitwise_count
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def popcount_rows(packed):
+    """Number of set bits in each row of a packed uint8 array."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(packed).sum(axis=1, dtype=np.int64)
+    return POPCOUNT[packed].sum(axis=1, dtype=np.int64)
+
+def gene_column(header):
+    """Index of the gene symbol column in an AMRFinder header (first column if none matches)."""
+    lower = [c.strip().lower() for c in header]
+    return next((lower.index(c) for c in GENE_COLUMNS if c in lower), 0)
+
+def iter_genes(amr_path):
+    """Gene symbols of one AMRFinder TSV, streamed."""
+    with open(amr_path, newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = next(reader, None)
+        if not header:
+            return
+        col = gene_column(header)
+        for row in reader:
+            if len(row) > col and row[col] and not row[0].startswith('#'):
+                yield row[col]
+
+def sample_files(pattern=DEFAULT_GLOB):
+    """(sample, file) for every AMRFinder TSV; the sample is the top-level directory."""
+    return [(path.split(os.sep)[0], path) for path in sorted(glob.glob(pattern))]
+
+class PresenceMatrix:
+    """Bit-packed sample x gene presence/absence matrix."""
+
+    def __init__(self, samples, genes, packed, source=''):
+        self.samples = list(samples)
+        self.genes = list(genes)
+        self.packed = packed
+        # What the matrix was built from, for caches that must notice a new input
+        self.source = source
+
+    @classmethod
+    def from_amrfinder(cls, files):
+        """Build from (sample, AMRFinder TSV) pairs; samples and genes come out sorted."""
+        def sample_genes():
+            for sample, path in files:
+                try:
+                    yield sample, list(iter_genes(path))
+                except (OSError, csv.Error, UnicodeDecodeError) as e:
+                    print(f"Warning: skipping {path}: {e}", file=sys.stderr)
+                    yield sample, []
+        return cls.from_sample_genes(sample_genes())
+
+    @classmethod
+    def from_sample_genes(cls, sample_genes, source=''):
+        """Build from (sample, genes) pairs; samples and genes come out sorted."""
+        gene_ids = {}
+        rows = {}
+        for sample, genes in sample_genes:
+            hits = rows.setdefault(sample, set())
+            for gene in genes:
+                gene_id = gene_ids.get(gene)
+                if gene_id is None:
+                    gene_id = gene_ids[gene] = len(gene_ids)
+                hits.add(gene_id)
+
+        genes = sorted(gene_ids)
+        # Interned IDs were given in first-seen order; map them to sorted columns
+        column = np.empty(len(genes), dtype=np.int64)
+        for position, gene in enumerate(genes):
+            column[gene_ids[gene]] = position
+
+        samples = sorted(rows)
+        packed = np.zeros((len(samples), (len(genes) + 7) // 8), dtype=np.uint8)
+        for i, sample in enumerate(samples):
+            if rows[sample]:
+                cols = column[np.fromiter(rows[sample], dtype=np.int64)]
+                np.bitwise_or.at(packed[i], cols >> 3, (0x80 >> (cols & 7)).astype(np.uint8))
+        return cls(samples, genes, packed, source)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            source = str(data['source']) if 'source' in data else ''
+            return cls(data['samples'].tolist(), data['genes'].tolist(), data['packed'], source)
+
+    def save(self, path):
+        """Write the .npz through a temporary name so readers never see half a file."""
+        tmp = f"{path}.tmp.npz"
+        np.savez_compressed(tmp, samples=np.array(self.samples, dtype=str),
+                            genes=np.array(self.genes, dtype=str), packed=self.packed,
+                            source=np.array(self.source))
+        os.replace(tmp, path)
+
+    @property
+    def shape(self):
+        return len(self.samples), len(self.genes)
+
+    def column_counts(self):
+        """Number of samples carrying each gene."""
+        counts = np.zeros(len(self.genes), dtype=np.int64)
+        # One block of samples at a time keeps the unpacked copy small
+        for start in range(0, len(self.samples), 4096):
+            block = np.unpackbits(self.packed[start:start + 4096], axis=1, count=len(self.genes))
+            counts += block.sum(axis=0, dtype=np.int64)
+        return counts
+
+    def partition(self, core=0.99, soft_core=0.95, shell=0.15):
+        """Gene columns by the fraction of samples carrying them (Panaroo/Roary categories)."""
+        fraction = self.column_counts() / max(1, len(self.samples))
+        return {
+            'core': np.flatnonzero(fraction >= core),
+            'soft_core': np.flatnonzero((fraction >= soft_core) & (fraction < core)),
+            'shell': np.flatnonzero((fraction >= shell) & (fraction < soft_core)),
+            'cloud': np.flatnonzero((fraction > 0) & (fraction < shell)),
+        }
+
+    def dense(self, columns=None):
+        """0/1 uint8 array of the given gene columns (all by default)."""
+        bits = np.unpackbits(self.packed, axis=1, count=len(self.genes))
+        return bits if columns is None else bits[:, columns]
+
+    def hamming(self):
+        """Condensed pairwise Hamming distances (fraction of genes that differ), as scipy's pdist."""
+        n = len(self.samples)
+        n_genes = max(1, len(self.genes))
+        distances = np.empty(n * (n - 1) // 2, dtype=np.float64)
+        offset = 0
+        for i in range(n - 1):
+            diff = popcount_rows(np.bitwise_xor(self.packed[i + 1:], self.packed[i]))
+            distances[offset:offset + len(diff)] = diff / n_genes
+            offset += len(diff)
+        return distances
+
+    def write_tsv(self, path):
+        """The matrix as a sample x gene 0/1 table, one row at a time."""
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as out:
+            out.write('\t'.join(['sample'] + self.genes) + '\n')
+            for sample, row in zip(self.samples, self.packed):
+                bits = np.unpackbits(row, count=len(self.genes))
+                out.write(sample + '\t' + '\t'.join('1' if b else '0' for b in bits) + '\n')
+        os.replace(tmp, path)
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Build the AMR presence/absence matrix.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help="build the matrix from AMRFinder TSVs")
+    p.add_argument('--out', default="amr_presence_absence.npz", help="bit-packed matrix")
+    p.add_argument('--tsv', default=None, help="also write the matrix as a 0/1 TSV")
+    p.add_argument('--glob', default=DEFAULT_GLOB, help=f"AMRFinder TSVs to read (default {DEFAULT_GLOB})")
+    p.add_argument('files', nargs='*', metavar='SAMPLE=FILE', help="explicit inputs instead of --glob")
+    args = parser.parse_args()
+
+    files = [tuple(f.split('=', 1)) for f in args.files] if args.files else sample_files(args.glob)
+    if not files:
+        print("Error: no AMRFinder files found", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        matrix = PresenceMatrix.from_amrfinder(files)
+        matrix.save(args.out)
+        if args.tsv:
+            matrix.write_tsv(args.tsv)
+    except OSError as e:
+        print(f"Error: AMR matrix failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"{args.out}: {matrix.shape[0]} samples x {matrix.shape[1]} genes")
+
+if __name__ == "__main__":
+    main()
@@ -7,10 +7,14 @@ IFS=$'\n\t'
 # ---------- CONFIG ----------
 ENV_NAME="amr_pangenome_env"
 THREADS=4
-MEM_GB=12
+MEM_GB=12         # SPAdes --memory if spades_planner.py cannot plan a sample
 MIN_MEM_GB=8      # require at least 8 GB to run assemblies
 MIN_DISK_GB=15    # require at least 15 GB free in OUT_DIR filesystem
 MAX_AMR_HEATMAP_GENES=500
+MAX_TREE_LEAVES=200   # dendrogram figures collapse larger trees to this many clades
+# Past SPAdes runs (read-set size, peak RSS, wall time); spades_planner.py
+# fits its memory/runtime models to these, so keep it across projects
+SPADES_HISTORY="${SPADES_HISTORY:-${XDG_CACHE_HOME:-$HOME/.cache}/amr_pangenome/spades_history.tsv}"
 
 WGET_RETRIES=5
 WGET_TIMEOUT=30
@@ -36,6 +40,11 @@ while [[ $# -gt 0 ]]; do
   esac
 done
 
+# Helper modules (amr_matrix.py, amr_store.py, cluster_tree.py, panaroo_matrix.py,
+# spades_planner.py) live next to this script
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+export PYTHONPATH="$SCRIPT_DIR${PYTHONPATH:+:$PYTHONPATH}"
+
 mkdir -p "$OUT_DIR"
 LOGDIR="$OUT_DIR/logs"; mkdir -p "$LOGDIR"
 cd "$OUT_DIR"   # <<--- CRITICAL FIX: run all output creation inside OUT_DIR
@@ -203,6 +212,8 @@ find_r2_for_r1(){
 # ---------- PROCESS SAMPLES ----------
 PROKKA_GFFS=()
 SAMPLE_LIST=()
+# Every sample's AMRFinder rows go into this store as soon as its run finishes
+AMR_STORE="$OUT_DIR/amr_results.sqlite"
 
 for r1 in "${R1_GLOBS[@]}"; do
   sample="$(derive_sample_name "$r1")"
@@ -241,14 +252,22 @@ for r1 in "${R1_GLOBS[@]}"; do
     continue
   fi
 
-  # quick memory check before assembly
-  if (( mem_gb < MIN_MEM_GB )); then
-    warn "Low memory (${mem_gb}GB) — SPAdes may fail or swap."
+  # SPAdes threads/memory from this sample's read set and past runs; the
+  # planner reads MemAvailable now and warns if the estimate does not fit
+  SPADES_PLAN="$SAMPLE_DIR/spades_plan.json"
+  SPADES_RECORD=(python3 "$SCRIPT_DIR/spades_planner.py" run --plan "$SPADES_PLAN" --history "$SPADES_HISTORY" --sample "$sample" --)
+  if ! read -r SPADES_THREADS SPADES_MEM _ < <(python3 "$SCRIPT_DIR/spades_planner.py" plan "$R1_TRIM" "$R2_TRIM" \
+      --fastp-json "$SAMPLE_DIR/fastp_report/${sample}_fastp.json" --history "$SPADES_HISTORY" \
+      --max-threads "$THREADS" --out "$SPADES_PLAN"); then
+    # Run SPAdes directly: the planner may have failed for want of numpy, which "run" needs too
+    warn "SPAdes planner failed for $sample - using --threads $THREADS --memory $MEM_GB"
+    SPADES_THREADS="$THREADS"; SPADES_MEM="$MEM_GB"; SPADES_RECORD=()
   fi
 
-  # SPAdes
-  log "SPAdes assembly: $sample"
-  spades.py -1 "$R1_TRIM" -2 "$R2_TRIM" -o "$SAMPLE_DIR/spades_output" --threads "$THREADS" --memory "$MEM_GB" --only-assembler \
+  # SPAdes (with a plan, peak RSS and wall time are added to the history)
+  log "SPAdes assembly: $sample (threads $SPADES_THREADS, memory ${SPADES_MEM}GB)"
+  "${SPADES_RECORD[@]}" \
+    spades.py -1 "$R1_TRIM" -2 "$R2_TRIM" -o "$SAMPLE_DIR/spades_output" --threads "$SPADES_THREADS" --memory "$SPADES_MEM" --only-assembler \
     2> "$LOGDIR/${sample}_spades.log" || warn "SPAdes had warnings/errors for $sample"
 
   CONTIGS="$SAMPLE_DIR/spades_output/contigs.fasta"
@@ -277,6 +296,10 @@ for r1 in "${R1_GLOBS[@]}"; do
   if [[ -s "$PROKKA_FNA" ]]; then
     log "AMRFinder: $sample (this can be slow)"
     amrfinder -n "$PROKKA_FNA" -o "$SAMPLE_DIR/amr/${sample}_amrfinder.tsv" --threads "$THREADS" 2> "$LOGDIR/${sample}_amrfinder.log" || warn "AMRFinder warnings for $sample"
+    if [[ -f "$SAMPLE_DIR/amr/${sample}_amrfinder.tsv" ]]; then
+      python3 "$SCRIPT_DIR/amr_store.py" add "$AMR_STORE" "$sample" "$SAMPLE_DIR/amr/${sample}_amrfinder.tsv" \
+        || warn "Could not add $sample to $AMR_STORE"
+    fi
   else
     warn "Prokka .fna missing for $sample - skipping AMRFinder"
   fi
@@ -290,81 +313,40 @@ log "Samples processed: ${#SAMPLE_LIST[@]}"
 COMBINED_AMR="$OUT_DIR/combined_amr_results.tsv"
 log "Combining AMRFinder outputs into $COMBINED_AMR"
 
-python3 - <<'PY'
-import pandas as pd, glob, os
-files = glob.glob(os.path.join("*", "amr", "*_amrfinder.tsv"))
-rows=[]
-for f in files:
-    try:
-        df = pd.read_csv(f, sep="\t", comment="#", dtype=str)
-    except Exception:
-        continue
-    sample = f.split(os.sep)[0]
-    df.insert(0, "sample", sample)
-    rows.append(df)
-if rows:
-    out = pd.concat(rows, ignore_index=True, sort=False)
-    out.to_csv("combined_amr_results.tsv", sep="\t", index=False)
-    print("created combined_amr_results.tsv")
-else:
-    print("no amr files found")
-PY
-
-if [[ -f combined_amr_results.tsv ]]; then mv combined_amr_results.tsv "$COMBINED_AMR"; else warn "combined AMR not created"; fi
+# Pick up AMRFinder results of earlier runs (unchanged samples cost a stat), then
+# write the combined table from the store
+python3 "$SCRIPT_DIR/amr_store.py" sync "$AMR_STORE" || warn "AMR store sync failed"
+python3 "$SCRIPT_DIR/amr_store.py" export "$AMR_STORE" "$COMBINED_AMR" || warn "combined AMR not created"
 
 # ---------- Create AMR presence/absence matrix (explicit OUT_DIR paths) ----------
 AMR_MATRIX="$OUT_DIR/amr_presence_absence.tsv"
 log "Creating AMR presence/absence matrix: $AMR_MATRIX"
-python3 - <<'PY'
-import pandas as pd, os
-if not os.path.exists("combined_amr_results.tsv"):
-    print("combined_amr_results.tsv missing; looking in parent dir")
-    if os.path.exists(os.path.join("..", "combined_amr_results.tsv")):
-        df = pd.read_csv(os.path.join("..", "combined_amr_results.tsv"), sep="\t", dtype=str)
-    else:
-        raise SystemExit("combined_amr_results.tsv not found")
-else:
-    df = pd.read_csv("combined_amr_results.tsv", sep="\t", dtype=str)
-
-# normalize header names (common AMRFinder headers)
-cols_lower = {c.lower(): c for c in df.columns}
-gene_col = None
-for candidate in ("gene_symbol","gene symbol","gene","protein_id","protein_identifier"):
-    if candidate in cols_lower:
-        gene_col = cols_lower[candidate]; break
-if gene_col is None:
-    gene_col = df.columns[1]  # fallback
-
-df['gene_symbol'] = df[gene_col].astype(str)
-mat = df.pivot_table(index="sample", columns="gene_symbol", values=gene_col, aggfunc=lambda x:1, fill_value=0)
-mat.to_csv("amr_presence_absence.tsv", sep="\t")
-print("amr_presence_absence.tsv generated")
-PY
-
-if [[ -f amr_presence_absence.tsv ]]; then mv amr_presence_absence.tsv "$AMR_MATRIX"; fi
+# Bit-packed rows (.npz) from the store's sample/gene table, rebuilt only if a
+# sample changed; the TSV is kept for anything that reads the old table
+AMR_MATRIX_NPZ="$OUT_DIR/amr_presence_absence.npz"
+python3 "$SCRIPT_DIR/amr_store.py" matrix "$AMR_STORE" --out "$AMR_MATRIX_NPZ" --tsv "$AMR_MATRIX" \
+  || warn "AMR presence/absence matrix not created"
 
 # ---------- AMR visualizations + dendrogram (write under OUT_DIR/visualization) ----------
 VIS_DIR="$OUT_DIR/visualization"
 mkdir -p "$VIS_DIR"
 log "Generating AMR visualizations into $VIS_DIR (heatmap, top genes, dendrogram)"
 python3 - <<'PY'
-import pandas as pd, seaborn as sns, matplotlib.pyplot as plt, os
-from scipy.cluster.hierarchy import linkage, dendrogram
+import numpy as np, pandas as pd, seaborn as sns, matplotlib.pyplot as plt, os
+from amr_matrix import PresenceMatrix
 os.makedirs("visualization", exist_ok=True)
-mat_path="amr_presence_absence.tsv"
+mat_path="amr_presence_absence.npz"
 if not os.path.exists(mat_path):
-    raise SystemExit("amr_presence_absence.tsv missing")
-mat = pd.read_csv(mat_path, sep="\t", index_col=0)
-# drop zero-columns
-mat = mat.loc[:, mat.sum(axis=0) > 0]
-# subset genes for heatmap to avoid huge image
+    raise SystemExit("amr_presence_absence.npz missing")
+mat = PresenceMatrix.load(mat_path)
+counts = mat.column_counts()
+# subset genes for heatmap to avoid huge image; only these columns are unpacked
 max_cols = int(os.environ.get("MAX_AMR_HEATMAP_GENES", "500"))
-if mat.shape[1] > max_cols:
-    variances = mat.var(axis=0)
-    topcols = variances.sort_values(ascending=False).head(max_cols).index
-    mat_plot = mat[topcols]
-else:
-    mat_plot = mat
+n = max(1, mat.shape[0])
+variances = counts / n * (1 - counts / n)
+topcols = np.argsort(-variances, kind="stable")[:max_cols]
+topcols = topcols[counts[topcols] > 0]
+mat_plot = pd.DataFrame(mat.dense(topcols), index=mat.samples, columns=[mat.genes[i] for i in topcols])
 
 plt.figure(figsize=(20,10))
 sns.heatmap(mat_plot, cmap="YlGnBu", cbar=True)
@@ -374,7 +356,7 @@ plt.savefig("visualization/amr_heatmap.png", dpi=300)
 plt.close()
 
 # top genes barplot
-top = mat.sum(axis=0).sort_values(ascending=False).head(20)
+top = pd.Series(counts, index=mat.genes).sort_values(ascending=False).head(20)
 plt.figure(figsize=(9,6))
 sns.barplot(x=top.values, y=top.index)
 plt.title("Top 20 AMR genes")
@@ -382,16 +364,6 @@ plt.tight_layout()
 plt.savefig("visualization/top_amr_genes.png", dpi=300)
 plt.close()
 
-# dendrogram (samples)
-if mat.shape[0] >= 2:
-    Z = linkage(mat, method='average', metric='hamming')
-    plt.figure(figsize=(10,6))
-    dendrogram(Z, labels=mat.index, leaf_rotation=90)
-    plt.title("AMR gene-content dendrogram")
-    plt.tight_layout()
-    plt.savefig("visualization/amr_dendrogram.png", dpi=300)
-    plt.close()
-
 # move to OUT_DIR
 for f in os.listdir("visualization"):
     os.replace(os.path.join("visualization", f), os.path.join(os.environ.get("OUT_DIR","."), "visualization", f))
@@ -401,6 +373,13 @@ PY
 # move generated visualization files (created in script) into final $VIS_DIR
 mv visualization/* "$VIS_DIR/" 2>/dev/null || true
 
+# dendrogram (samples): blocked popcount distances and UPGMA, Newick + collapsed figure
+if [[ -f "$AMR_MATRIX_NPZ" ]] && (( ${#SAMPLE_LIST[@]} > 1 )); then
+  python3 "$SCRIPT_DIR/cluster_tree.py" "$AMR_MATRIX_NPZ" --workers "$THREADS" --max-leaves "$MAX_TREE_LEAVES" \
+    --newick "$VIS_DIR/amr_dendrogram.nwk" --figure "$VIS_DIR/amr_dendrogram.png" \
+    --title "AMR gene-content dendrogram" || warn "AMR dendrogram failed"
+fi
+
 # ---------- Panaroo (run once if >1 genome) ----------
 if (( ${#PROKKA_GFFS[@]} > 1 )); then
   log "Running Panaroo with ${#PROKKA_GFFS[@]} genomes (strict mode)"
@@ -410,24 +389,14 @@ if (( ${#PROKKA_GFFS[@]} > 1 )); then
   panaroo -i "${GFF_LIST[@]}" -o "$OUT_DIR/panaroo_output" --clean-mode strict --threads "$THREADS" 2> "$LOGDIR/panaroo.log" || warn "Panaroo had warnings"
   # generate pangenome dendrogram if gene_presence_absence.csv present
   if [[ -f "$OUT_DIR/panaroo_output/gene_presence_absence.csv" ]]; then
-    python3 - <<'PY'
-import pandas as pd
-from scipy.cluster.hierarchy import linkage, dendrogram
-import matplotlib.pyplot as plt
-import os
-df = pd.read_csv("panaroo_output/gene_presence_absence.csv")
-meta = set(['Gene','Non-unique','Annotation','No. isolates','Protein IDs','Gene ID','Gene name'])
-samples = [c for c in df.columns if c not in meta]
-pa = df[samples].notna().astype(int)
-Z = linkage(pa.T, method='average', metric='hamming')
-os.makedirs("panaroo_output/tree", exist_ok=True)
-plt.figure(figsize=(12,6))
-dendrogram(Z, labels=pa.columns, leaf_rotation=90)
-plt.tight_layout()
-plt.savefig("panaroo_output/tree/pangenome_tree.png", dpi=300)
-plt.close()
-print("Saved panaroo_output/tree/pangenome_tree.png")
-PY
+    # Sample columns only, chunked and bit-packed; cached as gene_presence_absence.npz
+    python3 "$SCRIPT_DIR/panaroo_matrix.py" panaroo_output/gene_presence_absence.csv \
+      || warn "Could not load gene_presence_absence.csv"
+    mkdir -p "$OUT_DIR/panaroo_output/tree"
+    python3 "$SCRIPT_DIR/cluster_tree.py" panaroo_output/gene_presence_absence.npz --workers "$THREADS" \
+      --max-leaves "$MAX_TREE_LEAVES" --newick panaroo_output/tree/pangenome_tree.nwk \
+      --figure panaroo_output/tree/pangenome_tree.png && log "Saved panaroo_output/tree/pangenome_tree.png" \
+      || warn "Pangenome tree failed"
   fi
 else
   log "Panaroo skipped: need >1 genome (found ${#PROKKA_GFFS[@]})"
@@ -435,8 +404,8 @@ fi
 
 # ---------- FINAL SUMMARY ----------
 log "Pipeline completed. Summary (some key files):"
-log " - Combined AMR TSV: $COMBINED_AMR"
-log " - AMR presence/absence matrix: $AMR_MATRIX"
+log " - Combined AMR TSV: $COMBINED_AMR (store: $AMR_STORE)"
+log " - AMR presence/absence matrix: $AMR_MATRIX (bit-packed: $AMR_MATRIX_NPZ)"
 log " - AMR visualizations: $VIS_DIR"
 if [[ -d "$OUT_DIR/panaroo_output/tree" ]]; then
   log " - Pangenome tree: $OUT_DIR/panaroo_output/tree/pangenome_tree.png"
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+"""
+AMR Results Store
+
+Collects the AMRFinder results of every sample in one SQLite file
+(amr_results.sqlite). Each sample is a partition of rows that is added as
+soon as its AMRFinder run finishes and replaced in one transaction if the
+run is repeated. A sample whose TSV has the same size and mtime as last time
+is skipped, so adding one isolate to a large project costs one sample's
+rows, not a re-read of every TSV.
+
+Besides the raw rows, the store keeps a (sample, gene) table. The presence
+matrix is built from it without parsing any text. A generation counter goes
+up with every change, so the matrix is only rebuilt when a sample changed.
+
+Usage:
+    python3 amr_store.py add amr_results.sqlite SAMPLE SAMPLE_amrfinder.tsv
+    python3 amr_store.py sync amr_results.sqlite [--glob '*/amr/*_amrfinder.tsv']
+    python3 amr_store.py export amr_results.sqlite combined_amr_results.tsv
+    python3 amr_store.py matrix amr_results.sqlite [--out amr_presence_absence.npz] [--tsv amr_presence_absence.tsv]
+"""
+
+import os
+import sys
+import csv
+import sqlite3
+import argparse
+
+from amr_matrix import DEFAULT_GLOB, PresenceMatrix, gene_column, sample_files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS samples (sample TEXT PRIMARY KEY, source TEXT, header TEXT);
+CREATE TABLE IF NOT EXISTS rows (sample TEXT, line INTEGER, fields TEXT, PRIMARY KEY (sample, line)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS genes (sample TEXT, gene TEXT, PRIMARY KEY (sample, gene)) WITHOUT ROWID;
+INSERT OR IGNORE INTO meta VALUES ('generation', '0');
+"""
+
+def source_stamp(path):
+    st = os.stat(path)
+    return f"{st.st_size} {st.st_mtime_ns}"
+
+class AmrStore:
+    """Per-sample AMRFinder rows in one SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def generation(self):
+        return self.conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def source(self, sample):
+        row = self.conn.execute("SELECT source FROM samples WHERE sample = ?", (sample,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, sample, amr_path):
+        """Load (or replace) one sample's AMRFinder TSV; False if it is already current."""
+        stamp = source_stamp(amr_path)
+        if self.source(sample) == stamp:
+            return False
+        with open(amr_path, newline='') as f:
+            reader = csv.reader(f, delimiter='\t')
+            header = next(reader, None) or []
+            col = gene_column(header) if header else 0
+            rows = [row for row in reader if row and not row[0].startswith('#')]
+        with self.conn:
+            self.conn.execute("DELETE FROM rows WHERE sample = ?", (sample,))
+            self.conn.execute("DELETE FROM genes WHERE sample = ?", (sample,))
+            self.conn.executemany("INSERT INTO rows VALUES (?, ?, ?)",
+                                  ((sample, i, '\t'.join(row)) for i, row in enumerate(rows)))
+            self.conn.executemany("INSERT OR IGNORE INTO genes VALUES (?, ?)",
+                                  ((sample, row[col]) for row in rows if len(row) > col and row[col]))
+            self.conn.execute("INSERT OR REPLACE INTO samples VALUES (?, ?, ?)", (sample, stamp, '\t'.join(header)))
+            self.conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+        return True
+
+    def samples(self):
+        return [row[0] for row in self.conn.execute("SELECT sample FROM samples ORDER BY sample")]
+
+    def sample_genes(self):
+        """(sample, genes) of every sample, zero-hit samples included."""
+        genes = {sample: [] for sample in self.samples()}
+        for sample, gene in self.conn.execute("SELECT sample, gene FROM genes"):
+            genes[sample].append(gene)
+        return genes.items()
+
+    def export_tsv(self, path):
+        """All samples' rows as one table, a "sample" column first and the union of the headers after."""
+        headers = {sample: header.split('\t') if header else []
+                   for sample, header in self.conn.execute("SELECT sample, header FROM samples ORDER BY sample")}
+        columns = list(dict.fromkeys(c for header in headers.values() for c in header))
+        position = {c: i for i, c in enumerate(columns)}
+        tmp = f"{path}.tmp"
+        n_rows = 0
+        with open(tmp, 'w', newline='') as out:
+            writer = csv.writer(out, delimiter='\t', lineterminator='\n')
+            writer.writerow(['sample'] + columns)
+            for sample, header in headers.items():
+                slots = [position[c] for c in header]
+                for (fields,) in self.conn.execute(
+                        "SELECT fields FROM rows WHERE sample = ? ORDER BY line", (sample,)):
+                    row = [''] * len(columns)
+                    for slot, value in zip(slots, fields.split('\t')):
+                        row[slot] = value
+                    writer.writerow([sample] + row)
+                    n_rows += 1
+        os.replace(tmp, path)
+        return n_rows
+
+    def close(self):
+        self.conn.close()
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Per-sample store of AMRFinder results.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('add', help="add or replace one sample's AMRFinder TSV")
+    p.add_argument('store')
+    p.add_argument('sample')
+    p.add_argument('tsv')
+    p = sub.add_parser('sync', help="add every AMRFinder TSV that is new or changed")
+    p.add_argument('store')
+    p.add_argument('--glob', default=DEFAULT_GLOB)
+    p = sub.add_parser('export', help="write the combined table of all samples")
+    p.add_argument('store')
+    p.add_argument('out')
+    p = sub.add_parser('matrix', help="build the bit-packed presence/absence matrix if the store changed")
+    p.add_argument('store')
+    p.add_argument('--out', default="amr_presence_absence.npz")
+    p.add_argument('--tsv', default=None, help="also write the matrix as a 0/1 TSV")
+    args = parser.parse_args()
+
+    try:
+        store = AmrStore(args.store)
+        if args.command == 'add':
+            added = store.add(args.sample, args.tsv)
+            print(f"{args.sample}: {'added' if added else 'already current'}")
+        elif args.command == 'sync':
+            added = sum(store.add(sample, path) for sample, path in sample_files(args.glob))
+            print(f"{args.store}: {added} sample(s) added or updated, {len(store.samples())} in total")
+        elif args.command == 'export':
+            print(f"{args.out}: {store.export_tsv(args.out)} rows")
+        else:
+            generation = f"{os.path.abspath(args.store)} {store.generation()}"
+            try:
+                current = PresenceMatrix.load(args.out).source == generation
+            except (OSError, ValueError, KeyError):
+                current = False
+            if current and (not args.tsv or os.path.exists(args.tsv)):
+                print(f"{args.out}: up to date")
+            else:
+                matrix = PresenceMatrix.from_sample_genes(store.sample_genes(), generation)
+                matrix.save(args.out)
+                if args.tsv:
+                    matrix.write_tsv(args.tsv)
+                print(f"{args.out}: {matrix.shape[0]} samples x {matrix.shape[1]} genes")
+        store.close()
+    except (OSError, csv.Error, sqlite3.Error) as e:
+        print(f"Error: AMR store failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+"""
+Sample Clustering Tree
+
+Clusters the samples of a bit-packed presence/absence matrix (see
+amr_matrix.py) with average linkage (UPGMA) on Hamming distances, as
+scipy's linkage(..., method='average', metric='hamming') does, but without
+building dense matrices in memory:
+
+  * identical profiles are clustered once; their samples join at height 0
+  * distances between the unique profiles are counted with XOR + popcount
+    in row blocks by worker processes, straight into a disk-backed matrix
+  * the tree is built with the nearest-neighbour chain algorithm, one
+    vectorised row update per merge
+
+The tree is written as Newick for tree viewers, and the figure collapses it
+to at most --max-leaves clades (leaf counts in brackets) so it stays readable
+for tens of thousands of isolates.
+
+Usage:
+    python3 cluster_tree.py MATRIX.npz [--newick tree.nwk] [--figure tree.png] [--linkage tree.npy]
+                            [--workers N] [--max-leaves 200] [--title TITLE] [--tmpdir DIR]
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+from amr_matrix import PresenceMatrix, popcount_rows
+
+# Bytes of XOR temporaries a worker may hold for one block of rows
+BLOCK_BYTES = 64 * 1024 * 1024
+
+def unique_profiles(packed):
+    """Unique rows and, for each, the indices of the samples that carry it."""
+    if packed.shape[1] == 0:
+        # No genes at all: every sample has the same (empty) profile
+        return packed[:1], [np.arange(len(packed))] if len(packed) else []
+    # Each row as one opaque value, so np.unique compares whole rows
+    rows = np.ascontiguousarray(packed).view(np.dtype((np.void, packed.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='stable')
+    members = np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+    return packed[first], members
+
+_worker = {}
+
+def _init_worker(packed, n_genes, dist_path):
+    _worker['packed'] = packed
+    _worker['scale'] = 1.0 / max(1, n_genes)
+    n = len(packed)
+    _worker['dist'] = np.memmap(dist_path, dtype=np.float32, mode='r+', shape=(n, n))
+
+def _fill_rows(bounds):
+    """Hamming distances of rows [start, stop) to every profile."""
+    start, stop = bounds
+    packed, dist = _worker['packed'], _worker['dist']
+    for i in range(start, stop):
+        dist[i] = popcount_rows(np.bitwise_xor(packed, packed[i])) * _worker['scale']
+    dist.flush()
+    return stop - start
+
+def distance_matrix(packed, n_genes, dist_path, workers=1):
+    """Square float32 Hamming matrix of the packed rows, computed in blocks into dist_path."""
+    n = len(packed)
+    np.memmap(dist_path, dtype=np.float32, mode='w+', shape=(n, n)).flush()
+    rows_per_block = max(1, BLOCK_BYTES // max(1, n * max(1, packed.shape[1])))
+    blocks = [(i, min(n, i + rows_per_block)) for i in range(0, n, rows_per_block)]
+    if workers > 1 and len(blocks) > 1:
+        with multiprocessing.Pool(workers, _init_worker, (packed, n_genes, dist_path)) as pool:
+            for _ in pool.imap_unordered(_fill_rows, blocks):
+                pass
+    else:
+        _init_worker(packed, n_genes, dist_path)
+        for block in blocks:
+            _fill_rows(block)
+        _worker.clear()
+    return np.memmap(dist_path, dtype=np.float32, mode='r+', shape=(n, n))
+
+def upgma(dist, sizes):
+    """Average-linkage merges of weighted clusters by nearest-neighbour chain.
+
+    dist is a square matrix and is overwritten. Returns (a, b, height) per
+    merge in merge order; slot a holds the merged cluster afterwards.
+    """
+    n = len(sizes)
+    size = np.asarray(sizes, dtype=np.float64).copy()
+    dist[np.arange(n), np.arange(n)] = np.inf
+    merges = []
+    chain = []
+    remaining = n
+    next_free = 0
+    active = np.ones(n, dtype=bool)
+    while remaining > 1:
+        if not chain:
+            while not active[next_free]:
+                next_free += 1
+            chain.append(next_free)
+        while True:
+            a = chain[-1]
+            b = int(np.argmin(dist[a]))
+            # On a tie go back down the chain, otherwise it can cycle
+            if len(chain) > 1 and dist[a, chain[-2]] <= dist[a, b]:
+                b = chain[-2]
+            if len(chain) > 1 and b == chain[-2]:
+                break
+            chain.append(b)
+        a, b = chain.pop(), chain.pop()
+        if b < a:
+            a, b = b, a
+        merges.append((a, b, float(dist[a, b])))
+        row = (size[a] * dist[a].astype(np.float64) + size[b] * dist[b]) / (size[a] + size[b])
+        dist[b, :] = np.inf
+        dist[:, b] = np.inf
+        dist[a, :] = row
+        dist[:, a] = row
+        dist[a, a] = np.inf
+        size[a] += size[b]
+        active[b] = False
+        remaining -= 1
+    return merges
+
+def cluster(matrix, workers=1, tmpdir=None):
+    """scipy-style linkage matrix (average, Hamming) of the matrix's samples."""
+    n = len(matrix.samples)
+    profiles, members = unique_profiles(matrix.packed)
+    merges = []
+    node = []
+    counts = []
+    next_id = n
+    # Samples with the same profile are at distance 0: join them first
+    for group in members:
+        current = int(group[0])
+        for sample in group[1:]:
+            merges.append((current, int(sample), 0.0, 0))
+            current = next_id
+            next_id += 1
+        node.append(current)
+        counts.append(len(group))
+
+    if len(profiles) > 1:
+        workdir = tempfile.mkdtemp(prefix="cluster_tree.", dir=tmpdir)
+        dist_path = os.path.join(workdir, "distances.f32")
+        try:
+            dist = distance_matrix(profiles, len(matrix.genes), dist_path, workers)
+            for a, b, height in upgma(dist, counts):
+                merges.append((node[a], node[b], height, 0))
+                node[a] = next_id
+                next_id += 1
+            del dist
+        finally:
+            os.remove(dist_path)
+            os.rmdir(workdir)
+
+    # scipy wants merges sorted by height, with cluster IDs numbered in that order
+    order = sorted(range(len(merges)), key=lambda k: merges[k][2])
+    new_id = {n + k: n + position for position, k in enumerate(order)}
+    Z = np.zeros((len(merges), 4), dtype=np.float64)
+    leaves = np.ones(n + len(merges), dtype=np.int64)
+    for position, k in enumerate(order):
+        a, b, height, _ = merges[k]
+        a, b = new_id.get(a, a), new_id.get(b, b)
+        leaves[n + position] = leaves[a] + leaves[b]
+        Z[position] = (min(a, b), max(a, b), height, leaves[n + position])
+    return Z
+
+def newick_label(label):
+    """Quote a label that contains Newick punctuation or whitespace."""
+    if any(c in label for c in " \t()[]':;,"):
+        return "'" + label.replace("'", "''") + "'"
+    return label
+
+def to_newick(Z, labels):
+    """Newick string of a linkage matrix; node heights are half the merge distance."""
+    n = len(labels)
+    if n == 1:
+        return newick_label(labels[0]) + ';'
+
+    def height(node):
+        return 0.0 if node < n else Z[node - n, 2] / 2
+
+    out = []
+    # Iterative, as a caterpillar tree of 20,000 leaves is far deeper than the recursion limit
+    stack = [(2 * n - 2, None)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            out.append(item)
+            continue
+        node, length = item
+        suffix = '' if length is None else f":{length:.6g}"
+        if node < n:
+            out.append(newick_label(labels[node]) + suffix)
+            continue
+        a, b = int(Z[node - n, 0]), int(Z[node - n, 1])
+        top = height(node)
+        out.append('(')
+        stack.append(')' + suffix)
+        stack.append((b, top - height(b)))
+        stack.append(',')
+        stack.append((a, top - height(a)))
+    return ''.join(out) + ';'
+
+def plot_tree(Z, labels, path, max_leaves=200, title=None):
+    """Dendrogram collapsed to at most max_leaves clades."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from scipy.cluster.hierarchy import dendrogram
+
+    n = len(labels)
+    shown = min(n, max_leaves)
+    plt.figure(figsize=(min(60, max(10, shown * 0.12)), 6))
+    if n > max_leaves:
+        dendrogram(Z, labels=labels, truncate_mode='lastp', p=max_leaves,
+                   show_leaf_counts=True, leaf_rotation=90)
+        title = f"{title or 'Dendrogram'} ({n} samples, collapsed to {max_leaves} clades)"
+    else:
+        dendrogram(Z, labels=labels, leaf_rotation=90)
+    if title:
+        plt.title(title)
+    plt.tight_layout()
+    plt.savefig(path, dpi=300 if shown <= 100 else 150)
+    plt.close()
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Average-linkage tree of the samples of a presence/absence matrix.")
+    parser.add_argument('matrix', help="bit-packed matrix (.npz from amr_matrix.py)")
+    parser.add_argument('--newick', default=None, help="write the tree in Newick format")
+    parser.add_argument('--figure', default=None, help="write the dendrogram figure")
+    parser.add_argument('--linkage', default=None, help="write the scipy linkage matrix (.npy)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="distance worker processes")
+    parser.add_argument('--max-leaves', type=int, default=200, help="clades shown in the figure")
+    parser.add_argument('--title', default=None)
+    parser.add_argument('--tmpdir', default=None, help="where the distance matrix is spilled")
+    args = parser.parse_args()
+
+    try:
+        matrix = PresenceMatrix.load(args.matrix)
+        if len(matrix.samples) < 2:
+            print(f"Error: need at least 2 samples, {args.matrix} has {len(matrix.samples)}", file=sys.stderr)
+            sys.exit(1)
+        Z = cluster(matrix, max(1, args.workers), args.tmpdir)
+        if args.linkage:
+            np.save(args.linkage, Z)
+        if args.newick:
+            with open(args.newick, 'w') as f:
+                f.write(to_newick(Z, matrix.samples) + '\n')
+        if args.figure:
+            plot_tree(Z, matrix.samples, args.figure, args.max_leaves, args.title)
+    except OSError as e:
+        print(f"Error: clustering failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Clustered {len(matrix.samples)} samples")
+
+if __name__ == "__main__":
+    main()
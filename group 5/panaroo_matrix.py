@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+Panaroo Presence/Absence Loader
+
+Panaroo's gene_presence_absence.csv has one row per gene cluster: the
+cluster name, annotation columns (long free text) and one column per
+isolate holding that isolate's gene IDs. On large pangenomes the file is
+several GB, and most of it is text that the tree and statistics never use.
+
+This loader reads the header, then parses only the Gene column and the
+sample columns, in chunks of gene clusters. Each chunk becomes bit-packed
+sample rows (see amr_matrix.py), so the whole table is never held as text
+or as a dense frame. The matrix is cached as gene_presence_absence.npz next
+to the CSV and stamped with the CSV's size and mtime, so it is only rebuilt
+when Panaroo writes a new table.
+
+Usage:
+    python3 panaroo_matrix.py gene_presence_absence.csv [--out FILE.npz] [--chunksize N]
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from amr_matrix import PresenceMatrix
+
+GENE_COLUMN = 'Gene'
+# Every non-sample column of the Panaroo and the Roary-style tables
+METADATA_COLUMNS = {
+    'Gene', 'Non-unique', 'Non-unique Gene name', 'Annotation', 'No. isolates', 'No. sequences',
+    'Avg sequences per isolate', 'Genome Fragment', 'Order within Fragment', 'Accessory Fragment',
+    'Accessory Order with Fragment', 'QC', 'Min group size nuc', 'Max group size nuc',
+    'Avg group size nuc', 'Protein IDs', 'Gene ID', 'Gene name',
+}
+# Gene clusters per chunk; a multiple of 8 so chunks pack into whole bytes
+CHUNKSIZE = 8192
+
+def source_stamp(csv_path):
+    st = os.stat(csv_path)
+    return f"{st.st_size} {st.st_mtime_ns}"
+
+def cache_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".npz"
+
+def sample_columns(csv_path):
+    """Isolate columns of the table, in file order."""
+    header = pd.read_csv(csv_path, nrows=0).columns
+    return [c for c in header if c not in METADATA_COLUMNS]
+
+def read_panaroo(csv_path, chunksize=CHUNKSIZE):
+    """Bit-packed sample x gene cluster matrix of a gene_presence_absence.csv."""
+    chunksize = max(8, chunksize - chunksize % 8)
+    samples = sample_columns(csv_path)
+    genes = []
+    blocks = []
+    # Only empty cells are absences; a gene ID such as "NA" is still a gene
+    reader = pd.read_csv(csv_path, usecols=[GENE_COLUMN] + samples, dtype=str, chunksize=chunksize,
+                         keep_default_na=False, na_values=[''])
+    for chunk in reader:
+        genes.extend(chunk[GENE_COLUMN].tolist())
+        present = chunk[samples].notna().to_numpy().T
+        blocks.append(np.packbits(present, axis=1))
+    packed = np.concatenate(blocks, axis=1) if blocks else np.zeros((len(samples), 0), dtype=np.uint8)
+    return PresenceMatrix(samples, genes, np.ascontiguousarray(packed), source_stamp(csv_path))
+
+def load_panaroo(csv_path, out=None, chunksize=CHUNKSIZE):
+    """The cached matrix of csv_path, rebuilt if missing or older than the CSV."""
+    out = out or cache_path(csv_path)
+    try:
+        matrix = PresenceMatrix.load(out)
+        if matrix.source == source_stamp(csv_path):
+            return matrix
+    except (OSError, ValueError, KeyError):
+        pass
+    matrix = read_panaroo(csv_path, chunksize)
+    matrix.save(out)
+    return matrix
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Load Panaroo's gene_presence_absence.csv as a bit-packed matrix.")
+    parser.add_argument('csv', help="Panaroo gene_presence_absence.csv")
+    parser.add_argument('--out', default=None, help="cache file (default: .npz next to the CSV)")
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help="gene clusters parsed at a time")
+    args = parser.parse_args()
+
+    try:
+        matrix = load_panaroo(args.csv, args.out, args.chunksize)
+    except (OSError, ValueError, pd.errors.ParserError) as e:
+        print(f"Error: could not load {args.csv}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    partition = matrix.partition()
+    print(f"{args.out or cache_path(args.csv)}: {matrix.shape[0]} isolates x {matrix.shape[1]} gene clusters "
+          f"(core {len(partition['core'])}, soft core {len(partition['soft_core'])}, "
+          f"shell {len(partition['shell'])}, cloud {len(partition['cloud'])})")
+
+if __name__ == "__main__":
+    main()
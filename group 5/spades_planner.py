@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+
+"""
+SPAdes Resource Planner
+
+Chooses SPAdes threads and memory for one sample from the size of its
+trimmed read set, instead of one fixed --threads/--memory for every sample.
+
+The memory SPAdes needs follows the number of distinct k-mers in the reads
+(genome k-mers plus sequencing-error k-mers), so the planner estimates that
+with a HyperLogLog sketch of the canonical 21-mers of the first reads. Two
+nested sketches (half and all of the sampled reads) separate the genome
+k-mers, which saturate, from the error k-mers, which grow with the reads,
+and extrapolate to the whole read set. Read and base counts come from
+fastp's JSON report when there is one, otherwise from streaming the reads.
+
+Every assembly run through "run" appends its features, peak RSS and wall
+time to a history file. With three or more successful runs the memory and
+runtime models are fitted to that history instead of the built-in defaults.
+The plan also reports how many assemblies of this size fit on the node at
+once: the cores and memory shared by the assemblies (--cores, --memory-gb)
+divided by this sample's threads and memory. Without --memory-gb the budget
+is MemAvailable at planning time.
+
+Usage:
+    python3 spades_planner.py plan R1.fastq.gz R2.fastq.gz [--fastp-json J] [--history H]
+                                   [--max-threads N] [--cores N] [--memory-gb N] [--out plan.json]
+                                   → prints "THREADS MEMORY_GB CONCURRENCY"
+    python3 spades_planner.py run --plan plan.json --history H --sample NAME -- spades.py ...
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import fcntl
+import argparse
+import resource
+import subprocess
+
+import numpy as np
+
+K = 21
+# Reads per mate that go into the k-mer sketch: ~10x of a bacterial genome,
+# where its k-mers have saturated (fewer reads over-estimate, never under)
+SKETCH_READS = 200000
+HLL_P = 14
+
+# Defaults until the history has enough runs: peak GB = base + GB per
+# million distinct k-mers; SPAdes thread-seconds per sequenced base
+MEM_BASE_GB = 1.0
+MEM_GB_PER_MKMER = 0.05
+THREAD_SECONDS_PER_BASE = 1.5e-5
+MIN_HISTORY = 3
+SAFETY = 1.3
+MIN_MEM_GB = 4
+# SPAdes gains little from threads past this; one thread per BASES_PER_THREAD
+MAX_USEFUL_THREADS = 16
+BASES_PER_THREAD = 2.5e8
+
+HISTORY_FIELDS = ("sample", "reads", "bases", "kmers", "threads", "memory_gb", "peak_rss_gb", "wall_seconds", "status")
+
+def open_reads(path):
+    return gzip.open(path, 'rt') if path.endswith('.gz') else open(path)
+
+def stream_reads(path, sketch_reads):
+    """(reads, bases, first sketch_reads sequences) of one FASTQ, streamed."""
+    reads = bases = 0
+    sample = []
+    with open_reads(path) as f:
+        for i, line in enumerate(f):
+            if i % 4 == 1:
+                seq = line.rstrip('\n')
+                reads += 1
+                bases += len(seq)
+                if len(sample) < sketch_reads:
+                    sample.append(seq)
+    return reads, bases, sample
+
+def head_reads(path, sketch_reads):
+    """First sketch_reads sequences of one FASTQ."""
+    sample = []
+    with open_reads(path) as f:
+        for i, line in enumerate(f):
+            if i % 4 == 1:
+                sample.append(line.rstrip('\n'))
+                if len(sample) >= sketch_reads:
+                    break
+    return sample
+
+def fastp_counts(json_path):
+    """(reads, bases) after filtering, from fastp's JSON report."""
+    with open(json_path) as f:
+        after = json.load(f)['summary']['after_filtering']
+    return int(after['total_reads']), int(after['total_bases'])
+
+class HyperLogLog:
+    """Distinct count sketch over 64-bit hashes."""
+
+    def __init__(self, p=HLL_P):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, hashes):
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # Rank: position of the leftmost set bit in the remaining 64 - p bits
+        bit_length = np.where(rest > 0, np.frexp(rest.astype(np.float64))[1], 0)
+        rank = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return float(estimate)
+
+ENCODE = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate(b"ACGT"):
+    ENCODE[_base] = _code
+    ENCODE[ord(chr(_base).lower())] = _code
+
+def canonical_kmer_hashes(sequences, k=K):
+    """Mixed 64-bit hashes of every canonical k-mer without N in the sequences."""
+    if not sequences:
+        return np.zeros(0, dtype=np.uint64)
+    # One array for the batch; the separator is invalid, so no k-mer spans two reads
+    codes = ENCODE[np.frombuffer('\n'.join(sequences).encode(), dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    invalid = np.concatenate(([0], np.cumsum(codes == 4)))
+    valid = (invalid[k:] - invalid[:-k]) == 0
+    values = np.minimum(codes, 3).astype(np.uint64)
+    forward = np.zeros(n, dtype=np.uint64)
+    reverse = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        window = values[j:j + n]
+        forward |= window << np.uint64(2 * (k - 1 - j))
+        reverse |= (np.uint64(3) - window) << np.uint64(2 * j)
+    x = np.minimum(forward, reverse)[valid]
+    # splitmix64 finaliser
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+def estimate_kmers(sample, sampled_bases, total_bases, batch=20000):
+    """Distinct canonical k-mers of the whole read set, extrapolated from the sample."""
+    half, full = HyperLogLog(), HyperLogLog()
+    for start in range(0, len(sample), batch):
+        chunk = sample[start:start + batch]
+        half.add(canonical_kmer_hashes(chunk[::2]))
+        full.add(canonical_kmer_hashes(chunk))
+    d_half, d_full = half.count(), full.count()
+    if not sampled_bases or sampled_bases >= total_bases:
+        return d_full
+    fraction = sampled_bases / total_bases
+    # d(f) = genome + errors * f: the errors grow with the reads, the genome does not
+    errors = max(0.0, (d_full - d_half) / (fraction / 2))
+    genome = max(0.0, d_full - errors * fraction)
+    return genome + errors
+
+def load_history(path):
+    rows = []
+    if path and os.path.exists(path):
+        with open(path) as f:
+            header = f.readline().rstrip('\n').split('\t')
+            for line in f:
+                row = dict(zip(header, line.rstrip('\n').split('\t')))
+                # Runs without a plan (planner fallback) have no k-mer count to fit
+                if row.get('status') == '0' and float(row.get('kmers') or 0) > 0:
+                    rows.append(row)
+    return rows
+
+def memory_model(history):
+    """(base GB, GB per million k-mers) fitted to past runs, or the defaults."""
+    if len(history) < MIN_HISTORY:
+        return MEM_BASE_GB, MEM_GB_PER_MKMER
+    kmers = np.array([float(r['kmers']) / 1e6 for r in history])
+    peak = np.array([float(r['peak_rss_gb']) for r in history])
+    A = np.vstack([np.ones_like(kmers), kmers]).T
+    (base, slope), *_ = np.linalg.lstsq(A, peak, rcond=None)
+    if slope <= 0:
+        return float(peak.max()), 0.0
+    # Shift the line up to cover the worst run, so the fit never under-predicts the past
+    base += max(0.0, float(np.max(peak - (base + slope * kmers))))
+    return max(0.5, float(base)), float(slope)
+
+def runtime_model(history):
+    """Thread-seconds per base from past runs, or the default."""
+    if len(history) < MIN_HISTORY:
+        return THREAD_SECONDS_PER_BASE
+    rates = [float(r['wall_seconds']) * int(r['threads']) / max(1, int(r['bases'])) for r in history]
+    return float(np.median(rates))
+
+def available_memory_gb():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024 / 1024
+    except OSError:
+        pass
+    return None
+
+def plan(reads, bases, kmers, history, max_threads, cores=None, budget_gb=None):
+    base, slope = memory_model(history)
+    predicted_gb = base + slope * kmers / 1e6
+    memory_gb = max(MIN_MEM_GB, int(np.ceil(predicted_gb * SAFETY)))
+    threads = int(min(max_threads, MAX_USEFUL_THREADS, max(2, np.ceil(bases / BASES_PER_THREAD))))
+    cores = cores or os.cpu_count() or threads
+    available = budget_gb if budget_gb is not None else available_memory_gb()
+    concurrency = max(1, cores // threads)
+    if available is not None:
+        concurrency = max(1, min(concurrency, int(available // memory_gb)))
+    return {
+        'reads': reads,
+        'bases': bases,
+        'kmers': int(kmers),
+        'predicted_peak_gb': round(predicted_gb, 2),
+        'memory_gb': memory_gb,
+        'threads': threads,
+        'predicted_minutes': round(runtime_model(history) * bases / threads / 60, 1),
+        'concurrency': concurrency,
+        'available_gb': None if available is None else round(available, 1),
+        'history_runs': len(history),
+    }
+
+def append_history(path, row):
+    """Append one run under a lock, writing the header on first use."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        if f.tell() == 0:
+            f.write('\t'.join(HISTORY_FIELDS) + '\n')
+        f.write('\t'.join(str(row[k]) for k in HISTORY_FIELDS) + '\n')
+
+def run_recorded(cmd, plan_path, history_path, sample):
+    """Run cmd and record its wall time and peak RSS against the plan's features."""
+    with open(plan_path) as f:
+        features = json.load(f)
+    start = time.monotonic()
+    status = subprocess.call(cmd)
+    wall = time.monotonic() - start
+    # ru_maxrss of waited-for descendants, in KB on Linux
+    peak_gb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024 / 1024
+    append_history(history_path, {
+        'sample': sample, 'reads': features['reads'], 'bases': features['bases'], 'kmers': features['kmers'],
+        'threads': features['threads'], 'memory_gb': features['memory_gb'],
+        'peak_rss_gb': round(peak_gb, 3), 'wall_seconds': round(wall, 1), 'status': status,
+    })
+    return status
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Plan SPAdes threads and memory from the read set.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('plan', help="print THREADS MEMORY_GB CONCURRENCY for one sample")
+    p.add_argument('reads', nargs='+', help="trimmed FASTQ files (R1 R2)")
+    p.add_argument('--fastp-json', default=None, help="fastp report with the read and base counts")
+    p.add_argument('--history', default=None, help="past runs recorded by 'run'")
+    p.add_argument('--max-threads', type=int, default=os.cpu_count() or 1)
+    p.add_argument('--cores', type=int, default=None, help="cores shared by concurrent assemblies (default: all)")
+    p.add_argument('--memory-gb', type=float, default=None,
+                   help="memory shared by concurrent assemblies (default: MemAvailable)")
+    p.add_argument('--sketch-reads', type=int, default=SKETCH_READS, help="reads per file in the k-mer sketch")
+    p.add_argument('--out', default=None, help="write the full plan as JSON")
+    p = sub.add_parser('run', help="run SPAdes and record its resource use")
+    p.add_argument('--plan', required=True)
+    p.add_argument('--history', required=True)
+    p.add_argument('--sample', required=True)
+    p.add_argument('cmd', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        cmd = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+        try:
+            sys.exit(run_recorded(cmd, args.plan, args.history, args.sample))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error: could not run {cmd[:1]}: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    try:
+        counts = None
+        if args.fastp_json and os.path.exists(args.fastp_json):
+            try:
+                counts = fastp_counts(args.fastp_json)
+            except (ValueError, KeyError) as e:
+                print(f"Warning: ignoring {args.fastp_json}: {e}", file=sys.stderr)
+        sample = []
+        if counts:
+            reads, bases = counts
+            for path in args.reads:
+                sample += head_reads(path, args.sketch_reads)
+        else:
+            reads = bases = 0
+            for path in args.reads:
+                r, b, s = stream_reads(path, args.sketch_reads)
+                reads, bases, sample = reads + r, bases + b, sample + s
+        kmers = estimate_kmers(sample, sum(len(s) for s in sample), bases)
+        result = plan(reads, bases, kmers, load_history(args.history), max(1, args.max_threads),
+                      args.cores, args.memory_gb)
+    except OSError as e:
+        print(f"Error: could not plan SPAdes resources: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+    if result['available_gb'] is not None and result['memory_gb'] > result['available_gb']:
+        print(f"Warning: SPAdes is expected to need {result['memory_gb']} GB, "
+              f"only {result['available_gb']} GB is available", file=sys.stderr)
+    print(f"{result['threads']} {result['memory_gb']} {result['concurrency']}")
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ SIGNALP_VENV_BIN="$HOME/signalp6_fast/signalp-6-package/venv/bin" # SignalP bina
 AMRFINDER_ENV="amrfinder_env"             # conda env for AMRFinder
 PROKKA_BIN="/usr/bin/prokka"
 THREADS=4
+SHARD_THREADS="${SHARD_THREADS:-4}"       # cores per DIAMOND shard
+SHARD_SEARCH="${SHARD_SEARCH:-$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/../group 7/shard_search.py}"  # splits DIAMOND into shards
 # -------------------------
 
 # -------------------------
@@ -90,10 +92,11 @@ PROKKA_FAA="$PROKKA_OUT/${GENOME}.faa"
 # -------------------------
 echo "Running DIAMOND..."
 if [ -f "${DIAMOND_DB}.dmnd" ] || [ -f "$DIAMOND_DB" ]; then
-    diamond blastp -d "$DIAMOND_DB" -q "$PROKKA_FAA" \
-                   -o "$GENOME_DIR/diamond/${GENOME}_diamond.tsv" \
-                   -f 6 qseqid sseqid pident length evalue bitscore stitle \
-                   --threads "$THREADS"
+    python3 "$SHARD_SEARCH" --query "$PROKKA_FAA" --out "$GENOME_DIR/diamond/${GENOME}_diamond.tsv" \
+                            --cpu "$THREADS" --shard-cpu "$SHARD_THREADS" --tmpdir "$GENOME_DIR/diamond" -- \
+                            diamond blastp -q {query} -o {out} --threads {threads} \
+                            -d "$DIAMOND_DB" \
+                            -f 6 qseqid sseqid pident length evalue bitscore stitle
 else
     echo "DIAMOND DB not found. Skipping DIAMOND."
 fi
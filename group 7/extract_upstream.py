@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+"""
+Upstream Region Extractor for MEME
+
+Replaces the bedtools flank + getfasta + awk clean-up chain of step 6. The
+cleaned genome is memory-mapped and located through its samtools .fai index,
+each CDS from the BED file gets a strand-aware upstream flank clipped at the
+contig ends, minus-strand flanks are reverse-complemented, and the sequences
+are normalised (uppercase, non-ACGT -> N) and written straight to a
+MEME-ready FASTA. Regions shorter than the minimum length are dropped.
+
+Usage: python3 extract_upstream.py GENOME.fna CDS.bed OUTPUT.fa [--length 200] [--min-length 50]
+"""
+
+import sys
+import mmap
+import argparse
+
+def translation_table(bases, replacements):
+    """256-byte table mapping each base to its replacement and every other byte to N."""
+    table = bytearray(b'N' * 256)
+    for base, replacement in zip(bases, replacements):
+        table[base] = replacement
+    return bytes(table)
+
+# Uppercase A/C/G/T (or their complements), everything else becomes N
+NORMALISE = translation_table(b'ACGTacgt', b'ACGTACGT')
+NORMALISE_REVCOMP = translation_table(b'ACGTacgt', b'TGCATGCA')
+
+def read_fai(fai_path):
+    """Return {contig: (length, offset, line_bases, line_bytes)} from a .fai index."""
+    index = {}
+    with open(fai_path) as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) >= 5:
+                index[parts[0]] = tuple(int(x) for x in parts[1:5])
+    return index
+
+class IndexedGenome:
+    """Random access to a FASTA file through mmap and its .fai offsets."""
+
+    def __init__(self, fasta_path, fai_path=None):
+        self.index = read_fai(fai_path or f"{fasta_path}.fai")
+        self._file = open(fasta_path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def length(self, contig):
+        return self.index[contig][0]
+
+    def fetch(self, contig, start, end):
+        """Return the raw bases of [start, end) on a contig (0-based, half-open)."""
+        _, offset, line_bases, line_bytes = self.index[contig]
+        if end <= start:
+            return b''
+        first = offset + (start // line_bases) * line_bytes + start % line_bases
+        last = offset + ((end - 1) // line_bases) * line_bytes + (end - 1) % line_bases
+        return self._map[first:last + 1].translate(None, b'\r\n')
+
+def upstream_interval(start, end, strand, length, contig_length):
+    """Upstream flank of a feature, as bedtools flank -l LENGTH -r 0 -s computes it."""
+    if strand == '-':
+        return end, min(contig_length, end + length)
+    return max(0, start - length), start
+
+def iter_upstream(genome, bed_path, length):
+    """Yield (label, normalised sequence) for the upstream flank of every BED feature."""
+    with open(bed_path) as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) < 6 or parts[0] not in genome.index:
+                continue
+            contig, strand = parts[0], parts[5]
+            start, end = upstream_interval(int(parts[1]), int(parts[2]), strand,
+                                           length, genome.length(contig))
+            seq = genome.fetch(contig, start, end)
+            if strand == '-':
+                seq = seq.translate(NORMALISE_REVCOMP)[::-1]
+            else:
+                seq = seq.translate(NORMALISE)
+            yield f"{contig}:{start}-{end}({'-' if strand == '-' else '+'})", seq
+
+def write_meme_fasta(genome_path, bed_path, output_path, length=200, min_length=50):
+    """Write upstream regions of at least min_length bp; returns the number written."""
+    count = 0
+    with IndexedGenome(genome_path) as genome, open(output_path, 'wb') as out:
+        for label, seq in iter_upstream(genome, bed_path, length):
+            if len(seq) < min_length:
+                continue
+            count += 1
+            out.write(f">upstream_{count} {label}\n".encode())
+            out.write(seq)
+            out.write(b'\n')
+    return count
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Extract MEME-ready upstream regions of CDS features.")
+    parser.add_argument('genome', help="FASTA file with a samtools .fai index next to it")
+    parser.add_argument('bed', help="CDS coordinates (BED6)")
+    parser.add_argument('output', help="FASTA file to write")
+    parser.add_argument('--length', type=int, default=200, help="upstream length in bp (default 200)")
+    parser.add_argument('--min-length', type=int, default=50, help="drop shorter regions (default 50)")
+    args = parser.parse_args()
+
+    try:
+        count = write_meme_fasta(args.genome, args.bed, args.output, args.length, args.min_length)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: could not extract upstream regions: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(count)
+
+if __name__ == "__main__":
+    main()
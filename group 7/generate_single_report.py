@@ -6,7 +6,15 @@ Production-Level Genome Annotation Report Generator
 This script creates a comprehensive, visually appealing HTML report
 for prokaryotic genome annotation results.
 
-Usage: python3 generate_single_report.py BASENAME
+Usage: python3 generate_single_report.py [--full-tables] BASENAME
+       python3 generate_single_report.py [--full-tables] --batch [--workers N] [BASENAME ...]
+
+Batch mode renders every listed genome (or every genome found under
+results/) in one interpreter, spread over a pool of worker processes.
+
+By default each table shows only its first rows. --full-tables keeps every
+row: the data is written page by page to <BASENAME>_report_data/ next to the
+report, and the report loads each page only when it is viewed.
 """
 
 import sys
@@ -15,296 +23,28 @@ import re
 from pathlib import Path
 from datetime import datetime
 import html
+import json
+import shutil
+from itertools import chain, islice
+from functools import lru_cache, partial
+from multiprocessing import Pool
 
-def safe_read_file(filepath):
-    """Safely read a file and return its content, or None if it fails."""
-    try:
-        if os.path.exists(filepath) and os.path.getsize(filepath) > 0:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
-    except Exception as e:
-        print(f"Warning: Could not read {filepath}: {e}")
-    return None
-
-def parse_prokka_stats(prokka_txt_path):
-    """Parse Prokka statistics file."""
-    stats = {}
-    content = safe_read_file(prokka_txt_path)
-    if not content:
-        return stats
-    
-    for line in content.split('\n'):
-        if ':' in line:
-            key, value = line.split(':', 1)
-            stats[key.strip()] = value.strip()
-    
-    return stats
-
-def parse_prokka_gff(gff_path):
-    """Parse Prokka GFF file and extract features."""
-    features = []
-    content = safe_read_file(gff_path)
-    if not content:
-        return features
-    
-    for line in content.split('\n'):
-        if line.startswith('#') or not line.strip():
-            continue
-        
-        parts = line.split('\t')
-        if len(parts) >= 9:
-            features.append({
-                'seqid': parts[0],
-                'source': parts[1],
-                'type': parts[2],
-                'start': parts[3],
-                'end': parts[4],
-                'score': parts[5],
-                'strand': parts[6],
-                'phase': parts[7],
-                'attributes': parts[8]
-            })
-    
-    return features
-
-def parse_fasta(fasta_path, limit=20):
-    """Parse FASTA file and return sequence records."""
-    records = []
-    content = safe_read_file(fasta_path)
-    if not content:
-        return records
-    
-    current_header = None
-    current_seq = []
-    
-    for line in content.split('\n'):
-        line = line.strip()
-        if line.startswith('>'):
-            if current_header:
-                records.append({
-                    'header': current_header,
-                    'sequence': ''.join(current_seq)
-                })
-                if len(records) >= limit:
-                    break
-            current_header = line[1:]
-            current_seq = []
-        else:
-            current_seq.append(line)
-    
-    if current_header and len(records) < limit:
-        records.append({
-            'header': current_header,
-            'sequence': ''.join(current_seq)
-        })
-    
-    return records
-
-def parse_bed(bed_path, limit=50):
-    """Parse BED file."""
-    features = []
-    content = safe_read_file(bed_path)
-    if not content:
-        return features
-    
-    for i, line in enumerate(content.split('\n')):
-        if i >= limit or not line.strip():
-            break
-        
-        parts = line.split('\t')
-        if len(parts) >= 6:
-            features.append({
-                'chrom': parts[0],
-                'start': parts[1],
-                'end': parts[2],
-                'name': parts[3],
-                'score': parts[4],
-                'strand': parts[5]
-            })
-    
-    return features
-
-def parse_trna_scan(trna_path):
-    """Parse tRNAscan-SE output file."""
-    results = []
-    content = safe_read_file(trna_path)
-    if not content:
-        return results
-    
-    lines = content.split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line or line.startswith('Sequence') or line.startswith('Name') or line.startswith('---'):
-            continue
-        
-        # tRNAscan output is space-delimited
-        parts = line.split()
-        if len(parts) >= 9:
-            results.append({
-                'sequence': parts[0],
-                'trna_num': parts[1],
-                'begin': parts[2],
-                'end': parts[3],
-                'type': parts[4],
-                'anticodon': parts[5] if len(parts) > 5 else 'N/A',
-                'intron_begin': parts[6] if len(parts) > 6 else '0',
-                'intron_end': parts[7] if len(parts) > 7 else '0',
-                'score': parts[8] if len(parts) > 8 else 'N/A'
-            })
-    
-    return results
-
-def parse_cmscan(cmscan_path, limit=50):
-    """Parse cmscan table output."""
-    results = []
-    content = safe_read_file(cmscan_path)
-    if not content:
-        return results
-    
-    for i, line in enumerate(content.split('\n')):
-        if line.startswith('#') or not line.strip():
-            continue
-        if len(results) >= limit:
-            break
-        
-        parts = line.split()
-        if len(parts) >= 18:
-            results.append({
-                'target': parts[0],
-                'accession': parts[1],
-                'query': parts[2],
-                'e_value': parts[15],
-                'score': parts[14],
-                'bias': parts[16]
-            })
-    
-    return results
-
-def parse_hmmscan(hmmscan_path, limit=50):
-    """Parse hmmscan domain table output."""
-    results = []
-    content = safe_read_file(hmmscan_path)
-    if not content:
-        return results
-    
-    for i, line in enumerate(content.split('\n')):
-        if line.startswith('#') or not line.strip():
-            continue
-        if len(results) >= limit:
-            break
-        
-        parts = line.split()
-        if len(parts) >= 23:
-            results.append({
-                'target': parts[0],
-                'accession': parts[1],
-                'query': parts[3],
-                'e_value': parts[12],
-                'score': parts[13],
-                'description': ' '.join(parts[22:]) if len(parts) > 22 else 'N/A'
-            })
-    
-    return results
-
-def parse_fimo_tsv(fimo_path, limit=100):
-    """Parse FIMO TSV output."""
-    results = []
-    content = safe_read_file(fimo_path)
-    if not content:
-        return results
-    
-    lines = content.split('\n')
-    for i, line in enumerate(lines):
-        if i == 0 or not line.strip():  # Skip header
-            continue
-        if len(results) >= limit:
-            break
-        
-        parts = line.split('\t')
-        if len(parts) >= 9:
-            results.append({
-                'motif_id': parts[0],
-                'motif_alt_id': parts[1],
-                'sequence_name': parts[2],
-                'start': parts[3],
-                'stop': parts[4],
-                'strand': parts[5],
-                'score': parts[6],
-                'p_value': parts[7],
-                'q_value': parts[8],
-                'matched_sequence': parts[9] if len(parts) > 9 else 'N/A'
-            })
-    
-    return results
-
-def italicize_species_name(text, basename):
-    """Replace all instances of the genome name with italicized version."""
-    # Try to extract genus and species from basename
-    parts = basename.replace('_', ' ').split()
-    if len(parts) >= 2:
-        species_name = f"{parts[0]} {parts[1]}"
-        text = text.replace(basename.replace('_', ' '), f"<em>{species_name}</em>")
-        text = text.replace(basename, f"<em>{species_name}</em>")
-    return text
-
-def generate_html_report(basename):
-    """Generate the complete HTML report."""
-    
-    # Define paths
-    results_dir = Path(f"results/{basename}")
-    prokka_dir = results_dir / "prokka_output"
-    report_path = results_dir / f"{basename}_Annotation_Report.html"
-    
-    # Check if directories exist
-    if not results_dir.exists():
-        print(f"Error: Results directory not found: {results_dir}")
-        return False
-    
-    # Parse all data files
-    print(f"Parsing annotation data for {basename}...")
-    
-    prokka_stats = parse_prokka_stats(prokka_dir / f"{basename}.txt")
-    prokka_features = parse_prokka_gff(prokka_dir / f"{basename}.gff")[:100]
-    proteins = parse_fasta(prokka_dir / f"{basename}.faa", limit=20)
-    cds_bed = parse_bed(prokka_dir / f"{basename}.cds.bed")
-    upstream_seqs = parse_fasta(prokka_dir / f"{basename}.upstream.200.fa", limit=20)
-    trna_results = parse_trna_scan(prokka_dir / f"{basename}.tRNAscan.out")
-    cmscan_results = parse_cmscan(prokka_dir / f"{basename}.cmscan.tbl")
-    hmmscan_results = parse_hmmscan(prokka_dir / f"{basename}.pfam.domtblout")
-    fimo_results = parse_fimo_tsv(prokka_dir / "fimo_out" / "fimo.tsv")
-    
-    # Check for optional screenshots
-    screenshot_dir = Path("report_assets")
-    screenshots = {}
-    if screenshot_dir.exists():
-        for img_file in screenshot_dir.glob("*.png"):
-            screenshots[img_file.stem] = img_file.name
-    
-    # Generate HTML
-    species_name = basename.replace('_', ' ')
-    
-    html_content = f"""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Annotation Report: {species_name}</title>
-    <style>
-        * {{
+# Stylesheet shared by every report; built once per interpreter
+REPORT_CSS = """        * {
             margin: 0;
             padding: 0;
             box-sizing: border-box;
-        }}
+        }
         
-        body {{
+        body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             color: #2c3e50;
             line-height: 1.6;
             padding: 20px;
-        }}
+        }
         
-        .container {{
+        .container {
             max-width: 1400px;
             margin: 0 auto;
             background: #ffffff;
@@ -312,14 +52,14 @@ def generate_html_report(basename):
             box-shadow: 0 20px 60px rgba(0,0,0,0.3);
             overflow: hidden;
             animation: fadeIn 0.8s ease-in;
-        }}
+        }
         
-        @keyframes fadeIn {{
-            from {{ opacity: 0; transform: translateY(20px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
+        @keyframes fadeIn {
+            from { opacity: 0; transform: translateY(20px); }
+            to { opacity: 1; transform: translateY(0); }
+        }
         
-        header {{
+        header {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             color: white;
             padding: 60px 40px;
@@ -327,9 +67,9 @@ def generate_html_report(basename):
             border-bottom: 8px solid #5a67d8;
             position: relative;
             overflow: hidden;
-        }}
+        }
         
-        header::before {{
+        header::before {
             content: '';
             position: absolute;
             top: -50%;
@@ -338,71 +78,71 @@ def generate_html_report(basename):
             height: 200%;
             background: radial-gradient(circle, rgba(255,255,255,0.1) 0%, transparent 70%);
             animation: pulse 15s infinite;
-        }}
+        }
         
-        @keyframes pulse {{
-            0%, 100% {{ transform: scale(1); }}
-            50% {{ transform: scale(1.1); }}
-        }}
+        @keyframes pulse {
+            0%, 100% { transform: scale(1); }
+            50% { transform: scale(1.1); }
+        }
         
-        h1 {{
+        h1 {
             font-size: 3em;
             font-weight: 700;
             margin-bottom: 15px;
             text-shadow: 2px 2px 4px rgba(0,0,0,0.2);
             position: relative;
             z-index: 1;
-        }}
+        }
         
-        .subtitle {{
+        .subtitle {
             font-size: 1.3em;
             opacity: 0.95;
             font-weight: 300;
             position: relative;
             z-index: 1;
-        }}
+        }
         
-        .content {{
+        .content {
             padding: 40px;
-        }}
+        }
         
-        .section {{
+        .section {
             margin-bottom: 50px;
             background: linear-gradient(to right, #f8f9ff 0%, #fff 100%);
             padding: 30px;
             border-radius: 15px;
             box-shadow: 0 5px 15px rgba(0,0,0,0.05);
             transition: transform 0.3s ease, box-shadow 0.3s ease;
-        }}
+        }
         
-        .section:hover {{
+        .section:hover {
             transform: translateY(-5px);
             box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-        }}
+        }
         
-        h2 {{
+        h2 {
             color: #5a67d8;
             font-size: 2em;
             margin-bottom: 20px;
             padding-bottom: 10px;
             border-bottom: 3px solid #667eea;
             display: inline-block;
-        }}
+        }
         
-        h3 {{
+        h3 {
             color: #764ba2;
             font-size: 1.5em;
             margin: 25px 0 15px 0;
-        }}
+        }
         
-        .stats-grid {{
+        .stats-grid {
             display: grid;
             grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
             gap: 20px;
             margin: 25px 0;
-        }}
+        }
         
-        .stat-card {{
+        .stat-card {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             color: white;
             padding: 25px;
@@ -410,26 +150,26 @@ def generate_html_report(basename):
             text-align: center;
             box-shadow: 0 5px 15px rgba(102,126,234,0.3);
             transition: transform 0.3s ease;
-        }}
+        }
         
-        .stat-card:hover {{
+        .stat-card:hover {
             transform: scale(1.05);
-        }}
+        }
         
-        .stat-label {{
+        .stat-label {
             font-size: 0.9em;
             opacity: 0.9;
             text-transform: uppercase;
             letter-spacing: 1px;
-        }}
+        }
         
-        .stat-value {{
+        .stat-value {
             font-size: 2.5em;
             font-weight: bold;
             margin-top: 10px;
-        }}
+        }
         
-        table {{
+        table {
             width: 100%;
             border-collapse: collapse;
             margin: 20px 0;
@@ -437,82 +177,82 @@ def generate_html_report(basename):
             border-radius: 10px;
             overflow: hidden;
             box-shadow: 0 3px 10px rgba(0,0,0,0.05);
-        }}
+        }
         
-        thead {{
+        thead {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             color: white;
-        }}
+        }
         
-        th {{
+        th {
             padding: 15px;
             text-align: left;
             font-weight: 600;
             text-transform: uppercase;
             font-size: 0.85em;
             letter-spacing: 1px;
-        }}
+        }
         
-        td {{
+        td {
             padding: 12px 15px;
             border-bottom: 1px solid #e8e8e8;
             color: #2c3e50;
-        }}
+        }
         
-        tbody tr {{
+        tbody tr {
             transition: background-color 0.2s ease;
-        }}
+        }
         
-        tbody tr:hover {{
+        tbody tr:hover {
             background-color: #f8f9ff;
-        }}
+        }
         
-        tbody tr:nth-child(even) {{
+        tbody tr:nth-child(even) {
             background-color: #fafafa;
-        }}
+        }
         
-        .table-container {{
+        .table-container {
             max-height: 500px;
             overflow-y: auto;
             border-radius: 10px;
             margin: 20px 0;
-        }}
+        }
         
-        .table-container::-webkit-scrollbar {{
+        .table-container::-webkit-scrollbar {
             width: 10px;
-        }}
+        }
         
-        .table-container::-webkit-scrollbar-track {{
+        .table-container::-webkit-scrollbar-track {
             background: #f1f1f1;
             border-radius: 10px;
-        }}
+        }
         
-        .table-container::-webkit-scrollbar-thumb {{
+        .table-container::-webkit-scrollbar-thumb {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             border-radius: 10px;
-        }}
+        }
         
-        .no-data {{
+        .no-data {
             text-align: center;
             padding: 40px;
             color: #888;
             font-style: italic;
             font-size: 1.1em;
-        }}
+        }
         
-        .screenshot {{
+        .screenshot {
             max-width: 100%;
             border-radius: 10px;
             box-shadow: 0 5px 20px rgba(0,0,0,0.2);
             margin: 20px 0;
             transition: transform 0.3s ease;
-        }}
+        }
         
-        .screenshot:hover {{
+        .screenshot:hover {
             transform: scale(1.02);
-        }}
+        }
         
-        .sequence {{
+        .sequence {
             background: #f5f5f5;
             padding: 15px;
             border-radius: 8px;
@@ -522,483 +262,913 @@ def generate_html_report(basename):
             line-height: 1.8;
             color: #2c3e50;
             border-left: 4px solid #667eea;
-        }}
+        }
         
-        code {{
+        code {
             background: #f5f5f5;
             padding: 2px 6px;
             border-radius: 4px;
             font-family: 'Courier New', monospace;
             color: #e83e8c;
-        }}
+        }
         
-        footer {{
+        footer {
             background: #2c3e50;
             color: white;
             padding: 30px;
             text-align: center;
-        }}
+        }
         
-        footer p {{
+        footer p {
             margin: 5px 0;
             opacity: 0.9;
-        }}
+        }
         
-        .badge {{
+        .badge {
             display: inline-block;
             padding: 5px 12px;
             border-radius: 20px;
             font-size: 0.85em;
             font-weight: 600;
             margin: 2px;
-        }}
+        }
         
-        .badge-success {{
+        .badge-success {
             background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%);
             color: white;
-        }}
+        }
         
-        .badge-info {{
+        .badge-info {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             color: white;
-        }}
+        }
         
-        .badge-warning {{
+        .badge-warning {
             background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
             color: white;
-        }}
+        }
+        
+        .pager {
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            gap: 15px;
+            margin: 10px 0 20px 0;
+        }
+        
+        .pager button {
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            border: none;
+            border-radius: 20px;
+            padding: 6px 16px;
+            cursor: pointer;
+        }
         
-        em {{
+        em {
             font-style: italic;
             color: #764ba2;
             font-weight: 500;
-        }}
+        }
         
-        @media (max-width: 768px) {{
-            h1 {{
+        @media (max-width: 768px) {
+            h1 {
                 font-size: 2em;
-            }}
+            }
             
-            .content {{
+            .content {
                 padding: 20px;
-            }}
+            }
             
-            .stats-grid {{
+            .stats-grid {
                 grid-template-columns: 1fr;
-            }}
+            }
             
-            table {{
+            table {
                 font-size: 0.85em;
-            }}
-        }}
-    </style>
+            }
+        }
+"""
+
+# Section templates, filled in and written straight to the report file.
+# Every {field} receives an HTML-escaped value (see ReportWriter.write).
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Annotation Report: {title}</title>
+    <style>
+{css}    </style>
 </head>
 <body>
     <div class="container">
         <header>
             <h1>🧬 Genome Annotation Report</h1>
-            <p class="subtitle"><em>{species_name}</em></p>
+            <p class="subtitle">{species}</p>
         </header>
         
         <div class="content">
 """
-    
-    # Section 1: Overview
-    html_content += """
+
+HTML_FOOT = """
+        </div>
+        
+        <footer>
+            <p><strong>Prokaryotic Genome Annotation Pipeline</strong></p>
+            <p>Report generated on {generated}</p>
+            <p>Genome: {species}</p>
+        </footer>
+    </div>
+</body>
+</html>
+"""
+
+SECTION_OPEN = """
             <div class="section">
-                <h2>📊 Annotation Overview</h2>
+                <h2>{title}</h2>
 """
-    
-    if prokka_stats:
-        html_content += '                <div class="stats-grid">\n'
-        
-        key_stats = ['organism', 'contigs', 'bases', 'CDS', 'rRNA', 'tRNA']
-        for key in key_stats:
-            for stat_key, stat_value in prokka_stats.items():
-                if key.lower() in stat_key.lower():
-                    html_content += f"""
+
+SECTION_CLOSE = '            </div>\n'
+
+NO_DATA = '                <div class="no-data">{message}</div>\n'
+
+STATS_OPEN = '                <div class="stats-grid">\n'
+
+STATS_CLOSE = '                </div>\n'
+
+STAT_CARD = """
                     <div class="stat-card">
-                        <div class="stat-label">{html.escape(stat_key)}</div>
-                        <div class="stat-value">{html.escape(stat_value)}</div>
+                        <div class="stat-label">{label}</div>
+                        <div class="stat-value">{value}</div>
                     </div>
 """
-                    break
-        
-        html_content += '                </div>\n'
-    else:
-        html_content += '                <div class="no-data">No Prokka statistics found</div>\n'
-    
-    html_content += '            </div>\n'
-    
-    # Section 2: Gene Annotations
-    html_content += """
-            <div class="section">
-                <h2>🧬 Gene Annotations</h2>
-"""
-    
-    if prokka_features:
-        html_content += """
+
+TABLE_OPEN = """
                 <div class="table-container">
                     <table>
                         <thead>
                             <tr>
-                                <th>Sequence ID</th>
-                                <th>Type</th>
-                                <th>Start</th>
-                                <th>End</th>
-                                <th>Strand</th>
-                                <th>Attributes</th>
-                            </tr>
+{header_cells}                            </tr>
                         </thead>
                         <tbody>
 """
-        
-        for feature in prokka_features:
-            html_content += f"""
-                            <tr>
-                                <td>{html.escape(feature['seqid'])}</td>
-                                <td><span class="badge badge-info">{html.escape(feature['type'])}</span></td>
-                                <td>{html.escape(feature['start'])}</td>
-                                <td>{html.escape(feature['end'])}</td>
-                                <td>{html.escape(feature['strand'])}</td>
-                                <td style="font-size: 0.85em;">{html.escape(feature['attributes'][:100])}...</td>
-                            </tr>
-"""
-        
-        html_content += """
+
+TABLE_HEADER_CELL = '                                <th>{}</th>\n'
+
+TABLE_CLOSE = """
                         </tbody>
                     </table>
                 </div>
 """
-    else:
-        html_content += '                <div class="no-data">No gene annotations found</div>\n'
-    
-    html_content += '            </div>\n'
-    
-    # Section 3: Protein Sequences
-    html_content += """
-            <div class="section">
-                <h2>🔬 Protein Sequences</h2>
+
+SEQUENCE_INTRO = '                <p>Showing {count} {what}:</p>\n'
+
+SEQUENCE_BLOCK = """
+                <h3>{label} {number}: {header}</h3>
+                <div class="sequence">{sequence}</div>
 """
-    
-    if proteins:
-        html_content += f'                <p>Showing {len(proteins)} of the annotated proteins:</p>\n'
-        
-        for i, protein in enumerate(proteins, 1):
-            seq_preview = protein['sequence'][:100] + ('...' if len(protein['sequence']) > 100 else '')
-            html_content += f"""
-                <h3>Protein {i}: {html.escape(protein['header'][:80])}</h3>
-                <div class="sequence">{html.escape(seq_preview)}</div>
+
+SCREENSHOT = """
+                <h3>{name}</h3>
+                <img src="../../../report_assets/{filename}" alt="{alt}" class="screenshot">
 """
-    else:
-        html_content += '                <div class="no-data">No protein sequences found</div>\n'
-    
-    html_content += '            </div>\n'
-    
-    # Section 4: CDS Coordinates
-    html_content += """
-            <div class="section">
-                <h2>📍 CDS Coordinates</h2>
+
+ROW_OPEN = '\n                            <tr>\n'
+
+ROW_CLOSE = '                            </tr>\n'
+
+# One template per cell kind; the pager script below renders the same kinds
+CELL_TEMPLATES = {
+    'text': '                                <td>{}</td>\n',
+    'badge-info': '                                <td><span class="badge badge-info">{}</span></td>\n',
+    'badge-success': '                                <td><span class="badge badge-success">{}</span></td>\n',
+    'badge-warning': '                                <td><span class="badge badge-warning">{}</span></td>\n',
+    'ellipsis': '                                <td style="font-size: 0.85em;">{}...</td>\n',
+    'code': '                                <td><code>{}</code></td>\n',
+}
+
+# Table columns per section: (header, field, cell kind, max characters shown)
+TABLE_COLUMNS = {
+    'gff': [
+        ('Sequence ID', 'seqid', 'text', None),
+        ('Type', 'type', 'badge-info', None),
+        ('Start', 'start', 'text', None),
+        ('End', 'end', 'text', None),
+        ('Strand', 'strand', 'text', None),
+        ('Attributes', 'attributes', 'ellipsis', 100),
+    ],
+    'proteins': [
+        ('#', 'number', 'text', None),
+        ('Protein', 'header', 'text', 80),
+        ('Length', 'length', 'text', None),
+        ('Sequence', 'sequence', 'code', 100),
+    ],
+    'bed': [
+        ('Chromosome', 'chrom', 'text', None),
+        ('Start', 'start', 'text', None),
+        ('End', 'end', 'text', None),
+        ('Name', 'name', 'text', None),
+        ('Strand', 'strand', 'text', None),
+    ],
+    'upstream': [
+        ('#', 'number', 'text', None),
+        ('Region', 'header', 'text', 80),
+        ('Length', 'length', 'text', None),
+        ('Sequence', 'sequence', 'code', 100),
+    ],
+    'trna': [
+        ('Sequence', 'sequence', 'text', None),
+        ('tRNA #', 'trna_num', 'text', None),
+        ('Begin', 'begin', 'text', None),
+        ('End', 'end', 'text', None),
+        ('Type', 'type', 'badge-success', None),
+        ('Anticodon', 'anticodon', 'text', None),
+        ('Score', 'score', 'text', None),
+    ],
+    'cmscan': [
+        ('Target', 'target', 'text', None),
+        ('Accession', 'accession', 'text', None),
+        ('Query', 'query', 'text', None),
+        ('E-value', 'e_value', 'text', None),
+        ('Score', 'score', 'text', None),
+    ],
+    'hmmscan': [
+        ('Target Domain', 'target', 'badge-warning', None),
+        ('Accession', 'accession', 'text', None),
+        ('Protein Query', 'query', 'text', None),
+        ('E-value', 'e_value', 'text', None),
+        ('Score', 'score', 'text', None),
+        ('Description', 'description', 'text', 60),
+    ],
+    'fimo': [
+        ('Motif ID', 'motif_id', 'badge-info', None),
+        ('Sequence Name', 'sequence_name', 'text', 30),
+        ('Start', 'start', 'text', None),
+        ('Stop', 'stop', 'text', None),
+        ('Strand', 'strand', 'text', None),
+        ('Score', 'score', 'text', None),
+        ('P-value', 'p_value', 'text', None),
+        ('Q-value', 'q_value', 'text', None),
+        ('Matched Sequence', 'matched_sequence', 'code', None),
+    ],
+}
+
+# Maximum rows shown per report section (None = no limit)
+ROW_LIMITS = {
+    'gff': 100,
+    'proteins': 20,
+    'bed': 50,
+    'upstream': 20,
+    'trna': None,
+    'cmscan': 50,
+    'hmmscan': 50,
+    'fimo': 100,
+}
+
+# Rows per sidecar page when tables are written in full (--full-tables)
+PAGE_SIZE = 200
+
+PAGER = """
+                <div class="pager" data-section="{section}" data-dir="{data_dir}" data-pages="{pages}">
+                    <button type="button" data-step="-1">&larr; Previous</button>
+                    <span class="pager-label">Page 1 of {pages} ({rows} rows)</span>
+                    <button type="button" data-step="1">Next &rarr;</button>
+                </div>
 """
-    
-    if cds_bed:
-        html_content += """
-                <div class="table-container">
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Chromosome</th>
-                                <th>Start</th>
-                                <th>End</th>
-                                <th>Name</th>
-                                <th>Strand</th>
-                            </tr>
-                        </thead>
-                        <tbody>
+
+SIDECAR_PAGE = 'reportPages.load({section}, {page}, {data});\n'
+
+# Sidecar pages are plain scripts so they load from file:// URLs, where
+# browsers refuse fetch()/XHR; each page is requested only when shown.
+PAGER_SCRIPT = """
+    <script>
+    (function () {
+        var COLUMNS = %(columns)s;
+        var ITALICS = %(italics)s;
+        var PAGE_SIZE = %(page_size)d;
+        var pages = {}, waiting = {};
+        function esc(s) {
+            return String(s).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+                .replace(/"/g, '&quot;').replace(/'/g, '&#x27;');
+        }
+        function value(s) {
+            s = esc(s);
+            ITALICS.forEach(function (n) { s = s.split(n[0]).join(n[1]); });
+            return s;
+        }
+        var CELLS = {
+            'text': function (v) { return '<td>' + v + '</td>'; },
+            'badge-info': function (v) { return '<td><span class="badge badge-info">' + v + '</span></td>'; },
+            'badge-success': function (v) { return '<td><span class="badge badge-success">' + v + '</span></td>'; },
+            'badge-warning': function (v) { return '<td><span class="badge badge-warning">' + v + '</span></td>'; },
+            'ellipsis': function (v) { return '<td style="font-size: 0.85em;">' + v + '...</td>'; },
+            'code': function (v) { return '<td><code>' + v + '</code></td>'; }
+        };
+        window.reportPages = {
+            load: function (section, page, data) {
+                var key = section + ':' + page;
+                pages[key] = data;
+                if (waiting[key]) { waiting[key](data); delete waiting[key]; }
+            }
+        };
+        function pad(n) { return ('0000' + n).slice(-5); }
+        function fetchPage(pager, page, done) {
+            var section = pager.dataset.section, key = section + ':' + page;
+            if (pages[key]) { done(pages[key]); return; }
+            waiting[key] = done;
+            var script = document.createElement('script');
+            script.charset = 'utf-8';
+            script.src = pager.dataset.dir + '/' + section + '.' + pad(page) + '.js';
+            document.body.appendChild(script);
+        }
+        function show(pager, page) {
+            var section = pager.dataset.section, columns = COLUMNS[section];
+            fetchPage(pager, page, function (data) {
+                var n = data[columns[0][0]].length, rows = [];
+                for (var i = 0; i < n; i++) {
+                    var cells = columns.map(function (c) {
+                        var v = String(data[c[0]][i]);
+                        return CELLS[c[1]](value(c[2] ? v.slice(0, c[2]) : v));
+                    });
+                    rows.push('<tr>' + cells.join('') + '</tr>');
+                }
+                pager.previousElementSibling.querySelector('tbody').innerHTML = rows.join('');
+                pager.dataset.page = page;
+                pager.querySelector('.pager-label').textContent =
+                    'Page ' + (page + 1) + ' of ' + pager.dataset.pages +
+                    ' (rows ' + (page * PAGE_SIZE + 1) + '-' + (page * PAGE_SIZE + n) + ')';
+            });
+        }
+        document.querySelectorAll('.pager').forEach(function (pager) {
+            pager.dataset.page = 0;
+            pager.querySelectorAll('button').forEach(function (button) {
+                button.addEventListener('click', function () {
+                    var page = Number(pager.dataset.page) + Number(button.dataset.step);
+                    if (page >= 0 && page < Number(pager.dataset.pages)) { show(pager, page); }
+                });
+            });
+        });
+    })();
+    </script>
 """
+
+def iter_file_lines(filepath):
+    """Yield the lines of a file one at a time, or nothing if it cannot be read."""
+    try:
+        if not (os.path.exists(filepath) and os.path.getsize(filepath) > 0):
+            return
+        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                yield line.rstrip('\n')
+    except Exception as e:
+        print(f"Warning: Could not read {filepath}: {e}")
+
+def take(records, limit):
+    """Collect at most limit records from an iterator (all of them if limit is None)."""
+    return list(islice(records, limit))
+
+def parse_prokka_stats(prokka_txt_path):
+    """Parse Prokka statistics file."""
+    stats = {}
+    for line in iter_file_lines(prokka_txt_path):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            stats[key.strip()] = value.strip()
+    
+    return stats
+
+def iter_prokka_gff(gff_path):
+    """Yield features from a Prokka GFF file."""
+    for line in iter_file_lines(gff_path):
+        # Prokka appends the genome sequence after this marker
+        if line.startswith('##FASTA'):
+            break
+        if line.startswith('#') or not line.strip():
+            continue
         
-        for feature in cds_bed:
-            html_content += f"""
-                            <tr>
-                                <td>{html.escape(feature['chrom'])}</td>
-                                <td>{html.escape(feature['start'])}</td>
-                                <td>{html.escape(feature['end'])}</td>
-                                <td>{html.escape(feature['name'])}</td>
-                                <td>{html.escape(feature['strand'])}</td>
-                            </tr>
-"""
+        parts = line.split('\t')
+        if len(parts) >= 9:
+            yield {
+                'seqid': parts[0],
+                'source': parts[1],
+                'type': parts[2],
+                'start': parts[3],
+                'end': parts[4],
+                'score': parts[5],
+                'strand': parts[6],
+                'phase': parts[7],
+                'attributes': parts[8]
+            }
+
+def parse_prokka_gff(gff_path, limit=100):
+    """Parse Prokka GFF file and extract features."""
+    return take(iter_prokka_gff(gff_path), limit)
+
+def iter_fasta(fasta_path):
+    """Yield sequence records from a FASTA file."""
+    current_header = None
+    current_seq = []
+    
+    for line in iter_file_lines(fasta_path):
+        line = line.strip()
+        if line.startswith('>'):
+            if current_header:
+                yield {
+                    'header': current_header,
+                    'sequence': ''.join(current_seq)
+                }
+            current_header = line[1:]
+            current_seq = []
+        else:
+            current_seq.append(line)
+    
+    if current_header:
+        yield {
+            'header': current_header,
+            'sequence': ''.join(current_seq)
+        }
+
+def parse_fasta(fasta_path, limit=20):
+    """Parse FASTA file and return sequence records."""
+    return take(iter_fasta(fasta_path), limit)
+
+def iter_bed(bed_path):
+    """Yield features from a BED file, stopping at the first blank line."""
+    for line in iter_file_lines(bed_path):
+        if not line.strip():
+            break
         
-        html_content += """
-                        </tbody>
-                    </table>
-                </div>
-"""
-    else:
-        html_content += '                <div class="no-data">No CDS coordinates found</div>\n'
+        parts = line.split('\t')
+        if len(parts) >= 6:
+            yield {
+                'chrom': parts[0],
+                'start': parts[1],
+                'end': parts[2],
+                'name': parts[3],
+                'score': parts[4],
+                'strand': parts[5]
+            }
+
+def parse_bed(bed_path, limit=50):
+    """Parse BED file."""
+    return take(iter_bed(bed_path), limit)
+
+def iter_trna_scan(trna_path):
+    """Yield hits from a tRNAscan-SE output file."""
+    for line in iter_file_lines(trna_path):
+        line = line.strip()
+        if not line or line.startswith('Sequence') or line.startswith('Name') or line.startswith('---'):
+            continue
+        
+        # tRNAscan output is space-delimited
+        parts = line.split()
+        if len(parts) >= 9:
+            yield {
+                'sequence': parts[0],
+                'trna_num': parts[1],
+                'begin': parts[2],
+                'end': parts[3],
+                'type': parts[4],
+                'anticodon': parts[5] if len(parts) > 5 else 'N/A',
+                'intron_begin': parts[6] if len(parts) > 6 else '0',
+                'intron_end': parts[7] if len(parts) > 7 else '0',
+                'score': parts[8] if len(parts) > 8 else 'N/A'
+            }
+
+def parse_trna_scan(trna_path, limit=None):
+    """Parse tRNAscan-SE output file."""
+    return take(iter_trna_scan(trna_path), limit)
+
+def iter_cmscan(cmscan_path):
+    """Yield hits from a cmscan table."""
+    for line in iter_file_lines(cmscan_path):
+        if line.startswith('#') or not line.strip():
+            continue
+        
+        parts = line.split()
+        if len(parts) >= 18:
+            yield {
+                'target': parts[0],
+                'accession': parts[1],
+                'query': parts[2],
+                'e_value': parts[15],
+                'score': parts[14],
+                'bias': parts[16]
+            }
+
+def parse_cmscan(cmscan_path, limit=50):
+    """Parse cmscan table output."""
+    return take(iter_cmscan(cmscan_path), limit)
+
+def iter_hmmscan(hmmscan_path):
+    """Yield domain hits from an hmmscan domain table."""
+    for line in iter_file_lines(hmmscan_path):
+        if line.startswith('#') or not line.strip():
+            continue
+        
+        parts = line.split()
+        if len(parts) >= 23:
+            yield {
+                'target': parts[0],
+                'accession': parts[1],
+                'query': parts[3],
+                'e_value': parts[12],
+                'score': parts[13],
+                'description': ' '.join(parts[22:]) if len(parts) > 22 else 'N/A'
+            }
+
+def parse_hmmscan(hmmscan_path, limit=50):
+    """Parse hmmscan domain table output."""
+    return take(iter_hmmscan(hmmscan_path), limit)
+
+def iter_fimo_tsv(fimo_path):
+    """Yield motif sites from a FIMO TSV file."""
+    lines = iter_file_lines(fimo_path)
+    next(lines, None)  # Skip header
+    for line in lines:
+        if not line.strip():
+            continue
+        
+        parts = line.split('\t')
+        if len(parts) >= 9:
+            yield {
+                'motif_id': parts[0],
+                'motif_alt_id': parts[1],
+                'sequence_name': parts[2],
+                'start': parts[3],
+                'stop': parts[4],
+                'strand': parts[5],
+                'score': parts[6],
+                'p_value': parts[7],
+                'q_value': parts[8],
+                'matched_sequence': parts[9] if len(parts) > 9 else 'N/A'
+            }
+
+def parse_fimo_tsv(fimo_path, limit=100):
+    """Parse FIMO TSV output."""
+    return take(iter_fimo_tsv(fimo_path), limit)
+
+def species_needles(basename):
+    """Return ((needle, replacement), ...) used to italicise the genome name."""
+    # Try to extract genus and species from basename
+    parts = basename.replace('_', ' ').split()
+    if len(parts) < 2:
+        return ()
+    italic = f"<em>{html.escape(parts[0])} {html.escape(parts[1])}</em>"
+    spaced = html.escape(basename.replace('_', ' '))
+    return tuple((needle, italic) for needle in dict.fromkeys((spaced, html.escape(basename))))
+
+class SidecarPages:
+    """Write one table section's rows to paged, columnar sidecar scripts."""
     
-    html_content += '            </div>\n'
+    def __init__(self, data_dir, section, page_size=PAGE_SIZE):
+        self.data_dir = Path(data_dir)
+        self.section = section
+        self.fields = [field for _, field, _, _ in TABLE_COLUMNS[section]]
+        self.page_size = page_size
+        self.pages = 0
+        self.rows = 0
+        self._buffer = []
     
-    # Section 5: Upstream Sequences
-    html_content += """
-            <div class="section">
-                <h2>⬆️ Upstream Sequences (200bp)</h2>
-"""
+    def add(self, row):
+        self._buffer.append(row)
+        self.rows += 1
+        if len(self._buffer) >= self.page_size:
+            self.flush()
     
-    if upstream_seqs:
-        html_content += f'                <p>Showing {len(upstream_seqs)} upstream sequences:</p>\n'
-        
-        for i, seq in enumerate(upstream_seqs, 1):
-            seq_preview = seq['sequence'][:100] + ('...' if len(seq['sequence']) > 100 else '')
-            html_content += f"""
-                <h3>Upstream {i}: {html.escape(seq['header'][:80])}</h3>
-                <div class="sequence">{html.escape(seq_preview)}</div>
-"""
-    else:
-        html_content += '                <div class="no-data">No upstream sequences found</div>\n'
+    def flush(self):
+        """Write the buffered rows as the next page, one list per column."""
+        if not self._buffer:
+            return
+        data = {field: [row[field] for row in self._buffer] for field in self.fields}
+        page_path = self.data_dir / f"{self.section}.{self.pages:05d}.js"
+        with open(page_path, 'w', encoding='utf-8') as f:
+            f.write(SIDECAR_PAGE.format(section=json.dumps(self.section), page=self.pages,
+                                        data=json.dumps(data, ensure_ascii=False, separators=(',', ':'))))
+        self.pages += 1
+        self._buffer = []
+
+class ReportWriter:
+    """Write report templates straight to an open file.
+
+    Values are HTML-escaped and the genome name is italicised once, as each
+    value is inserted, so the finished document is never held in memory.
+    With a data_dir, tables are written in full: the first page is inlined
+    and every page goes to a sidecar script the report loads on demand.
+    """
     
-    html_content += '            </div>\n'
+    def __init__(self, out, basename, data_dir=None):
+        self.out = out
+        self.needles = species_needles(basename)
+        self.data_dir = Path(data_dir) if data_dir else None
     
-    # Section 6: tRNA Results
-    html_content += """
-            <div class="section">
-                <h2>🧵 tRNA Scan Results</h2>
-"""
+    @property
+    def full_tables(self):
+        return self.data_dir is not None
     
-    if trna_results:
-        html_content += """
-                <div class="table-container">
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Sequence</th>
-                                <th>tRNA #</th>
-                                <th>Begin</th>
-                                <th>End</th>
-                                <th>Type</th>
-                                <th>Anticodon</th>
-                                <th>Score</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-"""
-        
-        for trna in trna_results:
-            html_content += f"""
-                            <tr>
-                                <td>{html.escape(trna['sequence'])}</td>
-                                <td>{html.escape(trna['trna_num'])}</td>
-                                <td>{html.escape(trna['begin'])}</td>
-                                <td>{html.escape(trna['end'])}</td>
-                                <td><span class="badge badge-success">{html.escape(trna['type'])}</span></td>
-                                <td>{html.escape(trna['anticodon'])}</td>
-                                <td>{html.escape(trna['score'])}</td>
-                            </tr>
-"""
-        
-        html_content += """
-                        </tbody>
-                    </table>
-                </div>
-"""
-    else:
-        html_content += '                <div class="no-data">No tRNA results found</div>\n'
+    def value(self, text):
+        """Escape one value for insertion and italicise the genome name in it."""
+        text = html.escape(str(text))
+        for needle, italic in self.needles:
+            if needle in text:
+                text = text.replace(needle, italic)
+        return text
     
-    html_content += '            </div>\n'
+    def write(self, template, **fields):
+        """Fill a template with escaped values and write it out."""
+        self.out.write(template.format(**{key: self.value(val) for key, val in fields.items()}))
     
-    # Section 7: ncRNA Results
-    html_content += """
-            <div class="section">
-                <h2>🎯 ncRNA Scan Results (cmscan)</h2>
-"""
+    def write_raw(self, template, **fields):
+        """Fill a template with values that are already valid HTML."""
+        self.out.write(template.format(**fields))
     
-    if cmscan_results:
-        html_content += """
-                <div class="table-container">
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Target</th>
-                                <th>Accession</th>
-                                <th>Query</th>
-                                <th>E-value</th>
-                                <th>Score</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-"""
-        
-        for result in cmscan_results:
-            html_content += f"""
-                            <tr>
-                                <td>{html.escape(result['target'])}</td>
-                                <td>{html.escape(result['accession'])}</td>
-                                <td>{html.escape(result['query'])}</td>
-                                <td>{html.escape(result['e_value'])}</td>
-                                <td>{html.escape(result['score'])}</td>
-                            </tr>
-"""
-        
-        html_content += """
-                        </tbody>
-                    </table>
-                </div>
-"""
-    else:
-        html_content += '                <div class="no-data">No ncRNA results found</div>\n'
+    def write_row(self, columns, row):
+        """Write one table row, truncating each cell to its column width."""
+        cells = []
+        for _, field, kind, width in columns:
+            text = str(row[field])
+            cells.append(CELL_TEMPLATES[kind].format(self.value(text[:width] if width else text)))
+        self.out.write(ROW_OPEN + ''.join(cells) + ROW_CLOSE)
     
-    html_content += '            </div>\n'
+    def write_table(self, section, rows, empty_message):
+        """Write a table with one row per record, or a no-data note if there are none.
+        
+        Rows are capped by ROW_LIMITS unless tables are being written in full.
+        """
+        columns = TABLE_COLUMNS[section]
+        rows = iter(rows)
+        if not self.full_tables:
+            rows = islice(rows, ROW_LIMITS[section])
+        first = next(rows, None)
+        if first is None:
+            self.write(NO_DATA, message=empty_message)
+            return
+        
+        header_cells = ''.join(TABLE_HEADER_CELL.format(html.escape(h)) for h, _, _, _ in columns)
+        self.write_raw(TABLE_OPEN, header_cells=header_cells)
+        sidecar = SidecarPages(self.data_dir, section) if self.full_tables else None
+        
+        for row in chain([first], rows):
+            if sidecar is None:
+                self.write_row(columns, row)
+                continue
+            if sidecar.rows < sidecar.page_size:
+                self.write_row(columns, row)
+            sidecar.add(row)
+        self.out.write(TABLE_CLOSE)
+        
+        if sidecar is not None:
+            sidecar.flush()
+            if sidecar.pages > 1:
+                self.write_raw(PAGER, section=section, data_dir=html.escape(self.data_dir.name),
+                               pages=sidecar.pages, rows=sidecar.rows)
     
-    # Section 8: Transcription Factors
-    html_content += """
-            <div class="section">
-                <h2>🔬 Transcription Factor Predictions (hmmscan)</h2>
-"""
+    def write_sequences(self, section, label, what, records, empty_message):
+        """Write sequence previews (first 100 residues), or a full paged table of them."""
+        if self.full_tables:
+            rows = ({'number': i, 'header': r['header'], 'length': len(r['sequence']),
+                     'sequence': r['sequence']} for i, r in enumerate(records, 1))
+            self.write_table(section, rows, empty_message)
+            return
+        
+        records = take(records, ROW_LIMITS[section])
+        if not records:
+            self.write(NO_DATA, message=empty_message)
+            return
+        
+        self.write(SEQUENCE_INTRO, count=len(records), what=what)
+        for i, record in enumerate(records, 1):
+            seq_preview = record['sequence'][:100] + ('...' if len(record['sequence']) > 100 else '')
+            self.write(SEQUENCE_BLOCK, label=label, number=i,
+                       header=record['header'][:80], sequence=seq_preview)
     
-    if hmmscan_results:
-        html_content += """
-                <div class="table-container">
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Target Domain</th>
-                                <th>Accession</th>
-                                <th>Protein Query</th>
-                                <th>E-value</th>
-                                <th>Score</th>
-                                <th>Description</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-"""
-        
-        for result in hmmscan_results:
-            html_content += f"""
-                            <tr>
-                                <td><span class="badge badge-warning">{html.escape(result['target'])}</span></td>
-                                <td>{html.escape(result['accession'])}</td>
-                                <td>{html.escape(result['query'])}</td>
-                                <td>{html.escape(result['e_value'])}</td>
-                                <td>{html.escape(result['score'])}</td>
-                                <td>{html.escape(result['description'][:60])}</td>
-                            </tr>
-"""
-        
-        html_content += """
-                        </tbody>
-                    </table>
-                </div>
-"""
+    def write_pager_script(self):
+        """Write the script that pages sidecar data into the tables."""
+        columns = {section: [[field, kind, width] for _, field, kind, width in cols]
+                   for section, cols in TABLE_COLUMNS.items()}
+        self.out.write(PAGER_SCRIPT % {
+            'columns': json.dumps(columns),
+            'italics': json.dumps([list(pair) for pair in self.needles]).replace('</', '<\\/'),
+            'page_size': PAGE_SIZE,
+        })
+
+@lru_cache(maxsize=None)
+def find_screenshots(screenshot_dir="report_assets"):
+    """Return {name: filename} for optional pipeline screenshots (scanned once per process)."""
+    screenshots = {}
+    screenshot_dir = Path(screenshot_dir)
+    if screenshot_dir.exists():
+        for img_file in screenshot_dir.glob("*.png"):
+            screenshots[img_file.stem] = img_file.name
+    return screenshots
+
+def write_report_body(writer, basename, prokka_dir):
+    """Stream every report section into the writer, parsing inputs as they are needed."""
+    
+    # Section 1: Overview
+    writer.write(SECTION_OPEN, title="📊 Annotation Overview")
+    prokka_stats = parse_prokka_stats(prokka_dir / f"{basename}.txt")
+    if prokka_stats:
+        writer.out.write(STATS_OPEN)
+        key_stats = ['organism', 'contigs', 'bases', 'CDS', 'rRNA', 'tRNA']
+        for key in key_stats:
+            for stat_key, stat_value in prokka_stats.items():
+                if key.lower() in stat_key.lower():
+                    writer.write(STAT_CARD, label=stat_key, value=stat_value)
+                    break
+        writer.out.write(STATS_CLOSE)
     else:
-        html_content += '                <div class="no-data">No transcription factor hits found</div>\n'
+        writer.write(NO_DATA, message="No Prokka statistics found")
+    writer.out.write(SECTION_CLOSE)
     
-    html_content += '            </div>\n'
+    # Section 2: Gene Annotations
+    writer.write(SECTION_OPEN, title="🧬 Gene Annotations")
+    writer.write_table('gff', iter_prokka_gff(prokka_dir / f"{basename}.gff"),
+                       "No gene annotations found")
+    writer.out.write(SECTION_CLOSE)
     
-    # Section 9: Motif Locations (FIMO)
-    html_content += """
-            <div class="section">
-                <h2>🎨 Regulatory Motif Locations (FIMO)</h2>
-"""
+    # Section 3: Protein Sequences
+    writer.write(SECTION_OPEN, title="🔬 Protein Sequences")
+    writer.write_sequences('proteins', "Protein", "of the annotated proteins",
+                           iter_fasta(prokka_dir / f"{basename}.faa"), "No protein sequences found")
+    writer.out.write(SECTION_CLOSE)
     
-    if fimo_results:
-        html_content += """
-                <div class="table-container">
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Motif ID</th>
-                                <th>Sequence Name</th>
-                                <th>Start</th>
-                                <th>Stop</th>
-                                <th>Strand</th>
-                                <th>Score</th>
-                                <th>P-value</th>
-                                <th>Q-value</th>
-                                <th>Matched Sequence</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-"""
-        
-        for result in fimo_results:
-            html_content += f"""
-                            <tr>
-                                <td><span class="badge badge-info">{html.escape(result['motif_id'])}</span></td>
-                                <td>{html.escape(result['sequence_name'][:30])}</td>
-                                <td>{html.escape(result['start'])}</td>
-                                <td>{html.escape(result['stop'])}</td>
-                                <td>{html.escape(result['strand'])}</td>
-                                <td>{html.escape(result['score'])}</td>
-                                <td>{html.escape(result['p_value'])}</td>
-                                <td>{html.escape(result['q_value'])}</td>
-                                <td><code>{html.escape(result['matched_sequence'])}</code></td>
-                            </tr>
-"""
-        
-        html_content += """
-                        </tbody>
-                    </table>
-                </div>
-"""
-    else:
-        html_content += '                <div class="no-data">No motif locations found (MEME may have been skipped or found no significant motifs)</div>\n'
+    # Section 4: CDS Coordinates
+    writer.write(SECTION_OPEN, title="📍 CDS Coordinates")
+    writer.write_table('bed', iter_bed(prokka_dir / f"{basename}.cds.bed"),
+                       "No CDS coordinates found")
+    writer.out.write(SECTION_CLOSE)
     
-    html_content += '            </div>\n'
+    # Section 5: Upstream Sequences
+    writer.write(SECTION_OPEN, title="⬆️ Upstream Sequences (200bp)")
+    upstream_fa = prokka_dir / f"{basename}.upstream.200.clean.fa"
+    if not upstream_fa.exists():
+        # Results from before the in-process extractor
+        upstream_fa = prokka_dir / f"{basename}.upstream.200.fa"
+    writer.write_sequences('upstream', "Upstream", "upstream sequences",
+                           iter_fasta(upstream_fa), "No upstream sequences found")
+    writer.out.write(SECTION_CLOSE)
+    
+    # Section 6: tRNA Results
+    writer.write(SECTION_OPEN, title="🧵 tRNA Scan Results")
+    writer.write_table('trna', iter_trna_scan(prokka_dir / f"{basename}.tRNAscan.out"),
+                       "No tRNA results found")
+    writer.out.write(SECTION_CLOSE)
+    
+    # Section 7: ncRNA Results
+    writer.write(SECTION_OPEN, title="🎯 ncRNA Scan Results (cmscan)")
+    writer.write_table('cmscan', iter_cmscan(prokka_dir / f"{basename}.cmscan.tbl"),
+                       "No ncRNA results found")
+    writer.out.write(SECTION_CLOSE)
+    
+    # Section 8: Transcription Factors
+    writer.write(SECTION_OPEN, title="🔬 Transcription Factor Predictions (hmmscan)")
+    writer.write_table('hmmscan', iter_hmmscan(prokka_dir / f"{basename}.pfam.domtblout"),
+                       "No transcription factor hits found")
+    writer.out.write(SECTION_CLOSE)
+    
+    # Section 9: Motif Locations (FIMO)
+    writer.write(SECTION_OPEN, title="🎨 Regulatory Motif Locations (FIMO)")
+    writer.write_table('fimo', iter_fimo_tsv(prokka_dir / "fimo_out" / "fimo.tsv"),
+                       "No motif locations found (MEME may have been skipped or found no significant motifs)")
+    writer.out.write(SECTION_CLOSE)
     
     # Section 10: Screenshots (if available)
+    screenshots = find_screenshots()
     if screenshots:
-        html_content += """
-            <div class="section">
-                <h2>📸 Pipeline Screenshots</h2>
-"""
-        
+        writer.write(SECTION_OPEN, title="📸 Pipeline Screenshots")
         for name, filename in screenshots.items():
-            html_content += f"""
-                <h3>{html.escape(name.replace('_', ' '))}</h3>
-                <img src="../../../report_assets/{filename}" alt="{html.escape(name)}" class="screenshot">
-"""
-        
-        html_content += '            </div>\n'
+            writer.write(SCREENSHOT, name=name.replace('_', ' '), filename=filename, alt=name)
+        writer.out.write(SECTION_CLOSE)
+
+def generate_html_report(basename, full_tables=False):
+    """Generate the complete HTML report.
     
-    # Footer
-    html_content += f"""
-        </div>
-        
-        <footer>
-            <p><strong>Prokaryotic Genome Annotation Pipeline</strong></p>
-            <p>Report generated on {datetime.now().strftime('%Y-%m-%d at %H:%M:%S')}</p>
-            <p>Genome: <em>{species_name}</em></p>
-        </footer>
-    </div>
-</body>
-</html>
-"""
+    With full_tables, every table holds all rows: page data is written to
+    <basename>_report_data/ next to the report and loaded as it is paged.
+    """
     
-    # Italicize species name throughout
-    html_content = italicize_species_name(html_content, basename)
+    # Define paths
+    results_dir = Path(f"results/{basename}")
+    prokka_dir = results_dir / "prokka_output"
+    report_path = results_dir / f"{basename}_Annotation_Report.html"
+    data_dir = results_dir / f"{basename}_report_data" if full_tables else None
     
-    # Write HTML file
+    # Check if directories exist
+    if not results_dir.exists():
+        print(f"Error: Results directory not found: {results_dir}")
+        return False
+    
+    print(f"Parsing annotation data for {basename}...")
+    
+    species_name = basename.replace('_', ' ')
+    tmp_path = report_path.with_name(report_path.name + '.tmp')
+    
+    # Sections are parsed and written one at a time; the temporary file is
+    # only renamed into place once the whole report has been written
     try:
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        if data_dir is not None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+            data_dir.mkdir(parents=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            writer = ReportWriter(f, basename, data_dir)
+            writer.write_raw(HTML_HEAD, title=html.escape(species_name), css=REPORT_CSS,
+                             species=writer.value(species_name))
+            write_report_body(writer, basename, prokka_dir)
+            if writer.full_tables:
+                writer.write_pager_script()
+            writer.write_raw(HTML_FOOT, species=writer.value(species_name),
+                             generated=datetime.now().strftime('%Y-%m-%d at %H:%M:%S'))
+        os.replace(tmp_path, report_path)
         print(f"✓ Report successfully generated: {report_path}")
         return True
     except Exception as e:
         print(f"✗ Error writing report: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
         return False
 
+def find_result_basenames(results_dir="results"):
+    """List genome basenames that have a Prokka output folder under results/."""
+    results_dir = Path(results_dir)
+    if not results_dir.exists():
+        return []
+    return sorted(p.name for p in results_dir.iterdir() if (p / "prokka_output").is_dir())
+
+def generate_reports_batch(basenames, workers=None, full_tables=False):
+    """Render many reports in one interpreter using a pool of worker processes.
+    
+    Returns the list of basenames whose report could not be generated.
+    """
+    if not basenames:
+        return []
+    workers = max(1, min(workers or os.cpu_count() or 1, len(basenames)))
+    render = partial(generate_html_report, full_tables=full_tables)
+    
+    if workers == 1:
+        results = [render(basename) for basename in basenames]
+    else:
+        # Workers are forked after REPORT_CSS is built, so they share it
+        with Pool(processes=workers) as pool:
+            results = pool.map(render, basenames, chunksize=1)
+    
+    return [basename for basename, ok in zip(basenames, results) if not ok]
+
+def batch_main(args, full_tables=False):
+    """Entry point for --batch [--workers N] [BASENAME ...]."""
+    workers = None
+    if '--workers' in args:
+        idx = args.index('--workers')
+        try:
+            workers = int(args[idx + 1])
+        except (IndexError, ValueError):
+            print("Error: --workers needs an integer value")
+            sys.exit(1)
+        args = args[:idx] + args[idx + 2:]
+    
+    basenames = args or find_result_basenames()
+    if not basenames:
+        print("No genomes found to report on (results/*/prokka_output)")
+        sys.exit(1)
+    
+    print(f"\n{'='*60}")
+    print(f"Generating HTML Reports for {len(basenames)} genome(s)")
+    print(f"{'='*60}\n")
+    
+    failed = generate_reports_batch(basenames, workers, full_tables)
+    
+    print(f"\n{'='*60}")
+    print(f"Reports generated: {len(basenames) - len(failed)}/{len(basenames)}")
+    for basename in failed:
+        print(f"  ✗ {basename}")
+    print(f"{'='*60}\n")
+    sys.exit(1 if failed else 0)
+
 def main():
     """Main entry point for the script."""
-    if len(sys.argv) != 2:
-        print("Usage: python3 generate_single_report.py BASENAME")
+    args = sys.argv[1:]
+    full_tables = '--full-tables' in args
+    if full_tables:
+        args.remove('--full-tables')
+    
+    if args and args[0] == '--batch':
+        batch_main(args[1:], full_tables)
+    
+    if len(args) != 1:
+        print("Usage: python3 generate_single_report.py [--full-tables] BASENAME")
+        print("       python3 generate_single_report.py [--full-tables] --batch [--workers N] [BASENAME ...]")
         sys.exit(1)
     
-    basename = sys.argv[1]
+    basename = args[0]
     
     print(f"\n{'='*60}")
     print(f"Generating HTML Report for: {basename}")
     print(f"{'='*60}\n")
     
-    success = generate_html_report(basename)
+    success = generate_html_report(basename, full_tables)
     
     if success:
         print(f"\n{'='*60}")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+Streaming FASTA Normaliser
+
+Replaces the awk header cleaner of step 1 and the samtools faidx call of
+step 2. Records are renamed to contig_1, contig_2, ... in input order, every
+character outside [ACGTNacgtn] is deleted with a translation table, and the
+sequence is written in fixed-width lines as it is read, so no contig is ever
+held in memory. The samtools-compatible .fai index is written in the same
+pass. Records left empty after cleaning are dropped.
+
+Usage: python3 normalize_fasta.py INPUT.fna OUTPUT.fna [--line-width 60] [--prefix contig_]
+"""
+
+import os
+import sys
+import argparse
+
+# Every byte except A/C/G/T/N (either case), for bytes.translate(None, ...)
+NON_NUCLEOTIDE = bytes(b for b in range(256) if b not in b'ACGTNacgtn')
+
+class ContigWriter:
+    """Writes one renamed record in fixed-width lines and tracks its .fai entry."""
+
+    def __init__(self, out, name, line_width):
+        self.out = out
+        self.name = name
+        self.line_width = line_width
+        self.length = 0
+        self.offset = None
+        self.pending = b''
+
+    def add(self, seq):
+        """Append cleaned bases, writing every complete line."""
+        if not seq:
+            return
+        if self.offset is None:
+            # Header is written with the first bases, so empty records leave no trace
+            self.out.write(f">{self.name}\n".encode())
+            self.offset = self.out.tell()
+        self.length += len(seq)
+        data = self.pending + seq
+        full = len(data) - len(data) % self.line_width
+        width = self.line_width
+        if full:
+            self.out.write(b''.join(data[i:i + width] + b'\n' for i in range(0, full, width)))
+        self.pending = data[full:]
+
+    def close(self):
+        """Flush the last partial line; returns the .fai line, or None if the record is empty."""
+        if self.pending:
+            self.out.write(self.pending + b'\n')
+        if self.length == 0:
+            return None
+        # samtools reports the real line length for records shorter than one line
+        line_bases = min(self.line_width, self.length)
+        return f"{self.name}\t{self.length}\t{self.offset}\t{line_bases}\t{line_bases + 1}\n"
+
+def normalize_fasta(input_path, output_path, line_width=60, prefix="contig_"):
+    """Clean and rename input_path into output_path plus output_path.fai.
+
+    Returns (number of contigs, total bases).
+    """
+    fai_lines = []
+    total_bp = 0
+    contig_num = 0
+    record = None
+
+    def finish(record):
+        nonlocal total_bp
+        entry = record.close()
+        if entry:
+            fai_lines.append(entry)
+            total_bp += record.length
+
+    with open(input_path, 'rb') as src, open(output_path, 'wb') as out:
+        for line in src:
+            if line.startswith(b'>'):
+                if record is not None:
+                    finish(record)
+                contig_num += 1
+                record = ContigWriter(out, f"{prefix}{contig_num}", line_width)
+            elif record is not None:
+                record.add(line.translate(None, NON_NUCLEOTIDE))
+        if record is not None:
+            finish(record)
+
+    with open(f"{output_path}.fai", 'w') as fai:
+        fai.writelines(fai_lines)
+
+    return len(fai_lines), total_bp
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Rename, clean and index a FASTA file in one pass.")
+    parser.add_argument('input', help="FASTA file to clean")
+    parser.add_argument('output', help="cleaned FASTA file to write (OUTPUT.fai is written next to it)")
+    parser.add_argument('--line-width', type=int, default=60, help="bases per sequence line (default 60)")
+    parser.add_argument('--prefix', default="contig_", help="prefix of the new record names (default contig_)")
+    args = parser.parse_args()
+
+    if args.line_width < 1:
+        parser.error("--line-width must be at least 1")
+
+    try:
+        contigs, total_bp = normalize_fasta(args.input, args.output, args.line_width, args.prefix)
+    except OSError as e:
+        print(f"Error: could not normalise {args.input}: {e}", file=sys.stderr)
+        for path in (args.output, f"{args.output}.fai"):
+            if os.path.exists(path):
+                os.remove(path)
+        sys.exit(1)
+
+    print(f"{contigs}\t{total_bp}")
+
+if __name__ == "__main__":
+    main()
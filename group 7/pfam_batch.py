@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+"""
+Batched Pfam Domain Scan
+
+Step 9 used to start hmmscan once per genome, and each run loaded and scanned
+the whole Pfam-A.hmm. This script pools the proteomes of a batch into one
+FASTA file (IDs prefixed with the genome's index), runs a single search and
+splits the domain table back into one ${BASENAME}.pfam.domtblout per genome.
+
+Small batches use hmmscan, which gives exactly the per-genome result, run in
+concurrent shards of the pooled proteins (shard_search.py). Past
+--hmmsearch-at sequences it switches to hmmsearch, which streams the proteins
+once per profile and scales better with the query count; its rows are turned
+back into hmmscan's column layout, ordering and profile descriptions. -Z is
+set to the number of Pfam profiles, so the full-sequence E-values are on
+hmmscan's scale. hmmscan's domZ is the number of profiles a protein hits
+significantly, which hmmsearch cannot know; --domZ is pinned to DOMZ instead
+of hmmsearch's count over the whole batch, so a genome's i-Evalues do not
+depend on the other genomes in the batch, but they can be lower than
+hmmscan's for proteins that hit several families.
+
+Usage: python3 pfam_batch.py --db Pfam-A.hmm [--cpu N] [--mode auto|hmmscan|hmmsearch] [--max-shards N]
+                             --genome NAME PROTEOME OUTPUT [--genome ...]
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+
+from ref_index import ReferenceIndex
+from shard_search import SHARD_CPU, run_sharded
+
+# Queries above which hmmsearch beats hmmscan for a Pfam-sized database
+HMMSEARCH_AT = 20000
+# Fixed domain-count correction for hmmsearch: most proteins hit one Pfam family
+DOMZ = 1
+# domtblout has 22 whitespace-separated fields before the free-text description
+DOMTBL_FIELDS = 22
+# Column header hmmscan writes; hmmsearch's names the columns the other way round
+HMMSCAN_HEADER = [
+    "#                                                                            --- full sequence --- -------------- this domain -------------   hmm coord   ali coord   env coord\n",
+    "# target name        accession   tlen query name           accession   qlen   E-value  score  bias   #  of  c-Evalue  i-Evalue  score  bias  from    to  from    to  from    to  acc description of target\n",
+    "#------------------- ---------- ----- -------------------- ---------- ----- --------- ------ ----- --- --- --------- --------- ------ ----- ----- ----- ----- ----- ----- ----- ---- ---------------------\n",
+]
+
+def pool_proteomes(genomes, pooled_path):
+    """Write every proteome into one FASTA with IDs prefixed "<index>|".
+
+    Returns (number of sequences, {pooled id: query order}).
+    """
+    order = {}
+    with open(pooled_path, 'w') as out:
+        for index, (_, proteome, _) in enumerate(genomes):
+            with open(proteome) as f:
+                for line in f:
+                    if line.startswith('>'):
+                        pooled_id = f"{index}|{line[1:].split(None, 1)[0]}"
+                        order[pooled_id] = len(order)
+                        out.write(f">{index}|{line[1:]}")
+                    else:
+                        out.write(line)
+    return len(order), order
+
+def run_search(mode, db_path, pooled_path, domtbl_path, cpu, shard_cpu=SHARD_CPU, max_shards=None):
+    """Run hmmscan (sharded) or hmmsearch on the pooled proteins."""
+    if mode == 'hmmscan':
+        cmd = ['hmmscan', '--cpu', '{threads}', '--domtblout', '{out}', '-o', os.devnull,
+               db_path, '{query}']
+        run_sharded(cmd, pooled_path, domtbl_path, cpu, shard_cpu, max_shards,
+                    tmpdir=os.path.dirname(pooled_path))
+    else:
+        cmd = ['hmmsearch', '--cpu', str(cpu), '--domtblout', domtbl_path, '-o', os.devnull,
+               '-Z', str(len(ReferenceIndex(db_path))), '--domZ', str(DOMZ), db_path, pooled_path]
+        subprocess.run(cmd, check=True)
+
+def iter_domtbl_rows(domtbl_path, mode, descriptions=None):
+    """Yield data rows as field lists in hmmscan layout (profile first, protein second)."""
+    with open(domtbl_path) as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            fields = line.rstrip('\n').split(None, DOMTBL_FIELDS)
+            if len(fields) < DOMTBL_FIELDS:
+                continue
+            if mode == 'hmmsearch':
+                # hmmsearch: protein, acc, len, profile, acc, len -> hmmscan order
+                fields[0:3], fields[3:6] = fields[3:6], fields[0:3]
+                # ... and the description is the protein's, not the profile's
+                description = descriptions.description(fields[0], '-')
+                fields[DOMTBL_FIELDS:] = [description or '-']
+            yield fields
+
+def split_domtbl(genomes, domtbl_path, mode, order, descriptions=None):
+    """Write each genome's rows, with its prefix removed, to its own domtblout."""
+    header = []
+    with open(domtbl_path) as f:
+        for line in f:
+            if not line.startswith('#'):
+                break
+            header.append(line)
+    if mode == 'hmmsearch':
+        header = HMMSCAN_HEADER
+
+    rows = [[] for _ in genomes]
+    for fields in iter_domtbl_rows(domtbl_path, mode, descriptions):
+        index, query = fields[3].split('|', 1)
+        rows[int(index)].append((fields, query))
+
+    for index, (_, _, output) in enumerate(genomes):
+        genome_rows = rows[index]
+        if mode == 'hmmsearch':
+            # hmmscan order: by query, then best full-sequence E-value, then domain number
+            genome_rows.sort(key=lambda r: (order.get(r[0][3], 0), float(r[0][6]), r[0][0], int(r[0][9])))
+        tmp = f"{output}.tmp"
+        with open(tmp, 'w') as out:
+            out.writelines(header)
+            for fields, query in genome_rows:
+                fields[3] = query
+                out.write(' '.join(fields) + '\n')
+        os.replace(tmp, output)
+
+def scan_batch(genomes, db_path, cpu=1, mode='auto', hmmsearch_at=HMMSEARCH_AT, tmpdir=None,
+               shard_cpu=SHARD_CPU, max_shards=None):
+    """Scan all genomes' proteomes in one search; returns the mode used."""
+    workdir = tempfile.mkdtemp(prefix="pfam_batch.", dir=tmpdir)
+    try:
+        pooled_path = os.path.join(workdir, "pooled.faa")
+        domtbl_path = os.path.join(workdir, "pooled.domtblout")
+        n_seqs, order = pool_proteomes(genomes, pooled_path)
+        if mode == 'auto':
+            mode = 'hmmsearch' if n_seqs >= hmmsearch_at else 'hmmscan'
+        print(f"Scanning {n_seqs} proteins from {len(genomes)} genome(s) with {mode}", file=sys.stderr)
+        run_search(mode, db_path, pooled_path, domtbl_path, cpu, shard_cpu, max_shards)
+        descriptions = ReferenceIndex(db_path) if mode == 'hmmsearch' else None
+        split_domtbl(genomes, domtbl_path, mode, order, descriptions)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return mode
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Scan several proteomes against Pfam in one batch.")
+    parser.add_argument('--db', required=True, help="Pfam-A.hmm (hmmpress'ed for hmmscan)")
+    parser.add_argument('--cpu', type=int, default=1)
+    parser.add_argument('--mode', choices=('auto', 'hmmscan', 'hmmsearch'), default='auto')
+    parser.add_argument('--hmmsearch-at', type=int, default=HMMSEARCH_AT,
+                        help=f"switch to hmmsearch from this many proteins (default {HMMSEARCH_AT})")
+    parser.add_argument('--shard-cpu', type=int, default=SHARD_CPU,
+                        help=f"hmmscan threads per shard (default {SHARD_CPU})")
+    parser.add_argument('--max-shards', type=int, default=None,
+                        help="upper limit on concurrent hmmscan shards, e.g. from the memory budget")
+    parser.add_argument('--tmpdir', default=None, help="where to write the pooled FASTA")
+    parser.add_argument('--genome', nargs=3, action='append', required=True,
+                        metavar=('NAME', 'PROTEOME', 'OUTPUT'))
+    args = parser.parse_args()
+
+    try:
+        scan_batch(args.genome, args.db, args.cpu, args.mode, args.hmmsearch_at, args.tmpdir,
+                   args.shard_cpu, args.max_shards)
+    except (OSError, sqlite3.Error, subprocess.CalledProcessError) as e:
+        print(f"Error: batched Pfam scan failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+"""
+Reference Index
+
+Pfam-A.hmm and Rfam.cm are hundreds of MB of text, and every run that needed
+a profile's description or the number of profiles used to read the whole
+file again. This module compiles the NAME/ACC/DESC records of an HMMER or
+Infernal database once into <db>.index.sqlite, a table with a covering index
+on the profile name, so a lookup reads a few index pages.
+
+The index records the schema version and the size and mtime of the database
+it was built from. Readers check these and rebuild if the database has been
+replaced, e.g. by a new Pfam release. Builds take an exclusive lock and
+rename the finished file into place; readers open it read-only, so every
+genome job uses the same file and shares its page cache.
+
+Usage:
+    python3 ref_index.py build Pfam-A.hmm [Rfam.cm ...]
+    python3 ref_index.py lookup Pfam-A.hmm NAME...
+"""
+
+import os
+import sys
+import fcntl
+import sqlite3
+import argparse
+
+# 2: indexes written by group 8's old inline copy lacked the accession column
+SCHEMA_VERSION = 2
+
+def source_stamp(db_path):
+    """What the index must have been built from: schema, size and mtime of the database."""
+    st = os.stat(db_path)
+    return f"{SCHEMA_VERSION} {st.st_size} {st.st_mtime_ns}"
+
+def index_path(db_path):
+    return f"{db_path}.index.sqlite"
+
+def iter_profiles(db_path):
+    """(name, accession, description) of every profile in an HMMER or Infernal file."""
+    seen = set()
+    name = accession = description = None
+    with open(db_path, errors='replace') as f:
+        for line in f:
+            if line.startswith('NAME '):
+                name = line[5:].strip()
+            elif line.startswith('ACC '):
+                accession = line[4:].strip()
+            elif line.startswith('DESC '):
+                description = line[5:].strip()
+            elif line.startswith('//'):
+                # Infernal files repeat NAME in the HMM filter section; keep the first
+                if name is not None and name not in seen:
+                    seen.add(name)
+                    yield name, accession or '-', description or ''
+                name = accession = description = None
+
+def build_index(db_path):
+    """Compile db_path into its index file (written under a temporary name)."""
+    tmp = f"{index_path(db_path)}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("CREATE TABLE profiles (name TEXT, accession TEXT, description TEXT)")
+        conn.executemany("INSERT INTO profiles VALUES (?, ?, ?)", iter_profiles(db_path))
+        conn.execute("CREATE INDEX profiles_by_name ON profiles (name, accession, description)")
+        count = conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+        conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                         [('source', source_stamp(db_path)), ('profiles', str(count))])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, index_path(db_path))
+
+class ReferenceIndex:
+    """Read-only view of a database's compiled profile index."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = self._open_checked()
+        if self.conn is None:
+            with open(f"{index_path(db_path)}.lock", 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                # Another job may have built it while we waited
+                self.conn = self._open_checked()
+                if self.conn is None:
+                    build_index(db_path)
+                    self.conn = self._open_checked()
+        if self.conn is None:
+            raise OSError(f"could not build the index of {db_path}")
+        self._cache = {}
+
+    def _open_checked(self):
+        """The index opened read-only, or None if it is missing or out of date."""
+        try:
+            conn = sqlite3.connect(f"file:{index_path(self.db_path)}?mode=ro", uri=True)
+        except sqlite3.Error:
+            return None
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+            if row and row[0] == source_stamp(self.db_path):
+                return conn
+        except sqlite3.Error:
+            pass
+        conn.close()
+        return None
+
+    def __len__(self):
+        return int(self.conn.execute("SELECT value FROM meta WHERE key = 'profiles'").fetchone()[0])
+
+    def lookup(self, name):
+        """(accession, description) of a profile, or None."""
+        if name not in self._cache:
+            self._cache[name] = self.conn.execute(
+                "SELECT accession, description FROM profiles WHERE name = ?", (name,)).fetchone()
+        return self._cache[name]
+
+    def description(self, name, default=None):
+        row = self.lookup(name)
+        return row[1] if row else default
+
+    def close(self):
+        self.conn.close()
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Compile and query reference profile indexes.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help="build (or check) the index of each database")
+    p.add_argument('databases', nargs='+')
+    p = sub.add_parser('lookup', help="print accession and description of profiles")
+    p.add_argument('database')
+    p.add_argument('names', nargs='+')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'build':
+            for db_path in args.databases:
+                index = ReferenceIndex(db_path)
+                print(f"{index_path(db_path)}: {len(index)} profiles")
+                index.close()
+        else:
+            index = ReferenceIndex(args.database)
+            for name in args.names:
+                row = index.lookup(name)
+                print('\t'.join((name,) + row) if row else f"{name}\tnot found")
+            index.close()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error: reference index failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
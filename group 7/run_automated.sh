@@ -49,9 +49,54 @@ OUTPUT_DIR="results"
 DB_DIR="data/dbs"
 LOG_DIR="logs"
 UPSTREAM_LENGTH=200
-CPU_CORES=6
 
-mkdir -p "$OUTPUT_DIR" "$LOG_DIR"
+# Global resource budget shared by all genomes running at the same time
+CPU_CORES=${CPU_CORES:-$(nproc 2>/dev/null || echo 6)}
+MEMORY_GB=${MEMORY_GB:-$(awk '/^MemAvailable:/ {printf "%d", $2 / 1048576}' /proc/meminfo 2>/dev/null || echo 8)}
+[ "${MEMORY_GB:-0}" -ge 1 ] 2>/dev/null || MEMORY_GB=8
+# How many genomes may be in flight at once (0 = a quarter of the cores, at least 1)
+MAX_PARALLEL_GENOMES=${MAX_PARALLEL_GENOMES:-0}
+# Cores given to each multithreaded step (prokka, cmscan, hmmscan, meme -p);
+# 0 = split CPU_CORES between the genomes running at once, leaving room for
+# two multithreaded steps of the same genome to run side by side
+THREADED_STEP_CORES=${THREADED_STEP_CORES:-0}
+# Cores per hmmscan shard in the batched Pfam scan (shard_search.py); the
+# pooled proteins are split into CPU_CORES / PFAM_SHARD_CORES shards
+PFAM_SHARD_CORES=${PFAM_SHARD_CORES:-4}
+# From this many proteins over all genomes of the run, step 9 uses hmmsearch
+PFAM_HMMSEARCH_AT=${PFAM_HMMSEARCH_AT:-20000}
+
+# Peak memory (GB) reserved while each tool runs
+PROKKA_MEM_GB=2
+CMSCAN_MEM_GB=2
+HMMSCAN_MEM_GB=2    # per hmmscan process, so per Pfam shard
+MEME_MEM_GB=2
+SINGLE_STEP_MEM_GB=1
+
+# Content-addressed step cache (step_cache.py): steps whose inputs, tool
+# version and parameters are unchanged are restored instead of re-run.
+# STEP_CACHE=0 always recomputes.
+STEP_CACHE=${STEP_CACHE:-1}
+export STEP_CACHE_DIR=${STEP_CACHE_DIR:-.step_cache}
+export STEP_CACHE_MAX_GB=${STEP_CACHE_MAX_GB:-50}
+
+# Per-step telemetry (step_metrics.py): wall and CPU time, peak RSS and I/O of
+# every tool run go to logs/metrics/run_<start>.jsonl, profiled at the end of
+# the run. STEP_METRICS=0 runs the tools unwrapped.
+STEP_METRICS=${STEP_METRICS:-1}
+METRICS_DIR="$LOG_DIR/metrics"
+RUN_ID=$(date +%Y%m%d_%H%M%S)
+METRICS_FILE="$METRICS_DIR/run_${RUN_ID}.jsonl"
+
+# Files Prokka writes as <prefix>.<ext>
+PROKKA_EXTENSIONS=(gff gbk fna faa ffn sqn fsa tbl err log txt tsv)
+
+# Genomes whose HTML report is rendered in one batch at the end of the run
+REPORT_QUEUE=()
+# 1 = keep every table row in the reports (paged from <genome>_report_data/)
+REPORT_FULL_TABLES=${REPORT_FULL_TABLES:-0}
+
+mkdir -p "$OUTPUT_DIR" "$LOG_DIR" "$METRICS_DIR"
 
 # ============================================================================
 # 📝 LOGGING FUNCTIONS
@@ -126,6 +171,170 @@ print_genome_header() {
     echo ""
 }
 
+# ============================================================================
+# 🎛️ RESOURCE SCHEDULER
+# ============================================================================
+# Free cores and memory live in one file guarded by flock, so every genome
+# job (a background subshell) draws from the same budget. Multithreaded steps
+# ask for THREADED_STEP_CORES, single-threaded steps for one core, and a step
+# waits until its share is free - short single-core steps fill the gaps
+# left between the big ones.
+RUN_DIR=""
+
+init_resources() {
+    RUN_DIR=$(mktemp -d "${TMPDIR:-/tmp}/genome_pipeline.XXXXXX")
+    echo "$CPU_CORES $MEMORY_GB" > "$RUN_DIR/free"
+    : > "$RUN_DIR/lock"
+}
+
+cleanup_resources() {
+    [ -n "$RUN_DIR" ] && rm -rf "$RUN_DIR"
+}
+
+acquire_resources() {
+    local cores=$1
+    local mem_gb=$2
+    
+    # A request larger than the whole budget would never be granted
+    [ "$cores" -gt "$CPU_CORES" ] && cores=$CPU_CORES
+    [ "$mem_gb" -gt "$MEMORY_GB" ] && mem_gb=$MEMORY_GB
+    
+    while true; do
+        if (
+            flock 9
+            read -r free_cores free_mem < "$RUN_DIR/free"
+            [ "$free_cores" -ge "$cores" ] && [ "$free_mem" -ge "$mem_gb" ] || exit 1
+            echo "$((free_cores - cores)) $((free_mem - mem_gb))" > "$RUN_DIR/free"
+        ) 9>>"$RUN_DIR/lock"; then
+            return 0
+        fi
+        sleep 1
+    done
+}
+
+release_resources() {
+    local cores=$1
+    local mem_gb=$2
+    
+    [ "$cores" -gt "$CPU_CORES" ] && cores=$CPU_CORES
+    [ "$mem_gb" -gt "$MEMORY_GB" ] && mem_gb=$MEMORY_GB
+    
+    (
+        flock 9
+        read -r free_cores free_mem < "$RUN_DIR/free"
+        echo "$((free_cores + cores)) $((free_mem + mem_gb))" > "$RUN_DIR/free"
+    ) 9>>"$RUN_DIR/lock"
+}
+
+# Usage: run_with_resources CORES MEM_GB command [args...]
+# Runs the command once its cores and memory are free; returns its exit code
+run_with_resources() {
+    local cores=$1
+    local mem_gb=$2
+    shift 2
+    
+    local queued=$(date +%s.%N)
+    acquire_resources "$cores" "$mem_gb"
+    local rc=0
+    measured "$(( cores < CPU_CORES ? cores : CPU_CORES ))" "$mem_gb" "$queued" "$@" || rc=$?
+    release_resources "$cores" "$mem_gb"
+    return $rc
+}
+
+# Usage: measured CORES MEM_GB QUEUED command [args...]
+# Runs the command under step_metrics.py, which appends one record for the
+# current genome (BASENAME) and step (STEP_NAME) to METRICS_FILE. QUEUED is
+# when the step asked for resources, so waiting shows up in the profile.
+measured() {
+    local cores=$1
+    local mem_gb=$2
+    local queued=$3
+    shift 3
+    
+    if [ "$STEP_METRICS" = "1" ]; then
+        python3 step_metrics.py run --metrics "$METRICS_FILE" \
+            --genome "${BASENAME:-all}" --step "${STEP_NAME:-$(basename "$1")}" \
+            --cores "$cores" --mem-gb "$mem_gb" --queued "$queued" -- "$@"
+    else
+        "$@"
+    fi
+}
+
+# ============================================================================
+# 🗄️ STEP CACHE
+# ============================================================================
+# Version line of a tool, looked up once per run
+tool_version() {
+    local tool=$1
+    local version_file="$RUN_DIR/${tool}.version"
+    
+    if [ ! -s "$version_file" ]; then
+        case "$tool" in
+            cmscan|hmmscan|hmmsearch) "$tool" -h 2>&1 | sed -n 2p > "$version_file" ;;
+            tRNAscan-SE)    "$tool" -h 2>&1 | grep -m1 "tRNAscan-SE" > "$version_file" ;;
+            meme)           "$tool" -version 2>&1 | head -n 1 > "$version_file" ;;
+            *)              "$tool" --version 2>&1 | head -n 1 > "$version_file" ;;
+        esac
+    fi
+    cat "$version_file"
+}
+
+# Usage: cache_key TOOL PARAMS INPUT...   (prints nothing when caching is off)
+cache_key() {
+    [ "$STEP_CACHE" = "1" ] || return 0
+    local tool=$1
+    local params=$2
+    shift 2
+    python3 step_cache.py key --tool="$tool" --version="$(tool_version "$tool")" --params="$params" "$@" 2>/dev/null || true
+}
+
+# Usage: cached_run KEY ROOT OUTPUT... -- command [args...]
+# On a hit the OUTPUTs (paths relative to ROOT) are restored as hard links and
+# CACHE_HIT=1. Otherwise stale outputs are removed first - so a cached object
+# is never rewritten in place - the command runs, and its outputs are stored
+# if it succeeds. Returns the command's exit code.
+cached_run() {
+    local key=$1
+    local root=$2
+    shift 2
+    local outputs=()
+    while [ $# -gt 0 ] && [ "$1" != "--" ]; do
+        outputs+=("$1")
+        shift
+    done
+    shift
+    
+    CACHE_HIT=0
+    if [ "$STEP_CACHE" = "1" ] && [ -n "$key" ] && python3 step_cache.py restore "$key" "$root" "${outputs[@]}" 2>/dev/null; then
+        CACHE_HIT=1
+        return 0
+    fi
+    
+    local output
+    for output in "${outputs[@]}"; do
+        rm -rf "${root:?}/${output}"
+    done
+    
+    local rc=0
+    "$@" || rc=$?
+    if [ $rc -eq 0 ] && [ "$STEP_CACHE" = "1" ] && [ -n "$key" ]; then
+        python3 step_cache.py store "$key" "$root" "${outputs[@]}" 2>/dev/null || true
+    fi
+    return $rc
+}
+
+log_cache_hit() {
+    if [ "${CACHE_HIT:-0}" = "1" ]; then
+        log_info "${CHECK} $1 unchanged since an earlier run - restored from the step cache"
+    fi
+}
+
+# Reports are rendered in one batch after all genomes finish; each genome job
+# runs in its own subshell, so the queue is kept as marker files
+queue_report() {
+    : > "$RUN_DIR/$1.report"
+}
+
 # ============================================================================
 # 🧬 FASTA CLEANING FUNCTIONS
 # ============================================================================
@@ -135,36 +344,16 @@ clean_fasta_headers() {
     
     log_processing "Cleaning FASTA headers and normalizing sequences..."
     
-    awk '
-    BEGIN { 
-        contig_num = 0
-        current_seq = ""
-        current_header = ""
-    }
-    /^>/ {
-        if (current_header != "") {
-            print current_header
-            print current_seq
-        }
-        contig_num++
-        current_header = ">contig_" contig_num
-        current_seq = ""
-        next
-    }
-    {
-        gsub(/[^ACGTNacgtn]/, "", $0)
-        current_seq = current_seq $0
-    }
-    END {
-        if (current_header != "") {
-            print current_header
-            print current_seq
-        }
-    }
-    ' "$input_file" > "$output_file"
-    
-    if [ -s "$output_file" ]; then
-        local num_seqs=$(grep -c "^>" "$output_file" 2>/dev/null || echo 0)
+    # Streams the genome once: renames contigs, drops non-ACGTN characters,
+    # writes 60 bp lines and the samtools-compatible ${output_file}.fai
+    local summary
+    if ! summary=$(run_with_resources 1 "$SINGLE_STEP_MEM_GB" python3 normalize_fasta.py "$input_file" "$output_file" 2>&1); then
+        log_error "FASTA cleaning failed: ${summary}"
+        return 1
+    fi
+    
+    if [ -s "$output_file" ] && [ -s "${output_file}.fai" ]; then
+        local num_seqs=$(echo "$summary" | cut -f1)
         local file_size=$(du -h "$output_file" 2>/dev/null | cut -f1 || echo "?")
         log_success "FASTA cleaned: ${num_seqs} contigs, ${file_size} total size"
         return 0
@@ -174,74 +363,16 @@ clean_fasta_headers() {
     fi
 }
 
-clean_upstream_for_meme() {
-    local input_fa=$1
-    local output_fa=$2
-    
-    log_processing "Filtering upstream sequences for MEME (minimum 50bp required)..."
-    
-    awk '
-    BEGIN { seq_count = 0; current_seq = ""; current_header = "" }
-    /^>/ {
-        if (length(current_seq) >= 50) {
-            print current_header
-            print current_seq
-            seq_count++
-        }
-        current_header = ">upstream_" (seq_count + 1)
-        current_seq = ""
-        next
-    }
-    {
-        gsub(/[^ACGTacgt]/, "N", $0)
-        current_seq = current_seq toupper($0)
-    }
-    END {
-        if (length(current_seq) >= 50) {
-            print current_header
-            print current_seq
-            seq_count++
-        }
-    }
-    ' "$input_fa" > "$output_fa"
-    
-    local seq_count=$(grep -c "^>" "$output_fa" 2>/dev/null || echo 0)
-    
-    if [ "$seq_count" -ge 3 ]; then
-        log_success "Prepared ${seq_count} sequences for MEME motif discovery"
-        return 0
-    else
-        log_warning "Only ${seq_count} sequences found (MEME requires at least 3)"
-        return 1
-    fi
-}
-
 # ============================================================================
-# 🧬 MAIN GENOME PROCESSING FUNCTION (BULLETPROOF!)
+# 🧬 PER-GENOME STEPS
 # ============================================================================
-process_single_genome() {
-    local genome_file=$1
-    local genome_num=$2
-    local total_genomes=$3
-    
-    local filename=$(basename "$genome_file")
-    local BASENAME="${filename%.*}"
-    
-    local genome_status="SUCCESS"
-    
-    print_genome_header "$BASENAME" "$genome_num" "$total_genomes"
-    
-    local OUTDIR="$OUTPUT_DIR/${BASENAME}"
-    mkdir -p "$OUTDIR" || true
-    
-    local CLEAN_GENOME="$OUTDIR/${BASENAME}_clean.fna"
-    local PROKKA_DIR="$OUTDIR/prokka_output"
-    
-    local start_time=$(date +%s)
-    
-    # ========================================================================
+# Each step is a function step_<name> that sees the genome's paths set up in
+# process_single_genome. Exit codes: 0 = done, 1 = genome failed,
+# 2 = stop here and keep the genome as a partial result. Steps that depend
+# on a step which did not finish with 0 are skipped.
+
+step_clean() {
     # STEP 1: Clean FASTA
-    # ========================================================================
     log_step "1" "FASTA Header Cleaning & Sequence Normalization ${DNA}"
     
     if clean_fasta_headers "$genome_file" "$CLEAN_GENOME"; then
@@ -249,80 +380,77 @@ process_single_genome() {
         log_info "Cleaned file: $(du -h "$CLEAN_GENOME" 2>/dev/null | cut -f1 || echo "?")"
     else
         log_error "Cannot continue without cleaned FASTA. Skipping this genome."
-        genome_status="FAILED"
         return 1
     fi
     
-    # ========================================================================
     # STEP 2: Index Genome
-    # ========================================================================
-    log_step "2" "Genome Indexing with samtools faidx ${GENE}"
+    log_step "2" "Genome Indexing ${GENE}"
     
-    log_processing "Creating genome index for fast sequence retrieval..."
+    log_processing "Checking the genome index written during cleaning..."
     
-    if samtools faidx "$CLEAN_GENOME" 2>"$LOG_DIR/${BASENAME}_samtools.log"; then
+    if [ -s "${CLEAN_GENOME}.fai" ]; then
         local num_contigs=$(wc -l < "${CLEAN_GENOME}.fai" 2>/dev/null || echo 0)
         local total_bp=$(awk '{sum+=$2} END {print sum}' "${CLEAN_GENOME}.fai" 2>/dev/null || echo 0)
         local total_mbp=$(echo "scale=2; $total_bp/1000000" | bc 2>/dev/null || echo "?")
         log_success "Indexed ${num_contigs} contig(s), total size: ${total_mbp} Mbp"
     else
-        log_error "Genome indexing failed"
-        genome_status="FAILED"
+        log_error "Genome index ${CLEAN_GENOME}.fai is missing"
         return 1
     fi
-    
-    # ========================================================================
+}
+
+step_prokka() {
     # STEP 3: Prokka Annotation (CONDA VERSION - NO DOCKER!)
-    # ========================================================================
     log_step "3" "Gene Annotation with Prokka (Conda) ${BACTERIA}"
     
     log_info "Running Prokka annotation pipeline..."
     log_info "This step identifies: CDS, rRNA, tRNA, and other features"
-    log_processing "Processing with ${CPU_CORES} CPU cores (may take 5-15 minutes)..."
+    log_processing "Processing with ${THREADED_STEP_CORES} CPU cores (may take 5-15 minutes)..."
     
     # Create output directory
     mkdir -p "$PROKKA_DIR"
     
+    local prokka_outputs=("${PROKKA_EXTENSIONS[@]/#/${BASENAME}.}")
+    local prokka_key=$(cache_key prokka "--kingdom Bacteria --prefix ${BASENAME}" "$CLEAN_GENOME")
+    
     # Run Prokka directly (no Docker, no sudo!)
-    if prokka \
+    if cached_run "$prokka_key" "$PROKKA_DIR" "${prokka_outputs[@]}" -- \
+        run_with_resources "$THREADED_STEP_CORES" "$PROKKA_MEM_GB" prokka \
         --outdir "$PROKKA_DIR" \
         --prefix "$BASENAME" \
-        --cpus "$CPU_CORES" \
+        --cpus "$THREADED_STEP_CORES" \
         --kingdom Bacteria \
         --force \
         "$CLEAN_GENOME" \
         > "$LOG_DIR/${BASENAME}_prokka_full.log" 2>&1; then
-        
+        log_cache_hit "Genome"
+    
         if [ -f "$PROKKA_DIR/${BASENAME}.gff" ]; then
             local gene_count=$(grep -c "CDS" "$PROKKA_DIR/${BASENAME}.gff" 2>/dev/null || echo 0)
             local rrna_count=$(grep -c "rRNA" "$PROKKA_DIR/${BASENAME}.gff" 2>/dev/null || echo 0)
             local trna_count=$(grep -c "tRNA" "$PROKKA_DIR/${BASENAME}.gff" 2>/dev/null || echo 0)
-            
+    
             log_success "Prokka annotation completed!"
             log_info "${GENE} Genes (CDS): ${gene_count}"
             log_info "${DNA} rRNA genes: ${rrna_count}"
             log_info "${DNA} tRNA genes: ${trna_count}"
         else
             log_error "Prokka output file missing!"
-            genome_status="FAILED"
             return 1
         fi
     else
         log_error "Prokka execution failed!"
-        genome_status="FAILED"
         return 1
     fi
     
     # NO STEP 4 NEEDED! (No Docker = No permission issues!)
     log_info "${TOOLS} No permission fixes needed (Conda version)"
-    
-    # ========================================================================
+}
+
+step_cds() {
     # STEP 5: Extract CDS
-    # ========================================================================
     log_step "5" "Extracting Coding Sequences (CDS) ${GENE}"
     
-    local CDS_BED="$PROKKA_DIR/${BASENAME}.cds.bed"
-    
     log_processing "Converting GFF annotations to BED format..."
     
     awk '$3=="CDS"{
@@ -340,168 +468,138 @@ process_single_genome() {
         log_success "Extracted ${cds_count} CDS features"
     else
         log_error "CDS extraction failed"
-        genome_status="FAILED"
         return 1
     fi
-    
-    # ========================================================================
-    # STEP 6-14: Rest of the steps remain EXACTLY the same
-    # ========================================================================
-    
+}
+
+step_upstream() {
     # STEP 6: Extract Upstream Sequences
     log_step "6" "Extracting Upstream Regulatory Regions ${DNA}"
     
-    local UPSTREAM_BED="$PROKKA_DIR/${BASENAME}.upstream.bed"
-    local UPSTREAM_FA="$PROKKA_DIR/${BASENAME}.upstream.${UPSTREAM_LENGTH}.fa"
-    local UPSTREAM_CLEAN_FA="$PROKKA_DIR/${BASENAME}.upstream.${UPSTREAM_LENGTH}.clean.fa"
-    
-    log_processing "Extracting ${UPSTREAM_LENGTH}bp upstream of each gene..."
+    log_processing "Extracting ${UPSTREAM_LENGTH}bp upstream of each gene (minimum 50bp kept for MEME)..."
     
-    if bedtools flank -i "$CDS_BED" -g "${CLEAN_GENOME}.fai" -l "$UPSTREAM_LENGTH" -r 0 -s > "$UPSTREAM_BED" 2>"$LOG_DIR/${BASENAME}_bedtools_flank.log"; then
-        log_success "Generated upstream coordinates"
+    local upstream_count
+    if upstream_count=$(run_with_resources 1 "$SINGLE_STEP_MEM_GB" python3 extract_upstream.py "$CLEAN_GENOME" "$CDS_BED" "$UPSTREAM_CLEAN_FA" \
+        --length "$UPSTREAM_LENGTH" --min-length 50 2>"$LOG_DIR/${BASENAME}_upstream.log"); then
+        log_success "Extracted ${upstream_count} upstream sequences"
     else
-        log_error "bedtools flank failed"
-        genome_status="FAILED"
+        log_error "Upstream extraction failed"
         return 1
     fi
-    
-    if bedtools getfasta -fi "$CLEAN_GENOME" -bed "$UPSTREAM_BED" -s -fo "$UPSTREAM_FA" 2>"$LOG_DIR/${BASENAME}_bedtools_getfasta.log"; then
-        local seq_count=$(grep -c "^>" "$UPSTREAM_FA" 2>/dev/null || echo 0)
-        log_success "Extracted ${seq_count} upstream sequences"
-    else
-        log_error "bedtools getfasta failed"
-        genome_status="FAILED"
-        return 1
-    fi
-    
+}
+
+step_trna() {
     # STEP 7: tRNA Scanning
     log_step "7" "Scanning for tRNA Genes ${DNA}"
     
-    local TRNA_OUT="$PROKKA_DIR/${BASENAME}.tRNAscan.out"
-    
     log_searching "Running tRNAscan-SE in bacterial mode..."
     
-    if tRNAscan-SE -B -o "$TRNA_OUT" "$CLEAN_GENOME" 2>"$LOG_DIR/${BASENAME}_tRNAscan.log"; then
+    local trna_key=$(cache_key tRNAscan-SE "-B" "$CLEAN_GENOME")
+    
+    if cached_run "$trna_key" "$PROKKA_DIR" "$(basename "$TRNA_OUT")" -- \
+        run_with_resources 1 "$SINGLE_STEP_MEM_GB" tRNAscan-SE -B -o "$TRNA_OUT" "$CLEAN_GENOME" 2>"$LOG_DIR/${BASENAME}_tRNAscan.log"; then
+        log_cache_hit "Genome"
         local trna_count=$(grep -cv "^-\|^Sequence\|^Name\|^---" "$TRNA_OUT" 2>/dev/null || echo 0)
         log_success "tRNA scan completed: ${trna_count} tRNAs identified"
     else
         log_warning "tRNAscan-SE encountered issues (non-critical)"
     fi
-    
+}
+
+step_cmscan() {
     # STEP 8: ncRNA Scanning
     log_step "8" "Scanning for Non-Coding RNAs ${DNA}"
     
-    local CMSCAN_OUT="$PROKKA_DIR/${BASENAME}.cmscan.tbl"
-    
-    log_searching "Running cmscan against Rfam database with ${CPU_CORES} cores..."
+    log_searching "Running cmscan against Rfam database with ${THREADED_STEP_CORES} cores..."
     log_info "Searching for riboswitches, sRNAs, and regulatory RNAs..."
     
-    if cmscan --cpu "$CPU_CORES" --tblout "$CMSCAN_OUT" "$DB_DIR/Rfam.cm" "$CLEAN_GENOME" > "$LOG_DIR/${BASENAME}_cmscan.log" 2>&1; then
+    local cmscan_key=$(cache_key cmscan "--tblout" "$DB_DIR/Rfam.cm" "$CLEAN_GENOME")
+    
+    if cached_run "$cmscan_key" "$PROKKA_DIR" "$(basename "$CMSCAN_OUT")" -- \
+        run_with_resources "$THREADED_STEP_CORES" "$CMSCAN_MEM_GB" cmscan --cpu "$THREADED_STEP_CORES" --tblout "$CMSCAN_OUT" "$DB_DIR/Rfam.cm" "$CLEAN_GENOME" > "$LOG_DIR/${BASENAME}_cmscan.log" 2>&1; then
+        log_cache_hit "Genome and Rfam database"
         local ncrna_count=$(grep -cv "^#" "$CMSCAN_OUT" 2>/dev/null || echo 0)
         log_success "ncRNA scan completed: ${ncrna_count} hits found"
     else
         log_warning "cmscan had issues (non-critical)"
     fi
-    
-    # STEP 9: Transcription Factor Scanning
-    log_step "9" "Scanning for Transcription Factors ${GENE}"
-    
-    local PROTEOME="$PROKKA_DIR/${BASENAME}.faa"
-    local PFAM_OUT="$PROKKA_DIR/${BASENAME}.pfam.domtblout"
-    
-    log_searching "Running hmmscan against Pfam database with ${CPU_CORES} cores..."
-    log_info "Identifying DNA-binding domains and regulatory proteins..."
-    
-    if [ -f "$PROTEOME" ]; then
-        if hmmscan --cpu "$CPU_CORES" --domtblout "$PFAM_OUT" "$DB_DIR/Pfam-A.hmm" "$PROTEOME" > "$LOG_DIR/${BASENAME}_hmmscan.log" 2>&1; then
-            local tf_count=$(grep -cv "^#" "$PFAM_OUT" 2>/dev/null || echo 0)
-            log_success "Protein domain scan completed: ${tf_count} domain hits"
-        else
-            log_warning "hmmscan had issues (non-critical)"
-        fi
-    else
-        log_warning "Proteome file not found, skipping hmmscan"
-    fi
-    
+}
+
+step_meme() {
     # STEP 10: MEME Motif Discovery
     log_step "10" "Discovering Regulatory Motifs with MEME ${FIRE}"
     
-    local MEME_DIR="$PROKKA_DIR/meme_out"
-    local MEME_XML="$MEME_DIR/meme.xml"
+    local upstream_count=$(grep -c "^>" "$UPSTREAM_CLEAN_FA" 2>/dev/null || echo 0)
     
-    if ! clean_upstream_for_meme "$UPSTREAM_FA" "$UPSTREAM_CLEAN_FA"; then
+    if [ "$upstream_count" -ge 3 ]; then
+        log_success "Prepared ${upstream_count} sequences for MEME motif discovery"
+    else
+        log_warning "Only ${upstream_count} sequences found (MEME requires at least 3)"
         log_warning "Insufficient sequences for MEME - skipping motif discovery"
+        # meme.txt may be a hard link into the step cache: replace it, never write through it
+        rm -rf "$MEME_DIR"
         mkdir -p "$MEME_DIR" || true
         echo "# MEME skipped: insufficient sequences" > "$MEME_DIR/meme.txt"
-        
-        log_info "Generating partial report without motif analysis..."
-        python3 generate_single_report.py "$BASENAME" 2>/dev/null || log_warning "Report generation had issues"
-        
-        genome_status="PARTIAL"
         log_warning "Genome processed partially (no motif analysis)"
-        return 0
+        return 2
     fi
     
-    log_processing "Running MEME motif discovery with ${CPU_CORES} cores..."
+    log_processing "Running MEME motif discovery with ${THREADED_STEP_CORES} cores..."
     log_info "${FIRE} This is the most intensive step - may take 10-30 minutes!"
     log_info "MEME is searching for conserved DNA sequence patterns..."
     
-    if meme "$UPSTREAM_CLEAN_FA" \
+    local meme_opts=(-dna -mod zoops -nmotifs 10 -minw 6 -maxw 20 -revcomp -maxsize 1000000)
+    local meme_key=$(cache_key meme "${meme_opts[*]}" "$UPSTREAM_CLEAN_FA")
+    
+    if cached_run "$meme_key" "$PROKKA_DIR" "$(basename "$MEME_DIR")" -- \
+        run_with_resources "$THREADED_STEP_CORES" "$MEME_MEM_GB" meme "$UPSTREAM_CLEAN_FA" \
         -oc "$MEME_DIR" \
-        -dna \
-        -mod zoops \
-        -nmotifs 10 \
-        -minw 6 \
-        -maxw 20 \
-        -revcomp \
-        -maxsize 1000000 \
-        -p "$CPU_CORES" \
+        "${meme_opts[@]}" \
+        -p "$THREADED_STEP_CORES" \
         > "$LOG_DIR/${BASENAME}_meme.log" 2>&1; then
-        
+        log_cache_hit "Upstream sequences"
+    
         if [ -f "$MEME_XML" ]; then
             local motif_count=$(grep -c "<motif " "$MEME_XML" 2>/dev/null || echo 0)
             log_success "MEME completed: ${motif_count} motifs discovered!"
         else
             log_warning "MEME did not produce expected output"
-            python3 generate_single_report.py "$BASENAME" 2>/dev/null || true
-            genome_status="PARTIAL"
-            return 0
+            return 2
         fi
     else
         log_warning "MEME execution encountered errors"
-        python3 generate_single_report.py "$BASENAME" 2>/dev/null || true
-        genome_status="PARTIAL"
-        return 0
+        return 2
     fi
-    
+}
+
+step_fimo() {
     # STEP 11: FIMO Motif Scanning
     log_step "11" "Scanning for Motif Occurrences with FIMO ${SEARCH}"
     
-    local FIMO_DIR="$PROKKA_DIR/fimo_out"
-    local FIMO_TSV="$FIMO_DIR/fimo.tsv"
-    
     log_searching "Mapping discovered motifs across the genome..."
     
-    if fimo --oc "$FIMO_DIR" --thresh 0.0001 "$MEME_XML" "$UPSTREAM_CLEAN_FA" > "$LOG_DIR/${BASENAME}_fimo.log" 2>&1; then
+    local fimo_key=$(cache_key fimo "--thresh 0.0001" "$MEME_XML" "$UPSTREAM_CLEAN_FA")
+    
+    if cached_run "$fimo_key" "$PROKKA_DIR" "$(basename "$FIMO_DIR")" -- \
+        run_with_resources 1 "$SINGLE_STEP_MEM_GB" fimo --oc "$FIMO_DIR" --thresh 0.0001 "$MEME_XML" "$UPSTREAM_CLEAN_FA" > "$LOG_DIR/${BASENAME}_fimo.log" 2>&1; then
+        log_cache_hit "Motifs and upstream sequences"
         if [ -f "$FIMO_TSV" ]; then
             local site_count=$(($(wc -l < "$FIMO_TSV" 2>/dev/null || echo 1) - 1))
             log_success "FIMO completed: ${site_count} regulatory sites identified"
         else
             log_error "FIMO output missing"
-            genome_status="PARTIAL"
-            return 0
+            return 2
         fi
     else
         log_error "FIMO execution failed"
-        genome_status="PARTIAL"
-        return 0
+        return 2
     fi
-    
+}
+
+step_fimo_gff() {
     # STEP 12: Convert FIMO to GFF
     log_step "12" "Converting FIMO Results to GFF Format ${FILE}"
     
-    local FIMO_GFF="$PROKKA_DIR/${BASENAME}.fimo_upstream.gff"
-    
     log_processing "Creating standardized GFF3 annotation file..."
     
     awk 'NR>1 && $9 != "nan" {
@@ -516,12 +614,12 @@ process_single_genome() {
         log_warning "No significant motifs to convert (setting empty marker)"
         echo "# No significant motifs found" > "$FIMO_GFF"
     fi
-    
+}
+
+step_merge() {
     # STEP 13: Merge Annotations
     log_step "13" "Merging Annotations ${FOLDER}"
     
-    local MERGED_GFF="$OUTDIR/${BASENAME}_regulatory_merged.gff"
-    
     log_processing "Combining gene annotations with regulatory elements..."
     
     cat "$PROKKA_DIR/${BASENAME}.gff" "$FIMO_GFF" > "$MERGED_GFF" 2>/dev/null || true
@@ -531,21 +629,238 @@ process_single_genome() {
         log_success "Final annotation created: ${merged_size}"
     else
         log_error "Failed to merge annotations"
-        genome_status="FAILED"
         return 1
     fi
+}
+
+# Step graph: "step:dependency,dependency". tRNAscan-SE and cmscan only need
+# the cleaned genome and the upstream -> MEME -> FIMO chain is independent of
+# both, so they run side by side. The Pfam scan (step 9) is not in the graph:
+# it runs once for all genomes in run_pfam_batch.
+GENOME_STEPS=(
+    "clean:"
+    "prokka:clean"
+    "trna:clean"
+    "cmscan:clean"
+    "cds:prokka"
+    "upstream:cds"
+    "meme:upstream"
+    "fimo:meme"
+    "fimo_gff:fimo"
+    "merge:fimo_gff"
+)
+
+# ============================================================================
+# 🕸️ STEP GRAPH EXECUTOR
+# ============================================================================
+# Starts every step whose dependencies have finished, as a background job,
+# and waits for any job to end before looking again. Each step's output is
+# buffered in STEP_DIR and appended to the genome log in one piece when the
+# step ends, so the log stays readable. Sets genome_status for the caller.
+run_step_graph() {
+    local -A deps=()
+    local -A state=()
+    local -A started=()
+    local -A pid_of=()
+    local order=()
+    local entry name
+    
+    for entry in "${GENOME_STEPS[@]}"; do
+        name="${entry%%:*}"
+        order+=("$name")
+        deps[$name]="${entry#*:}"
+        state[$name]="pending"
+    done
     
-    # STEP 14: Generate HTML Report
-    log_step "14" "Generating Comprehensive HTML Report ${CHART}"
+    while true; do
+        # Launch ready steps and skip those whose dependencies can no longer finish
+        local dep ready blocked
+        for name in "${order[@]}"; do
+            [ "${state[$name]}" = "pending" ] || continue
+            ready=1
+            blocked=0
+            for dep in ${deps[$name]//,/ }; do
+                case "${state[$dep]}" in
+                    done) ;;
+                    failed|stopped|skipped) blocked=1 ;;
+                    *) ready=0 ;;
+                esac
+            done
+            if [ "$blocked" -eq 1 ]; then
+                state[$name]="skipped"
+                echo "skipped" > "$STEP_DIR/${name}.status"
+            elif [ "$ready" -eq 1 ]; then
+                STEP_NAME=$name "step_${name}" > "$STEP_DIR/${name}.out" 2>&1 &
+                pid_of[$name]=$!
+                started[$name]=$(date +%s)
+                state[$name]="running"
+                echo "running" > "$STEP_DIR/${name}.status"
+            fi
+        done
+    
+        local running=0
+        for name in "${order[@]}"; do
+            [ "${state[$name]}" = "running" ] && running=1
+        done
+        [ "$running" -eq 1 ] || break
+    
+        wait -n 2>/dev/null || true
+    
+        # Collect every step that has ended (wait returns its saved exit code)
+        local rc
+        for name in "${order[@]}"; do
+            [ "${state[$name]}" = "running" ] || continue
+            kill -0 "${pid_of[$name]}" 2>/dev/null && continue
+            rc=0
+            wait "${pid_of[$name]}" 2>/dev/null || rc=$?
+            case "$rc" in
+                0) state[$name]="done" ;;
+                2) state[$name]="stopped" ;;
+                *) state[$name]="failed" ;;
+            esac
+            echo "${state[$name]} $(( $(date +%s) - started[$name] ))s" > "$STEP_DIR/${name}.status"
+            cat "$STEP_DIR/${name}.out"
+        done
+    done
+    
+    genome_status="SUCCESS"
+    for name in "${order[@]}"; do
+        case "${state[$name]}" in
+            failed) genome_status="FAILED" ;;
+            stopped) [ "$genome_status" = "SUCCESS" ] && genome_status="PARTIAL" ;;
+        esac
+    done
+}
+
+# ============================================================================
+# 🏷️ BATCHED PFAM SCAN (step 9, once for all genomes)
+# ============================================================================
+# Pools the proteomes of every genome whose result is not in the step cache
+# and scans them in one pfam_batch.py run, so Pfam-A.hmm is loaded once per
+# batch instead of once per genome. The batch gets the whole core budget.
+# hmmscan and hmmsearch give different domain tables, so the mode is chosen
+# from all genomes of the run, passed to pfam_batch.py and is part of every
+# genome's cache key.
+run_pfam_batch() {
+    local batch_args=()
+    local batch_keys=()
+    local batch_outputs=()
+    local name proteome pfam_out key
+    local pfam_mode=hmmscan
+    local n_proteins=0
+    
+    log_step "9" "Scanning for Transcription Factors ${GENE}"
+    log_info "Identifying DNA-binding domains and regulatory proteins..."
+    
+    for name in "$@"; do
+        proteome="$OUTPUT_DIR/${name}/prokka_output/${name}.faa"
+        if [ -f "$proteome" ]; then
+            n_proteins=$(( n_proteins + $(grep -c '^>' "$proteome" || true) ))
+        fi
+    done
+    [ "$n_proteins" -ge "$PFAM_HMMSEARCH_AT" ] && pfam_mode=hmmsearch
+    
+    for name in "$@"; do
+        proteome="$OUTPUT_DIR/${name}/prokka_output/${name}.faa"
+        pfam_out="$OUTPUT_DIR/${name}/prokka_output/${name}.pfam.domtblout"
+        
+        if [ ! -f "$proteome" ]; then
+            log_warning "Proteome file not found for ${name}, skipping hmmscan"
+            continue
+        fi
+        
+        key=$(cache_key "$pfam_mode" "--domtblout" "$DB_DIR/Pfam-A.hmm" "$proteome")
+        if [ "$STEP_CACHE" = "1" ] && [ -n "$key" ] && \
+            python3 step_cache.py restore "$key" "$(dirname "$pfam_out")" "$(basename "$pfam_out")" 2>/dev/null; then
+            log_info "${CHECK} ${name}: proteome and Pfam database unchanged - restored from the step cache"
+            continue
+        fi
+        
+        rm -f "$pfam_out"
+        batch_args+=(--genome "$name" "$proteome" "$pfam_out")
+        batch_keys+=("$key")
+        batch_outputs+=("$pfam_out")
+    done
     
-    log_processing "Creating interactive visualization and summary..."
+    if [ ${#batch_outputs[@]} -eq 0 ]; then
+        return 0
+    fi
     
-    if python3 generate_single_report.py "$BASENAME" 2>/dev/null; then
-        log_success "HTML report generated successfully!"
-        log_info "${FOLDER} Report location: ${OUTDIR}/${BASENAME}_Annotation_Report.html"
+    # Every concurrent shard loads its own copy of Pfam, so memory caps the shard count
+    local shards=$(( CPU_CORES / PFAM_SHARD_CORES ))
+    [ "$shards" -gt $(( MEMORY_GB / HMMSCAN_MEM_GB )) ] && shards=$(( MEMORY_GB / HMMSCAN_MEM_GB ))
+    [ "$shards" -lt 1 ] && shards=1
+    
+    log_searching "Scanning ${#batch_outputs[@]} proteome(s) against Pfam in one batch with ${CPU_CORES} cores (up to ${shards} shards)..."
+    
+    if STEP_NAME=pfam run_with_resources "$CPU_CORES" $(( shards * HMMSCAN_MEM_GB )) python3 pfam_batch.py \
+        --db "$DB_DIR/Pfam-A.hmm" --cpu "$CPU_CORES" --tmpdir "$RUN_DIR" --mode "$pfam_mode" \
+        --shard-cpu "$PFAM_SHARD_CORES" --max-shards "$shards" \
+        "${batch_args[@]}" > "$LOG_DIR/pfam_batch.log" 2>&1; then
+        local i tf_count
+        for i in "${!batch_outputs[@]}"; do
+            pfam_out="${batch_outputs[$i]}"
+            tf_count=$(grep -cv "^#" "$pfam_out" 2>/dev/null || echo 0)
+            log_success "$(basename "$pfam_out" .pfam.domtblout): ${tf_count} domain hits"
+            if [ "$STEP_CACHE" = "1" ] && [ -n "${batch_keys[$i]}" ]; then
+                python3 step_cache.py store "${batch_keys[$i]}" "$(dirname "$pfam_out")" "$(basename "$pfam_out")" 2>/dev/null || true
+            fi
+        done
     else
-        log_warning "Report generation had minor issues"
+        log_warning "Batched Pfam scan had issues (non-critical, see $LOG_DIR/pfam_batch.log)"
     fi
+}
+
+# ============================================================================
+# 🧬 MAIN GENOME PROCESSING FUNCTION (BULLETPROOF!)
+# ============================================================================
+process_single_genome() {
+    local genome_file=$1
+    local genome_num=$2
+    local total_genomes=$3
+    
+    local filename=$(basename "$genome_file")
+    local BASENAME="${filename%.*}"
+    
+    # genome_status belongs to the caller (run_genome_job), which records it
+    genome_status="SUCCESS"
+    
+    print_genome_header "$BASENAME" "$genome_num" "$total_genomes"
+    
+    local OUTDIR="$OUTPUT_DIR/${BASENAME}"
+    mkdir -p "$OUTDIR" || true
+    
+    # Paths shared by the step functions
+    local CLEAN_GENOME="$OUTDIR/${BASENAME}_clean.fna"
+    local PROKKA_DIR="$OUTDIR/prokka_output"
+    local CDS_BED="$PROKKA_DIR/${BASENAME}.cds.bed"
+    local UPSTREAM_CLEAN_FA="$PROKKA_DIR/${BASENAME}.upstream.${UPSTREAM_LENGTH}.clean.fa"
+    local TRNA_OUT="$PROKKA_DIR/${BASENAME}.tRNAscan.out"
+    local CMSCAN_OUT="$PROKKA_DIR/${BASENAME}.cmscan.tbl"
+    local MEME_DIR="$PROKKA_DIR/meme_out"
+    local MEME_XML="$MEME_DIR/meme.xml"
+    local FIMO_DIR="$PROKKA_DIR/fimo_out"
+    local FIMO_TSV="$FIMO_DIR/fimo.tsv"
+    local FIMO_GFF="$PROKKA_DIR/${BASENAME}.fimo_upstream.gff"
+    local MERGED_GFF="$OUTDIR/${BASENAME}_regulatory_merged.gff"
+    
+    # Per-step output buffers and <step>.status files ("done 42s", "skipped", ...)
+    local STEP_DIR="$RUN_DIR/${BASENAME}.steps"
+    mkdir -p "$STEP_DIR"
+    
+    local start_time=$(date +%s)
+    
+    run_step_graph
+    
+    if [ "$genome_status" = "FAILED" ]; then
+        return 1
+    fi
+    
+    # STEP 14: Generate HTML Report
+    log_step "14" "Queueing Comprehensive HTML Report ${CHART}"
+    
+    queue_report "$BASENAME"
+    log_info "${FOLDER} Report will be written to: ${OUTDIR}/${BASENAME}_Annotation_Report.html"
     
     # ========================================================================
     # COMPLETION SUMMARY
@@ -576,6 +891,35 @@ process_single_genome() {
     return 0
 }
 
+# ============================================================================
+# 🧵 GENOME JOB (runs in the background, one per genome)
+# ============================================================================
+run_genome_job() {
+    local genome_file=$1
+    local genome_num=$2
+    local total_genomes=$3
+    
+    local filename=$(basename "$genome_file")
+    local BASENAME="${filename%.*}"
+    local genome_log="$LOG_DIR/${BASENAME}_pipeline.log"
+    local genome_status="FAILED"
+    local job_start=$(date +%s)
+    
+    log_info "${ROCKET} [${genome_num}/${total_genomes}] Started ${BASENAME} (log: ${genome_log})"
+    
+    if ! process_single_genome "$genome_file" "$genome_num" "$total_genomes" > "$genome_log" 2>&1; then
+        genome_status="FAILED"
+    fi
+    echo "$genome_status" > "$RUN_DIR/${BASENAME}.status"
+    
+    local elapsed=$(( $(date +%s) - job_start ))
+    case "$genome_status" in
+        SUCCESS) log_success "[${genome_num}/${total_genomes}] ${BASENAME} completed in $((elapsed / 60))m $((elapsed % 60))s" ;;
+        PARTIAL) log_warning "[${genome_num}/${total_genomes}] ${BASENAME} partially completed in $((elapsed / 60))m $((elapsed % 60))s" ;;
+        *)       log_error "[${genome_num}/${total_genomes}] ${BASENAME} failed after $((elapsed / 60))m $((elapsed % 60))s (see ${genome_log})" ;;
+    esac
+}
+
 # ============================================================================
 # 🚀 MAIN EXECUTION
 # ============================================================================
@@ -583,7 +927,7 @@ main() {
     print_banner
     
     log_info "Pipeline started at $(date)"
-    log_info "${COMPUTER} System: $(uname -s), CPU cores: ${CPU_CORES}"
+    log_info "${COMPUTER} System: $(uname -s), CPU cores: ${CPU_CORES}, memory budget: ${MEMORY_GB} GB"
     echo ""
     print_separator
     
@@ -614,12 +958,31 @@ main() {
         echo -e "  ${CYAN}${num}.${NC} ${name}"
     done
     
+    # Genomes in flight and the core share of each multithreaded step
+    local parallel=$MAX_PARALLEL_GENOMES
+    if [ "$parallel" -le 0 ]; then
+        parallel=$(( CPU_CORES / 4 ))
+    fi
+    [ "$parallel" -lt 1 ] && parallel=1
+    [ "$parallel" -gt "$total_genomes" ] && parallel=$total_genomes
+    
+    if [ "$THREADED_STEP_CORES" -le 0 ]; then
+        THREADED_STEP_CORES=$(( CPU_CORES / (2 * parallel) ))
+    fi
+    [ "$THREADED_STEP_CORES" -lt 1 ] && THREADED_STEP_CORES=1
+    [ "$THREADED_STEP_CORES" -gt "$CPU_CORES" ] && THREADED_STEP_CORES=$CPU_CORES
+    
+    init_resources
+    trap 'kill $(jobs -p) 2>/dev/null; cleanup_resources; exit 130' INT TERM
+    
     echo ""
     print_separator
     log_info "${ROCKET} Starting batch processing..."
+    log_info "Up to ${parallel} genome(s) at once, ${THREADED_STEP_CORES} core(s) per multithreaded step"
+    log_info "Per-genome output goes to ${LOG_DIR}/<genome>_pipeline.log"
     print_separator
     
-    # Process each genome
+    # Process genomes concurrently; the resource pool decides what runs when
     local success_count=0
     local partial_count=0
     local failed_count=0
@@ -628,19 +991,56 @@ main() {
     for i in "${!genome_files[@]}"; do
         local genome_num=$((i + 1))
         
-        if process_single_genome "${genome_files[$i]}" "$genome_num" "$total_genomes"; then
-            ((success_count++)) || true
-        else
-            if [ -f "$OUTPUT_DIR/$(basename "${genome_files[$i]}" | sed 's/\.[^.]*$//')_Annotation_Report.html" ]; then
-                ((partial_count++)) || true
-            else
-                ((failed_count++)) || true
-            fi
-        fi
+        while [ "$(jobs -rp | wc -l)" -ge "$parallel" ]; do
+            wait -n 2>/dev/null || true
+        done
         
-        sleep 2
+        run_genome_job "${genome_files[$i]}" "$genome_num" "$total_genomes" &
+    done
+    wait
+    
+    # Collect statuses and the report queue in input order
+    for genome_file in "${genome_files[@]}"; do
+        local filename=$(basename "$genome_file")
+        local name="${filename%.*}"
+        case "$(cat "$RUN_DIR/${name}.status" 2>/dev/null || echo FAILED)" in
+            SUCCESS) ((success_count++)) || true ;;
+            PARTIAL) ((partial_count++)) || true ;;
+            *)       ((failed_count++)) || true ;;
+        esac
+        if [ -f "$RUN_DIR/${name}.report" ]; then
+            REPORT_QUEUE+=("$name")
+        fi
     done
     
+    # Step 9 for every genome that got far enough to have a report
+    if [ ${#REPORT_QUEUE[@]} -gt 0 ]; then
+        echo ""
+        print_separator
+        run_pfam_batch "${REPORT_QUEUE[@]}"
+    fi
+    cleanup_resources
+    trap - INT TERM
+    
+    # ========================================================================
+    # BATCH HTML REPORTS (one interpreter, one worker per core)
+    # ========================================================================
+    if [ ${#REPORT_QUEUE[@]} -gt 0 ]; then
+        echo ""
+        print_separator
+        log_processing "Generating ${#REPORT_QUEUE[@]} HTML report(s) in one batch..."
+        local report_opts=(--batch --workers "$CPU_CORES")
+        if [ "$REPORT_FULL_TABLES" = "1" ]; then
+            report_opts=(--full-tables "${report_opts[@]}")
+        fi
+        if STEP_NAME=report measured "$CPU_CORES" 0 "$(date +%s.%N)" \
+            python3 generate_single_report.py "${report_opts[@]}" "${REPORT_QUEUE[@]}" > "$LOG_DIR/report_batch.log" 2>&1; then
+            log_success "All HTML reports generated successfully!"
+        else
+            log_warning "Report generation had minor issues (see $LOG_DIR/report_batch.log)"
+        fi
+    fi
+    
     # ========================================================================
     # FINAL SUMMARY
     # ========================================================================
@@ -671,6 +1071,21 @@ main() {
     print_separator
     echo ""
     
+    # ========================================================================
+    # STEP PROFILE (per step and genome, critical path, slowest 5%)
+    # ========================================================================
+    if [ "$STEP_METRICS" = "1" ] && [ -s "$METRICS_FILE" ]; then
+        local profile="$METRICS_DIR/run_${RUN_ID}_profile.txt"
+        if python3 step_metrics.py report "$METRICS_FILE" --out "$profile" > /dev/null 2>&1; then
+            head -n 2 "$profile"
+            grep "^Critical path" "$profile"
+            log_info "${CHART} Step profile: ${profile} (raw metrics: ${METRICS_FILE})"
+        else
+            log_warning "Could not write the step profile (raw metrics: ${METRICS_FILE})"
+        fi
+        echo ""
+    fi
+    
     if [ $failed_count -eq 0 ] && [ $partial_count -eq 0 ]; then
         echo -e "${GREEN}${SUCCESS}${SUCCESS}${SUCCESS} ALL GENOMES PROCESSED SUCCESSFULLY! ${SUCCESS}${SUCCESS}${SUCCESS}${NC}"
     elif [ $failed_count -eq 0 ]; then
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+"""
+Sharded Search Executor
+
+hmmscan and DIAMOND stop getting faster after a few threads, so one process
+with all the cores leaves most of them idle. This module splits a protein FASTA into
+contiguous shards holding about the same number of residues, runs one search
+per shard at the same time within a core budget and concatenates the tabular
+outputs in shard order. Each query is scored on its own and the shards keep
+the input order, so the merged table has the same rows, in the same order,
+as a single run.
+
+The command is given after "--" with {query}, {out} and {threads}
+placeholders, which are filled in per shard.
+
+Usage: python3 shard_search.py --query IN.faa --out OUT.tbl [--cpu N] [--shard-cpu 4]
+                               [--max-shards N] -- hmmscan --cpu {threads} --domtblout {out} DB {query}
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+# Threads per shard: hmmscan and DIAMOND gain little beyond this
+SHARD_CPU = 4
+# Fewer queries than this per shard is not worth another process
+MIN_SHARD_SEQS = 200
+
+def fasta_lengths(path):
+    """Residue count of every record, in file order."""
+    lengths = []
+    with open(path) as f:
+        for line in f:
+            if line.startswith('>'):
+                lengths.append(0)
+            elif lengths:
+                lengths[-1] += len(line.strip())
+    return lengths
+
+def plan_shards(lengths, n_shards):
+    """Split records into at most n_shards contiguous runs of about equal residues.
+
+    Returns the number of records in each shard.
+    """
+    total = sum(lengths)
+    counts = []
+    done = 0
+    count = 0
+    for length in lengths:
+        count += 1
+        done += length
+        # Close the shard once it reaches its share of the residues
+        if done * n_shards >= total * (len(counts) + 1) and len(counts) < n_shards - 1:
+            counts.append(count)
+            count = 0
+    if count:
+        counts.append(count)
+    return counts
+
+def write_shards(path, counts, workdir):
+    """Write consecutive records of path into one FASTA per shard."""
+    shard_paths = [os.path.join(workdir, f"shard_{i}.faa") for i in range(len(counts))]
+    shard = -1
+    remaining = 0
+    out = None
+    with open(path) as f:
+        for line in f:
+            if line.startswith('>'):
+                if remaining == 0:
+                    if out:
+                        out.close()
+                    shard += 1
+                    remaining = counts[shard]
+                    out = open(shard_paths[shard], 'w')
+                remaining -= 1
+            if out:
+                out.write(line)
+    if out:
+        out.close()
+    return shard_paths
+
+def merge_tables(parts, output):
+    """Concatenate tabular outputs in order, keeping only the first part's header."""
+    tmp = f"{output}.tmp"
+    with open(tmp, 'w') as out:
+        for index, part in enumerate(parts):
+            with open(part) as f:
+                in_header = True
+                for line in f:
+                    if line.startswith('#'):
+                        # Per-shard headers and footers name the shard file; keep the first header only
+                        if index == 0 and in_header:
+                            out.write(line)
+                        continue
+                    in_header = False
+                    out.write(line)
+    os.replace(tmp, output)
+
+def fill(cmd, query, out, threads):
+    """Substitute the placeholders of a command template."""
+    return [arg.replace('{query}', query).replace('{out}', out).replace('{threads}', str(threads))
+            for arg in cmd]
+
+def run_sharded(cmd, query, output, cpu, shard_cpu=SHARD_CPU, max_shards=None,
+                min_shard_seqs=MIN_SHARD_SEQS, tmpdir=None):
+    """Run cmd over query in concurrent shards and merge into output.
+
+    Returns the number of shards used.
+    """
+    lengths = fasta_lengths(query)
+    n_shards = max(1, min(cpu // max(1, shard_cpu), len(lengths) // max(1, min_shard_seqs)))
+    if max_shards:
+        n_shards = min(n_shards, max_shards)
+
+    if n_shards == 1:
+        subprocess.run(fill(cmd, query, output, cpu), check=True)
+        return 1
+
+    workdir = tempfile.mkdtemp(prefix="shards.", dir=tmpdir)
+    try:
+        counts = plan_shards(lengths, n_shards)
+        shard_paths = write_shards(query, counts, workdir)
+        outputs = [f"{p}.out" for p in shard_paths]
+
+        # Spread the cores as evenly as possible over the shards
+        procs = []
+        for i, (shard, out) in enumerate(zip(shard_paths, outputs)):
+            threads = cpu // len(shard_paths) + (1 if i < cpu % len(shard_paths) else 0)
+            procs.append(subprocess.Popen(fill(cmd, shard, out, max(1, threads))))
+
+        failed = [p for p in procs if p.wait() != 0]
+        if failed:
+            raise subprocess.CalledProcessError(failed[0].returncode, failed[0].args)
+
+        merge_tables(outputs, output)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return len(shard_paths)
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Run a per-query search tool over FASTA shards in parallel.")
+    parser.add_argument('--query', required=True, help="protein FASTA to search")
+    parser.add_argument('--out', required=True, help="merged tabular output")
+    parser.add_argument('--cpu', type=int, default=os.cpu_count() or 1, help="total core budget")
+    parser.add_argument('--shard-cpu', type=int, default=SHARD_CPU,
+                        help=f"threads per shard (default {SHARD_CPU})")
+    parser.add_argument('--max-shards', type=int, default=None,
+                        help="upper limit on concurrent shards, e.g. from the memory budget")
+    parser.add_argument('--tmpdir', default=None, help="where to write the shards")
+    parser.add_argument('command', nargs=argparse.REMAINDER,
+                        help="-- command with {query}, {out} and {threads} placeholders")
+    args = parser.parse_args()
+
+    cmd = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not cmd:
+        parser.error("no command given")
+
+    try:
+        shards = run_sharded(cmd, args.query, args.out, args.cpu, args.shard_cpu,
+                             args.max_shards, tmpdir=args.tmpdir)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Error: sharded search failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Searched {args.query} in {shards} shard(s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
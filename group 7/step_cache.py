@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+"""
+Content-Addressed Step Cache
+
+Lets run_automated.sh skip a step whose inputs, tool version and parameters
+have not changed since an earlier run. A step's key is the SHA-256 of those
+three things. Its output files are copied once under objects/ by content
+hash, an entry manifest under entries/ maps the key to them, and a hit
+restores the outputs as hard links (copies across filesystems). Objects are
+read-only, so restored outputs are too; run_automated.sh removes a step's
+outputs before running it again rather than writing into them. Entries are
+evicted least-recently-used first once the objects exceed the size cap.
+
+Input hashes are memoised by (size, mtime, inode), so the Pfam/Rfam databases
+are only read again after they change.
+
+Usage:
+    python3 step_cache.py key --tool NAME --version TEXT [--params TEXT] INPUT...
+    python3 step_cache.py restore KEY ROOT PATH...
+    python3 step_cache.py store KEY ROOT PATH...
+    python3 step_cache.py prune
+
+The cache lives in $STEP_CACHE_DIR (default .step_cache) and is capped at
+$STEP_CACHE_MAX_GB (default 50).
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import argparse
+from contextlib import contextmanager
+
+DEFAULT_CACHE_DIR = ".step_cache"
+DEFAULT_MAX_GB = 50
+CHUNK_SIZE = 1 << 20
+
+def sha256_file(path):
+    """SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_atomic(path, text):
+    """Write a small text file through a temporary name and rename it into place."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+class StepCache:
+    """Key computation, restore, store and LRU eviction for one cache directory."""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects = os.path.join(root, "objects")
+        self.entries = os.path.join(root, "entries")
+        self.memo = os.path.join(root, "memo")
+        for path in (self.objects, self.entries, self.memo):
+            os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def locked(self, exclusive):
+        """Shared lock for restores, exclusive lock for stores and eviction."""
+        with open(os.path.join(self.root, "lock"), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ------------------------------------------------------------------ keys
+
+    def input_digest(self, path):
+        """Content hash of an input file, reusing the memo while its stat is unchanged."""
+        real = os.path.realpath(path)
+        st = os.stat(real)
+        stamp = f"{st.st_size} {st.st_mtime_ns} {st.st_ino}"
+        memo_path = os.path.join(self.memo, hashlib.sha1(real.encode()).hexdigest())
+        try:
+            with open(memo_path) as f:
+                saved_stamp, saved_digest = f.read().rsplit(' ', 1)
+            if saved_stamp == stamp:
+                return saved_digest
+        except (OSError, ValueError):
+            pass
+        digest = sha256_file(real)
+        write_atomic(memo_path, f"{stamp} {digest}")
+        return digest
+
+    def key(self, tool, version, params, inputs):
+        """Step key: tool, version, parameters and the content of every input, in order."""
+        digest = hashlib.sha256()
+        for part in (tool, version.strip(), params):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        for path in inputs:
+            digest.update(self.input_digest(path).encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    # --------------------------------------------------------------- entries
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def entry_path(self, key, paths):
+        """Entries are per key and output names, so genomes with identical
+        content but different prefixes never restore each other's files."""
+        digest = hashlib.sha256(key.encode())
+        for rel in paths:
+            digest.update(b'\0' + os.path.normpath(rel).encode())
+        return os.path.join(self.entries, f"{digest.hexdigest()}.json")
+
+    def restore(self, key, dest_root, paths):
+        """Recreate a stored step's outputs under dest_root; False on a miss."""
+        entry_path = self.entry_path(key, paths)
+        with self.locked(exclusive=False):
+            try:
+                with open(entry_path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return False
+            if not all(os.path.exists(self.object_path(d)) for d in entry["files"].values()):
+                return False
+            # A directory output is replaced as a whole, so no file of another run stays in it
+            for rel in paths:
+                full = os.path.join(dest_root, rel)
+                if os.path.isdir(full) and not os.path.islink(full):
+                    shutil.rmtree(full)
+                    os.makedirs(full)
+            for rel, digest in entry["files"].items():
+                dest = os.path.join(dest_root, rel)
+                os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+                if os.path.lexists(dest):
+                    os.remove(dest)
+                link_or_copy(self.object_path(digest), dest)
+            # Entry mtime is the LRU clock
+            os.utime(entry_path)
+        return True
+
+    def store(self, key, src_root, paths):
+        """Store the given files/directories (relative to src_root) under key."""
+        files = {}
+        for rel in paths:
+            full = os.path.join(src_root, rel)
+            if os.path.isdir(full):
+                for dirpath, _, names in os.walk(full):
+                    for name in names:
+                        path = os.path.join(dirpath, name)
+                        files[os.path.relpath(path, src_root)] = path
+            elif os.path.isfile(full):
+                files[os.path.normpath(rel)] = full
+
+        with self.locked(exclusive=True):
+            manifest = {}
+            for rel, path in sorted(files.items()):
+                digest = sha256_file(path)
+                obj = self.object_path(digest)
+                if not os.path.exists(obj):
+                    os.makedirs(os.path.dirname(obj), exist_ok=True)
+                    tmp = f"{obj}.{os.getpid()}.tmp"
+                    # A copy, not a link: the working output stays writable and
+                    # later writes to it cannot reach the object
+                    shutil.copyfile(path, tmp)
+                    os.chmod(tmp, 0o444)
+                    os.replace(tmp, obj)
+                manifest[rel] = digest
+            write_atomic(self.entry_path(key, paths), json.dumps(
+                {"created": time.time(), "files": manifest}, indent=1))
+            self.evict()
+        return len(manifest)
+
+    # -------------------------------------------------------------- eviction
+
+    def evict(self):
+        """Drop least-recently-used entries until the objects fit the size cap.
+
+        Caller must hold the exclusive lock.
+        """
+        entries = []
+        for name in os.listdir(self.entries):
+            path = os.path.join(self.entries, name)
+            try:
+                with open(path) as f:
+                    digests = set(json.load(f)["files"].values())
+                entries.append((os.stat(path).st_mtime, path, digests))
+            except (OSError, ValueError, KeyError):
+                continue
+        entries.sort()
+
+        sizes = {}
+        for dirpath, _, names in os.walk(self.objects):
+            for name in names:
+                if not name.endswith(".tmp"):
+                    sizes[name] = os.stat(os.path.join(dirpath, name)).st_size
+
+        refs = {}
+        for _, _, digests in entries:
+            for digest in digests:
+                refs[digest] = refs.get(digest, 0) + 1
+
+        # Objects no entry points at any more go first
+        total = 0
+        for digest, size in sizes.items():
+            if refs.get(digest):
+                total += size
+            else:
+                os.remove(self.object_path(digest))
+
+        for _, path, digests in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            for digest in digests:
+                refs[digest] -= 1
+                if refs[digest] == 0 and digest in sizes:
+                    os.remove(self.object_path(digest))
+                    total -= sizes[digest]
+
+def link_or_copy(src, dest):
+    """Hard-link src to dest, copying when they are on different filesystems."""
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Content-addressed cache for pipeline steps.")
+    parser.add_argument('--cache-dir', default=os.environ.get("STEP_CACHE_DIR", DEFAULT_CACHE_DIR))
+    parser.add_argument('--max-gb', type=float,
+                        default=float(os.environ.get("STEP_CACHE_MAX_GB", DEFAULT_MAX_GB)))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    key_cmd = commands.add_parser('key', help="print the cache key of a step")
+    key_cmd.add_argument('--tool', required=True)
+    key_cmd.add_argument('--version', default="")
+    key_cmd.add_argument('--params', default="")
+    key_cmd.add_argument('inputs', nargs='+')
+
+    restore_cmd = commands.add_parser('restore', help="restore a step's outputs (exit 1 on a miss)")
+    restore_cmd.add_argument('key')
+    restore_cmd.add_argument('root')
+    restore_cmd.add_argument('paths', nargs='+')
+
+    store_cmd = commands.add_parser('store', help="store a step's outputs")
+    store_cmd.add_argument('key')
+    store_cmd.add_argument('root')
+    store_cmd.add_argument('paths', nargs='+')
+
+    commands.add_parser('prune', help="evict entries down to the size cap")
+
+    args = parser.parse_args()
+    cache = StepCache(args.cache_dir, int(args.max_gb * 1024 ** 3))
+
+    try:
+        if args.command == 'key':
+            print(cache.key(args.tool, args.version, args.params, args.inputs))
+        elif args.command == 'restore':
+            if not cache.restore(args.key, args.root, args.paths):
+                sys.exit(1)
+        elif args.command == 'store':
+            cache.store(args.key, args.root, args.paths)
+        else:
+            with cache.locked(exclusive=True):
+                cache.evict()
+    except OSError as e:
+        print(f"Error: step cache {args.command} failed: {e}", file=sys.stderr)
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+"""
+Step Metrics
+
+Wraps each tool run_automated.sh starts and records what it cost: wall time,
+user and system CPU time, peak RSS and I/O bytes. It also records how long
+the step waited for its cores and memory. CPU time and peak RSS come from
+wait4() on the tool, so they cover every process the tool itself waited for.
+I/O comes from /proc/self/io: the kernel adds a child's counters to its
+parent when the child is reaped. Each step appends one JSON line to the
+run's metrics file (logs/metrics/<run>.jsonl).
+
+The report aggregates a metrics file per step and per genome and lists the
+slowest 5% of step runs. It also follows the critical path: starting from
+the step that ended last, it walks back to the step that ended just before
+each step was queued. That chain is what the run's wall time is made of.
+Time spent waiting for resources on the chain is where more cores or memory
+would help. Run time on the chain is where optimising a tool pays off.
+
+Usage:
+    python3 step_metrics.py run --metrics FILE --genome NAME --step NAME [--cores N] [--mem-gb N]
+                                [--queued EPOCH] -- command [args...]
+    python3 step_metrics.py report FILE [--out profile.txt] [--slowest 0.05]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import fcntl
+import bisect
+import argparse
+import subprocess
+from collections import defaultdict
+
+# Steps that start within this many seconds of another step's end follow it
+CHAIN_SLACK = 1.0
+IO_FIELDS = ("rchar", "wchar", "read_bytes", "write_bytes")
+
+def read_proc_io():
+    """I/O counters of this process (reaped children included), or None without /proc."""
+    try:
+        with open("/proc/self/io") as f:
+            counters = dict(line.split(':', 1) for line in f if ':' in line)
+        return {k: int(counters[k]) for k in IO_FIELDS}
+    except (OSError, KeyError, ValueError):
+        return None
+
+def tool_name(command):
+    """Tool of a command line; the script for interpreters such as python3."""
+    name = os.path.basename(command[0])
+    if name.startswith(("python", "perl", "bash", "sh")) and len(command) > 1 and not command[1].startswith('-'):
+        return os.path.basename(command[1])
+    return name
+
+def run_command(command):
+    """Run command and return (exit code, metrics dict)."""
+    io_before = read_proc_io()
+    start = time.time()
+    try:
+        proc = subprocess.Popen(command)
+    except OSError as e:
+        print(f"Error: cannot run {command[0]}: {e}", file=sys.stderr)
+        return 127, {'start': start, 'end': time.time(), 'wall': 0.0}
+    while True:
+        try:
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            break
+        except InterruptedError:
+            continue
+    end = time.time()
+    io_after = read_proc_io()
+
+    rc = proc.returncode
+    metrics = {
+        'start': round(start, 3),
+        'end': round(end, 3),
+        'wall': round(end - start, 3),
+        'user': round(usage.ru_utime, 3),
+        'sys': round(usage.ru_stime, 3),
+        # ru_maxrss is in KB on Linux
+        'max_rss_mb': round(usage.ru_maxrss / 1024, 1),
+    }
+    if io_before and io_after:
+        metrics.update({k: io_after[k] - io_before[k] for k in IO_FIELDS})
+    else:
+        # Without /proc only block I/O is known, in 512-byte units
+        metrics.update(read_bytes=usage.ru_inblock * 512, write_bytes=usage.ru_oublock * 512)
+    # A tool killed by a signal exits as the shell would report it
+    return (128 - rc if rc < 0 else rc), metrics
+
+def append_record(path, record):
+    """Append one JSON line; concurrent steps take turns through flock."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+        f.flush()
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+def load_records(path):
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A run killed mid-write leaves at most one torn line
+                continue
+    for r in records:
+        r.setdefault('queued', r['start'])
+        r['cpu'] = r.get('user', 0.0) + r.get('sys', 0.0)
+        # Includes the wrapper's own start-up, a few tens of milliseconds
+        r['wait'] = max(0.0, r['start'] - r['queued'])
+    return records
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def critical_path(records):
+    """Chain of records the run's end waited on, earliest first.
+
+    From the record that ended last, step back to the record that ended
+    latest before this one was queued (within CHAIN_SLACK), until none is left.
+    """
+    if not records:
+        return []
+    by_end = sorted(records, key=lambda r: r['end'])
+    ends = [r['end'] for r in by_end]
+    index = len(by_end) - 1
+    path = [by_end[index]]
+    while True:
+        # Only records earlier in end order qualify, so the walk always terminates
+        limit = min(index, bisect.bisect_right(ends, path[-1]['queued'] + CHAIN_SLACK, hi=index))
+        if limit == 0:
+            break
+        index = limit - 1
+        path.append(by_end[index])
+    return path[::-1]
+
+def fmt_seconds(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+def fmt_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}TB"
+
+def profile_report(records, slowest=0.05):
+    """Text profile of a run's step records."""
+    if not records:
+        return "No step metrics recorded.\n"
+    run_start = min(r['queued'] for r in records)
+    run_end = max(r['end'] for r in records)
+    run_wall = max(run_end - run_start, 1e-9)
+    total_cpu = sum(r['cpu'] for r in records)
+    lines = []
+    out = lines.append
+
+    out(f"Run profile: {len(records)} step runs, {len({r['genome'] for r in records})} genome(s)")
+    out(f"Wall time {fmt_seconds(run_wall)}, CPU time {fmt_seconds(total_cpu)} "
+        f"(average {total_cpu / run_wall:.1f} cores busy), "
+        f"peak RSS of one step {max(r.get('max_rss_mb', 0) for r in records):.0f} MB")
+    out("")
+
+    # Per step
+    steps = defaultdict(list)
+    for r in records:
+        steps[r['step']].append(r)
+    out("Per step (sorted by total wall time)")
+    out(f"{'step':<12} {'runs':>5} {'total':>8} {'mean':>8} {'p95':>8} {'max':>8} {'waited':>8} "
+        f"{'cpu':>8} {'cores':>6} {'used':>6} {'peakRSS':>9} {'disk_rd':>9} {'disk_wr':>9}")
+    for step, rs in sorted(steps.items(), key=lambda item: -sum(r['wall'] for r in item[1])):
+        walls = [r['wall'] for r in rs]
+        wall = sum(walls)
+        cpu = sum(r['cpu'] for r in rs)
+        granted = sum(r.get('cores', 1) * r['wall'] for r in rs)
+        out(f"{step:<12} {len(rs):>5} {fmt_seconds(wall):>8} {fmt_seconds(wall / len(rs)):>8} "
+            f"{fmt_seconds(percentile(walls, 0.95)):>8} {fmt_seconds(max(walls)):>8} "
+            f"{fmt_seconds(sum(r['wait'] for r in rs)):>8} {fmt_seconds(cpu):>8} "
+            f"{cpu / wall if wall else 0:>6.1f} {100 * cpu / granted if granted else 0:>5.0f}% "
+            f"{max(r.get('max_rss_mb', 0) for r in rs):>7.0f}MB "
+            f"{fmt_bytes(sum(r.get('read_bytes', 0) for r in rs)):>9} "
+            f"{fmt_bytes(sum(r.get('write_bytes', 0) for r in rs)):>9}")
+    out("  cores = CPU time / wall time; used = CPU time / (cores granted x wall time);"
+        " disk_rd/disk_wr = bytes that reached storage (page cache hits excluded)")
+    out("")
+
+    # Per genome
+    genomes = defaultdict(list)
+    for r in records:
+        genomes[r['genome']].append(r)
+    out("Per genome (sorted by elapsed time)")
+    out(f"{'genome':<30} {'steps':>5} {'elapsed':>8} {'waited':>8} {'cpu':>8} {'peakRSS':>9}  critical path")
+    for genome, rs in sorted(genomes.items(), key=lambda item: -(max(r['end'] for r in item[1])
+                                                                  - min(r['queued'] for r in item[1]))):
+        elapsed = max(r['end'] for r in rs) - min(r['queued'] for r in rs)
+        chain = " > ".join(r['step'] for r in critical_path(rs))
+        out(f"{genome:<30} {len(rs):>5} {fmt_seconds(elapsed):>8} {fmt_seconds(sum(r['wait'] for r in rs)):>8} "
+            f"{fmt_seconds(sum(r['cpu'] for r in rs)):>8} {max(r.get('max_rss_mb', 0) for r in rs):>7.0f}MB  {chain}")
+    out("")
+
+    # Critical path of the whole run
+    path = critical_path(records)
+    # Only the part of a wait after the previous step on the path ended adds to the wall time
+    waits = [max(0.0, r['start'] - max(r['queued'], previous['end']))
+             for previous, r in zip([{'end': run_start}] + path, path)]
+    waited = sum(waits)
+    ran = sum(r['wall'] for r in path)
+    out(f"Critical path of the run: {len(path)} steps, {fmt_seconds(ran)} running + "
+        f"{fmt_seconds(waited)} waiting for resources = {100 * (ran + waited) / run_wall:.0f}% of the wall time")
+    for r, wait in zip(path, waits):
+        out(f"  {r['genome']:<30} {r['step']:<12} ran {fmt_seconds(r['wall']):>7}  "
+            f"waited {fmt_seconds(wait):>7}  on {r.get('cores', 1)} core(s)")
+    out("")
+
+    # Slowest step runs
+    count = max(1, math.ceil(slowest * len(records)))
+    out(f"Slowest {100 * slowest:g}% of step runs ({count})")
+    for r in sorted(records, key=lambda r: -r['wall'])[:count]:
+        out(f"  {r['genome']:<30} {r['step']:<12} {fmt_seconds(r['wall']):>7}  cpu {fmt_seconds(r['cpu']):>7}  "
+            f"rss {r.get('max_rss_mb', 0):.0f}MB  exit {r.get('status', '?')}")
+    return '\n'.join(lines) + '\n'
+
+def main():
+    """Main entry point for the script."""
+    parser = argparse.ArgumentParser(description="Per-step resource telemetry for run_automated.sh.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_cmd = commands.add_parser('run', help="run a command and append its metrics")
+    run_cmd.add_argument('--metrics', required=True, help="run's metrics file (JSON lines)")
+    run_cmd.add_argument('--genome', default="all")
+    run_cmd.add_argument('--step', required=True)
+    run_cmd.add_argument('--cores', type=int, default=1, help="cores granted to the step")
+    run_cmd.add_argument('--mem-gb', type=int, default=0, help="memory reserved for the step")
+    run_cmd.add_argument('--queued', type=float, default=None, help="when the step asked for resources (epoch)")
+    run_cmd.add_argument('cmd', nargs=argparse.REMAINDER)
+
+    report_cmd = commands.add_parser('report', help="profile report of a metrics file")
+    report_cmd.add_argument('metrics')
+    report_cmd.add_argument('--out', default=None, help="also write the report here")
+    report_cmd.add_argument('--slowest', type=float, default=0.05, help="fraction of step runs listed as slowest")
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        command = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+        if not command:
+            parser.error("run needs a command after --")
+        rc, metrics = run_command(command)
+        record = {
+            'genome': args.genome,
+            'step': args.step,
+            'tool': tool_name(command),
+            'cores': args.cores,
+            'mem_gb': args.mem_gb,
+            'queued': round(args.queued if args.queued is not None else metrics['start'], 3),
+            'status': rc,
+            **metrics,
+        }
+        try:
+            append_record(args.metrics, record)
+        except OSError as e:
+            # Losing a metrics line must not fail the step
+            print(f"Warning: could not record metrics: {e}", file=sys.stderr)
+        sys.exit(rc)
+
+    try:
+        report = profile_report(load_records(args.metrics), args.slowest)
+        if args.out:
+            with open(args.out, 'w') as f:
+                f.write(report)
+    except (OSError, KeyError) as e:
+        print(f"Error: metrics report failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(report, end='')
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,97 @@ log() {
     echo "[$(date '+%Y-%m-%d %H:%M:%S')] $1" | tee -a logs/pipeline.log
 }
 
+# Step manifests: each step writes into output/.partial/<genome>/<step>/ and
+# its outputs are moved into place only after the tool exits 0. The manifest
+# output/.manifest/<genome>/<step> is then written atomically with the exit
+# status, a digest of the inputs and the size + SHA-256 of every output file.
+# A step is skipped only when its manifest says status 0, the inputs are
+# unchanged and every output still has its recorded size, so an interrupted
+# DIAMOND or hmmscan run is re-done instead of being treated as complete.
+MANIFEST_DIR="output/.manifest"
+STAGING_DIR="output/.partial"
+# size = check output sizes on restart, full = also re-check the checksums
+MANIFEST_VERIFY="${MANIFEST_VERIFY:-size}"
+
+# Function to digest step inputs (path, size and mtime of every file)
+inputs_digest() {
+    local path
+    for path in "$@"; do
+        find "$path" -type f -printf '%p\t%s\t%T@\n' 2>/dev/null || true
+    done | sort | sha256sum | cut -d' ' -f1
+}
+
+# Function to check a step manifest: step_done ID INPUT...
+step_done() {
+    local manifest="$MANIFEST_DIR/$1"
+    shift
+    [ -f "$manifest" ] || return 1
+    grep -qx $'status\t0' "$manifest" || return 1
+    [ "$(awk -F'\t' '$1 == "inputs" {print $2}' "$manifest")" = "$(inputs_digest "$@")" ] || return 1
+    
+    local kind path size sum
+    while IFS=$'\t' read -r kind path size sum; do
+        [ "$kind" = "file" ] || continue
+        [ -f "$path" ] && [ "$(stat -c %s "$path")" = "$size" ] || return 1
+        if [ "$MANIFEST_VERIFY" = "full" ]; then
+            [ "$(sha256sum < "$path" | cut -d' ' -f1)" = "$sum" ] || return 1
+        fi
+    done < "$manifest"
+}
+
+# Function to get a fresh staging directory: step_stage ID
+step_stage() {
+    rm -f "$MANIFEST_DIR/$1"
+    rm -rf "${STAGING_DIR:?}/$1"
+    mkdir -p "$STAGING_DIR/$1"
+    echo "$STAGING_DIR/$1"
+}
+
+# Function to finish a step: step_commit ID STATUS INPUT... -- OUTPUT...
+# On status 0 each OUTPUT is moved from <stage>/<basename> into place
+step_commit() {
+    local id=$1
+    local status=$2
+    shift 2
+    local inputs=()
+    while [ $# -gt 0 ] && [ "$1" != "--" ]; do
+        inputs+=("$1")
+        shift
+    done
+    shift
+    
+    local stage="$STAGING_DIR/$id"
+    local manifest="$MANIFEST_DIR/$id"
+    mkdir -p "$(dirname "$manifest")"
+    
+    {
+        printf 'step\t%s\n' "$id"
+        printf 'status\t%s\n' "$status"
+        printf 'inputs\t%s\n' "$(inputs_digest "${inputs[@]}")"
+        printf 'finished\t%s\n' "$(date '+%Y-%m-%d %H:%M:%S')"
+        if [ "$status" -eq 0 ]; then
+            local output file
+            for output in "$@"; do
+                rm -rf "$output"
+                mv "$stage/$(basename "$output")" "$output"
+                while IFS= read -r -d '' file; do
+                    printf 'file\t%s\t%s\t%s\n' "$file" "$(stat -c %s "$file")" "$(sha256sum < "$file" | cut -d' ' -f1)"
+                done < <(find "$output" -type f -print0 | sort -z)
+            done
+        fi
+    } > "$manifest.tmp"
+    mv "$manifest.tmp" "$manifest"
+    rm -rf "$stage"
+}
+
+# DIAMOND and hmmscan are split into shards of SHARD_THREADS cores by group 7's shard_search.py
+SHARD_SEARCH="${SHARD_SEARCH:-$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/../group 7/shard_search.py}"
+SHARD_THREADS="${SHARD_THREADS:-4}"
+# Pfam is scanned once per batch by group 7's pfam_batch.py, which reads the
+# profile descriptions through its ref_index.py
+PFAM_BATCH="${PFAM_BATCH:-$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/../group 7/pfam_batch.py}"
+REF_INDEX="${REF_INDEX:-$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/../group 7/ref_index.py}"
+
 # Function to check dependencies
 check_dependencies() {
     log "🔧 Checking dependencies..."
@@ -73,7 +164,7 @@ preprocess_genomes() {
         genome_name=$(basename "$genome" .fna)
         output_file="preprocessed/${genome_name}.fna"
         
-        if [ -f "$output_file" ]; then
+        if step_done "$genome_name/preprocess" "$genome"; then
             log "   ⏩ Already preprocessed: $genome_name"
             continue
         fi
@@ -85,6 +176,8 @@ preprocess_genomes() {
             continue
         fi
         
+        local stage=$(step_stage "$genome_name/preprocess")
+        local rc=0
         awk '
         /^>/ {
             if (seqlen) {
@@ -103,9 +196,13 @@ preprocess_genomes() {
             if (seqlen) {
                 print seq
             }
-        }' "$genome" > "$output_file"
+        }' "$genome" > "$stage/${genome_name}.fna" || rc=$?
         
-        if [ ! -s "$output_file" ]; then
+        if [ $rc -eq 0 ] && [ ! -s "$stage/${genome_name}.fna" ]; then
+            rc=1
+        fi
+        step_commit "$genome_name/preprocess" "$rc" "$genome" -- "$output_file"
+        if [ $rc -ne 0 ]; then
             log "   ❌ Preprocessing failed for: $genome_name"
             exit 1
         fi
@@ -128,21 +225,29 @@ predict_genes() {
         return 1
     fi
     
-    if [ -f "${output_prefix}.faa" ] && [ -s "${output_prefix}.faa" ]; then
+    if step_done "$genome_name/prodigal" "$genome"; then
         local gene_count=$(grep -c ">" "${output_prefix}.faa" 2>/dev/null || echo "0")
         log "   ⏩ Already processed: $genome_name ($gene_count genes)"
         return 0
     fi
     
+    local stage=$(step_stage "$genome_name/prodigal")
+    local staged="$stage/$(basename "$output_prefix")"
+    local rc=0
     prodigal -i "$genome" \
-        -o "${output_prefix}.gff" \
-        -a "${output_prefix}.faa" \
-        -d "${output_prefix}.fna" \
+        -o "${staged}.gff" \
+        -a "${staged}.faa" \
+        -d "${staged}.fna" \
         -f gff \
         -p single \
-        -q 2> "logs/prodigal_${genome_name}.log"
+        -q 2> "logs/prodigal_${genome_name}.log" || rc=$?
     
-    if [ ! -f "${output_prefix}.faa" ] || [ ! -s "${output_prefix}.faa" ]; then
+    if [ $rc -eq 0 ] && [ ! -s "${staged}.faa" ]; then
+        rc=1
+    fi
+    step_commit "$genome_name/prodigal" "$rc" "$genome" -- \
+        "${output_prefix}.gff" "${output_prefix}.faa" "${output_prefix}.fna"
+    if [ $rc -ne 0 ]; then
         log "   ❌ Prodigal failed to generate output for: $genome_name"
         return 1
     fi
@@ -169,21 +274,32 @@ homology_search() {
         return 1
     fi
     
-    if [ -f "${output_prefix}.tsv" ] && [ -s "${output_prefix}.tsv" ]; then
+    if step_done "$genome_name/diamond" "$proteins" "$DIAMOND_DB"; then
         local hit_count=$(wc -l < "${output_prefix}.tsv" 2>/dev/null || echo "0")
         log "   ⏩ Already processed: $genome_name ($hit_count hits)"
         return 0
     fi
     
-    diamond blastp \
+    local stage=$(step_stage "$genome_name/diamond")
+    local rc=0
+    create_shard_search_script
+    python3 scripts/shard_search.py --query "$proteins" --out "$stage/$(basename "$output_prefix").tsv" \
+        --cpu "$THREADS" --shard-cpu "$SHARD_THREADS" --tmpdir "$stage" -- \
+        diamond blastp \
         --db "$DIAMOND_DB" \
-        --query "$proteins" \
-        --out "${output_prefix}.tsv" \
+        --query {query} \
+        --out {out} \
         --outfmt 6 qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore stitle \
         --evalue $E_VALUE \
         --max-target-seqs $MAX_TARGET_SEQS \
-        --threads $THREADS \
-        --quiet 2> "logs/diamond_${genome_name}.log"
+        --threads {threads} \
+        --quiet 2> "logs/diamond_${genome_name}.log" || rc=$?
+    
+    step_commit "$genome_name/diamond" "$rc" "$proteins" "$DIAMOND_DB" -- "${output_prefix}.tsv"
+    if [ $rc -ne 0 ]; then
+        log "   ❌ DIAMOND failed for: $genome_name (see logs/diamond_${genome_name}.log)"
+        return $rc
+    fi
     
     local hit_count=0
     if [ -f "${output_prefix}.tsv" ]; then
@@ -193,40 +309,82 @@ homology_search() {
     log "     → SwissProt hits: $hit_count"
 }
 
-# Function for domain detection
-domain_detection() {
-    local proteins=$1
-    local output_prefix=$2
-    local genome_name=$3
+# Function to install group 7's sharded search script next to pfam_batch.py
+create_shard_search_script() {
+    cp "$SHARD_SEARCH" scripts/shard_search.py
+}
+
+# Function to install group 7's Pfam/Rfam profile index next to pfam_batch.py,
+# so both pipelines build and read the same <db>.index.sqlite
+create_ref_index_script() {
+    cp "$REF_INDEX" scripts/ref_index.py
+}
+
+# Function to install group 7's batched Pfam scan script
+create_pfam_batch_script() {
+    cp "$PFAM_BATCH" scripts/pfam_batch.py
+}
+
+# Function for domain detection: one Pfam scan for all given genomes, so
+# Pfam-A.hmm is read once per batch rather than once per genome
+domain_detection_batch() {
+    local batch_args=()
+    local pending=()
+    local genome_name proteins stage
     
-    log "   🏷️  Domain detection: $genome_name"
+    for genome_name in "$@"; do
+        proteins="output/prodigal/${genome_name}.faa"
     
-    if [ ! -s "$proteins" ]; then
-        log "   ⚠️  No protein sequences for: $genome_name"
-        return 1
-    fi
+        if [ ! -s "$proteins" ]; then
+            log "   ⚠️  No protein sequences for: $genome_name"
+            continue
+        fi
+    
+        if step_done "$genome_name/hmmscan" "$proteins" "$PFAM_DB"; then
+            local domain_count=$(cat "output/hmmer/${genome_name}_domain_count.txt" 2>/dev/null || echo "0")
+            log "   ⏩ Already processed: $genome_name ($domain_count domains)"
+            continue
+        fi
+    
+        stage=$(step_stage "$genome_name/hmmscan")
+        batch_args+=(--genome "$genome_name" "$proteins" "$stage/${genome_name}.domtblout")
+        pending+=("$genome_name")
+    done
     
-    if [ -f "${output_prefix}.domtblout" ] && [ -f "output/hmmer/${genome_name}_domain_count.txt" ]; then
-        local domain_count=$(cat "output/hmmer/${genome_name}_domain_count.txt" 2>/dev/null || echo "0")
-        log "   ⏩ Already processed: $genome_name ($domain_count domains)"
+    if [ ${#pending[@]} -eq 0 ]; then
         return 0
     fi
     
-    hmmscan \
-        --cpu $THREADS \
-        --domtblout "${output_prefix}.domtblout" \
-        --tblout "${output_prefix}.tblout" \
-        -o "${output_prefix}.hmmscan" \
-        "$PFAM_DB" \
-        "$proteins" 2> "logs/hmmer_${genome_name}.log"
-    
-    local domain_count=0
-    if [ -f "${output_prefix}.domtblout" ]; then
-        domain_count=$(grep -v '^#' "${output_prefix}.domtblout" | awk 'NF>=4 {count++} END {print count+0}' 2>/dev/null || echo "0")
-    fi
+    log "   🏷️  Domain detection: ${#pending[@]} genome(s) in one Pfam batch"
+    
+    create_shard_search_script
+    create_ref_index_script
+    create_pfam_batch_script
+    local rc=0
+    python3 scripts/pfam_batch.py --db "$PFAM_DB" --cpu "$THREADS" --shard-cpu "$SHARD_THREADS" \
+        "${batch_args[@]}" 2> "logs/hmmer_batch.log" || rc=$?
+    
+    for genome_name in "${pending[@]}"; do
+        proteins="output/prodigal/${genome_name}.faa"
+        stage="$STAGING_DIR/$genome_name/hmmscan"
+    
+        local domain_count=0
+        if [ -f "$stage/${genome_name}.domtblout" ]; then
+            domain_count=$(grep -v '^#' "$stage/${genome_name}.domtblout" | awk 'NF>=4 {count++} END {print count+0}' 2>/dev/null || echo "0")
+        fi
+        echo "$domain_count" > "$stage/${genome_name}_domain_count.txt"
     
-    log "     → Pfam domains: $domain_count"
-    echo "$domain_count" > "output/hmmer/${genome_name}_domain_count.txt"
+        step_commit "$genome_name/hmmscan" "$rc" "$proteins" "$PFAM_DB" -- \
+            "output/hmmer/${genome_name}.domtblout" "output/hmmer/${genome_name}_domain_count.txt"
+        if [ $rc -eq 0 ]; then
+            log "     → Pfam domains ($genome_name): $domain_count"
+        fi
+    done
+    
+    if [ $rc -ne 0 ]; then
+        log "   ❌ hmmscan failed (see logs/hmmer_batch.log)"
+        return $rc
+    fi
 }
 
 # Function to create combine annotations Python script
@@ -234,91 +392,147 @@ create_combine_script() {
     cat > "scripts/combine_annotations.py" << 'EOF'
 import os
 import sys
-
-def combine_annotations(genome_name):
-    genes = {}
-    faa_file = f"output/prodigal/{genome_name}.faa"
-    
-    # Read gene predictions
+import json
+from array import array
+
+def read_genes(faa_file):
+    """Gene IDs and descriptions in .faa order, plus {gene ID: index}."""
+    index = {}
+    ids = []
+    descriptions = []
     if os.path.exists(faa_file):
         with open(faa_file) as f:
-            current_gene = ""
             for line in f:
                 if line.startswith('>'):
-                    current_gene = line.strip().split()[0][1:]
-                    desc = ' '.join(line.strip().split()[1:]) if len(line.strip().split()) > 1 else 'No description'
-                    genes[current_gene] = {
-                        'gene_id': current_gene,
-                        'description': desc,
-                        'swissprot': 'No hit',
-                        'pfam': 'No domains',
-                        'domain_count': 0
-                    }
-
-    # Read SwissProt hits
-    tsv_file = f"output/diamond/{genome_name}.tsv"
+                    fields = line[1:].rstrip('\n').split(None, 1)
+                    if not fields or fields[0] in index:
+                        continue
+                    index[fields[0]] = len(ids)
+                    ids.append(fields[0])
+                    descriptions.append(fields[1].strip() if len(fields) > 1 else 'No description')
+    return index, ids, descriptions
+
+def best_hits(tsv_file, index):
+    """Best DIAMOND hit per gene by bitscore, as "<subject>: <title>", and the row count."""
+    n = len(index)
+    scores = array('d', [float('-inf')]) * n
+    hits = [None] * n
+    n_rows = 0
     if os.path.exists(tsv_file):
         with open(tsv_file) as f:
             for line in f:
-                parts = line.strip().split('\t')
-                if len(parts) >= 13:
-                    gene_id = parts[0]
-                    swissprot_id = parts[1]
-                    description = parts[12]
-                    if gene_id in genes:
-                        genes[gene_id]['swissprot'] = f"{swissprot_id}: {description}"
-
-    # Read Pfam domains
-    dom_file = f"output/hmmer/{genome_name}.domtblout"
-    total_domains = 0
-    domains_per_gene = {}
-    
+                n_rows += 1
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) < 13:
+                    continue
+                gene = index.get(parts[0])
+                if gene is None:
+                    continue
+                try:
+                    score = float(parts[11])
+                except ValueError:
+                    continue
+                if score > scores[gene]:
+                    scores[gene] = score
+                    hits[gene] = f"{parts[1]}: {parts[12]}"
+    return hits, n_rows
+
+def index_domains(dom_file, index):
+    """Per-gene domain lists as linked arrays of interned domain names.
+    
+    head[gene] is the gene's last domain row (-1 if none), link[row] the
+    row before it and names[row] the interned domain name. n_rows counts
+    every domain row, matched to a gene or not.
+    """
+    head = array('i', [-1]) * len(index)
+    link = array('i')
+    names = array('i')
+    domain_ids = {}
+    domain_names = []
+    n_rows = 0
     if os.path.exists(dom_file):
         with open(dom_file) as f:
             for line in f:
-                if not line.startswith('#'):
-                    parts = line.strip().split()
-                    if len(parts) >= 4:
-                        gene_id = None
-                        for pos in [0, 3]:
-                            if pos < len(parts):
-                                candidate = parts[pos]
-                                if candidate in genes:
-                                    gene_id = candidate
-                                    break
-                        
-                        if gene_id and gene_id in genes:
-                            domain_name = parts[0] if len(parts) > 0 else "Unknown"
-                            if gene_id not in domains_per_gene:
-                                domains_per_gene[gene_id] = []
-                            domains_per_gene[gene_id].append(domain_name)
-                            total_domains += 1
-
-    # Update genes with domain information
-    for gene_id, domain_list in domains_per_gene.items():
-        if gene_id in genes:
-            genes[gene_id]['pfam'] = ', '.join(set(domain_list))
-            genes[gene_id]['domain_count'] = len(domain_list)
-
+                if line.startswith('#'):
+                    continue
+                parts = line.split(None, 4)
+                if len(parts) < 4:
+                    continue
+                n_rows += 1
+                # hmmscan puts the protein in column 4, hmmsearch in column 1
+                gene = index.get(parts[3])
+                domain = parts[0]
+                if gene is None:
+                    gene = index.get(parts[0])
+                    domain = parts[3]
+                    if gene is None:
+                        continue
+                domain_id = domain_ids.get(domain)
+                if domain_id is None:
+                    domain_id = domain_ids[domain] = len(domain_names)
+                    domain_names.append(domain)
+                link.append(head[gene])
+                names.append(domain_id)
+                head[gene] = len(names) - 1
+    return head, link, names, domain_names, n_rows
+
+def stats_path(genome_name, output_file):
+    """The stats record is written next to the annotation table."""
+    return os.path.join(os.path.dirname(output_file), f"{genome_name}_stats.json")
+
+def combine_annotations(genome_name, output_file=None):
+    index, ids, descriptions = read_genes(f"output/prodigal/{genome_name}.faa")
+    hits, hit_rows = best_hits(f"output/diamond/{genome_name}.tsv", index)
+    head, link, names, domain_names, domain_rows = index_domains(f"output/hmmer/{genome_name}.domtblout", index)
+
+    def rows():
+        for gene, gene_id in enumerate(ids):
+            domains = []
+            row = head[gene]
+            while row >= 0:
+                domains.append(names[row])
+                row = link[row]
+            if domains:
+                # Distinct names in the order the domains were found
+                pfam = ', '.join(domain_names[d] for d in dict.fromkeys(reversed(domains)))
+            else:
+                pfam = 'No domains'
+            yield f"{gene_id}\t{descriptions[gene]}\t{hits[gene] or 'No hit'}\t{pfam}\t{len(domains)}\n"
+    
     # Write combined annotations
-    output_file = f"output/combined/{genome_name}_annotations.tsv"
+    if output_file is None:
+        output_file = f"output/combined/{genome_name}_annotations.tsv"
     with open(output_file, 'w') as out:
         out.write("Gene_ID\tProtein_Description\tSwissProt_Annotation\tPfam_Domains\tDomain_Count\n")
-        for gene_info in genes.values():
-            out.write(f"{gene_info['gene_id']}\t{gene_info['description']}\t{gene_info['swissprot']}\t{gene_info['pfam']}\t{gene_info['domain_count']}\n")
+        out.writelines(rows())
+    
+    genes_with_domains = sum(1 for row in head if row >= 0)
+    
+    # Counts for the summary reports, so they never re-read the raw files
+    stats = {
+        'genome': genome_name,
+        'genes': len(ids),
+        'swissprot_hits': hit_rows,
+        'genes_with_hits': sum(1 for hit in hits if hit is not None),
+        'pfam_domains': domain_rows,
+        'genes_with_domains': genes_with_domains,
+    }
+    with open(stats_path(genome_name, output_file), 'w') as f:
+        json.dump(stats, f)
     
     print(f"Combined annotations written to: {output_file}")
-    print(f"Total domains found: {total_domains}")
-    print(f"Genes with domains: {len(domains_per_gene)}")
-    return len(genes), total_domains
+    print(f"Total domains found: {len(names)}")
+    print(f"Genes with domains: {genes_with_domains}")
+    return len(ids), len(names)
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python combine_annotations.py <genome_name>")
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python combine_annotations.py <genome_name> [output_file]")
         sys.exit(1)
     
     genome_name = sys.argv[1]
-    gene_count, domain_count = combine_annotations(genome_name)
+    output_file = sys.argv[2] if len(sys.argv) == 3 else None
+    gene_count, domain_count = combine_annotations(genome_name, output_file)
     print(f"Processed {gene_count} genes for {genome_name}")
 EOF
 }
@@ -329,55 +543,43 @@ combine_annotations() {
     
     log "   📊 Combining annotations: $genome_name"
     
-    if [ -f "output/combined/${genome_name}_annotations.tsv" ]; then
+    local inputs=("output/prodigal/${genome_name}.faa" "output/diamond/${genome_name}.tsv" "output/hmmer/${genome_name}.domtblout")
+    if step_done "$genome_name/combine" "${inputs[@]}" && [ -f "output/combined/${genome_name}_stats.json" ]; then
         log "   ⏩ Already combined: $genome_name"
         return 0
     fi
     
     create_combine_script
-    python3 "scripts/combine_annotations.py" "$genome_name"
+    local stage=$(step_stage "$genome_name/combine")
+    local rc=0
+    python3 "scripts/combine_annotations.py" "$genome_name" "$stage/${genome_name}_annotations.tsv" || rc=$?
+    step_commit "$genome_name/combine" "$rc" "${inputs[@]}" -- \
+        "output/combined/${genome_name}_annotations.tsv" "output/combined/${genome_name}_stats.json"
+    return $rc
 }
 
 # Function to create summary Python script
 create_summary_script() {
     cat > "scripts/generate_summary.py" << 'EOF'
-import os
 import sys
+import json
 from datetime import datetime
 
+def load_stats(genome_name):
+    """Counts recorded by combine_annotations.py; zeros if it did not finish."""
+    try:
+        with open(f"output/combined/{genome_name}_stats.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"Warning: no annotation stats for {genome_name}", file=sys.stderr)
+        return {}
+
 def generate_summary(genome_name):
     # Collect statistics
-    genes = 0
-    swissprot_hits = 0
-    pfam_domains = 0
-    
-    # Count genes
-    faa_file = f"output/prodigal/{genome_name}.faa"
-    if os.path.exists(faa_file):
-        with open(faa_file) as f:
-            genes = sum(1 for line in f if line.startswith('>'))
-
-    # Count SwissProt hits
-    tsv_file = f"output/diamond/{genome_name}.tsv"
-    if os.path.exists(tsv_file):
-        with open(tsv_file) as f:
-            swissprot_hits = sum(1 for line in f)
-
-    # Get domain count
-    domain_count_file = f"output/hmmer/{genome_name}_domain_count.txt"
-    if os.path.exists(domain_count_file):
-        with open(domain_count_file) as f:
-            try:
-                pfam_domains = int(f.read().strip())
-            except:
-                pfam_domains = 0
-    
-    # Fallback: count from domtblout
-    if pfam_domains == 0:
-        dom_file = f"output/hmmer/{genome_name}.domtblout"
-        if os.path.exists(dom_file):
-            with open(dom_file) as f:
-                pfam_domains = sum(1 for line in f if not line.startswith('#') and len(line.strip().split()) >= 4)
+    stats = load_stats(genome_name)
+    genes = stats.get('genes', 0)
+    swissprot_hits = stats.get('swissprot_hits', 0)
+    pfam_domains = stats.get('pfam_domains', 0)
 
     # Calculate metrics
     coverage = (swissprot_hits / genes * 100) if genes > 0 else 0
@@ -474,6 +676,7 @@ create_final_summary_script() {
     cat > "scripts/final_summary.py" << 'EOF'
 import os
 import glob
+import json
 from datetime import datetime
 
 def generate_final_report():
@@ -482,41 +685,19 @@ def generate_final_report():
     total_hits = 0
     total_domains = 0
 
-    for gff in glob.glob("output/prodigal/*.gff"):
+    for gff in sorted(glob.glob("output/prodigal/*.gff")):
         genome_name = os.path.basename(gff).replace('.gff', '')
-        
-        genes = 0
-        hits = 0
-        domains = 0
-        
-        # Count genes
-        faa_file = f"output/prodigal/{genome_name}.faa"
-        if os.path.exists(faa_file):
-            with open(faa_file) as f:
-                genes = sum(1 for line in f if line.startswith('>'))
-        
-        # Count SwissProt hits
-        tsv_file = f"output/diamond/{genome_name}.tsv"
-        if os.path.exists(tsv_file):
-            with open(tsv_file) as f:
-                hits = sum(1 for line in f)
-        
-        # Get domain count
-        domain_count_file = f"output/hmmer/{genome_name}_domain_count.txt"
-        if os.path.exists(domain_count_file):
-            with open(domain_count_file) as f:
-                try:
-                    domains = int(f.read().strip())
-                except:
-                    domains = 0
-        
-        # Fallback
-        if domains == 0:
-            dom_file = f"output/hmmer/{genome_name}.domtblout"
-            if os.path.exists(dom_file):
-                with open(dom_file) as f:
-                    domains = sum(1 for line in f if not line.startswith('#') and len(line.strip().split()) >= 4)
-        
+
+        # Counts recorded by combine_annotations.py
+        try:
+            with open(f"output/combined/{genome_name}_stats.json") as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {}
+        genes = stats.get('genes', 0)
+        hits = stats.get('swissprot_hits', 0)
+        domains = stats.get('pfam_domains', 0)
+
         coverage = (hits / genes * 100) if genes > 0 else 0
         genomes_data.append({
             'name': genome_name,
@@ -645,33 +826,42 @@ main() {
     
     log "📁 Found ${#GENOME_FILES[@]} preprocessed genome files"
     
-    # Process each genome
+    # Steps 1-2 per genome: gene prediction and homology search
+    local predicted=()
     for genome in "${GENOME_FILES[@]}"; do
         genome_name=$(basename "$genome" .fna)
         log "🔬 Processing: $genome_name"
         log "----------------------------------------"
-        
+    
         # Step 1: Gene Prediction
         if predict_genes "$genome" "output/prodigal/$genome_name" "$genome_name"; then
             # Step 2: Homology Search
             homology_search "output/prodigal/${genome_name}.faa" "output/diamond/$genome_name" "$genome_name"
-            
-            # Step 3: Domain Detection
-            domain_detection "output/prodigal/${genome_name}.faa" "output/hmmer/$genome_name" "$genome_name"
-            
-            # Step 4: Combine Annotations
-            combine_annotations "$genome_name"
-            
-            # Step 5: Generate Report
-            generate_summary "$genome_name"
-            
-            log "✅ Completed: $genome_name"
+            predicted+=("$genome_name")
         else
             log "❌ Failed to process: $genome_name"
         fi
         echo ""
     done
     
+    # Step 3: Domain Detection, one Pfam batch for all genomes
+    if [ ${#predicted[@]} -gt 0 ]; then
+        log "🏷️  Domain detection for ${#predicted[@]} genome(s)"
+        log "----------------------------------------"
+        domain_detection_batch "${predicted[@]}"
+        echo ""
+    fi
+    
+    for genome_name in "${predicted[@]}"; do
+        # Step 4: Combine Annotations
+        combine_annotations "$genome_name"
+    
+        # Step 5: Generate Report
+        generate_summary "$genome_name"
+    
+        log "✅ Completed: $genome_name"
+    done
+
     # Generate final summary
     generate_final_summary
 }
@@ -691,4 +881,5 @@ log "   - Pfam domains: output/hmmer/"
 log "   - Combined annotations: output/combined/"
 log "   - Individual reports: reports/"
 log "   - Final summary: reports/final_summary.html"
+log "   - Step manifests (used to resume): output/.manifest/"
 log "=================================================="
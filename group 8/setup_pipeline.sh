@@ -80,6 +80,7 @@ PFAM_DB="databases/Pfam-A.hmm"
 
 # Parameters
 THREADS=$(nproc)
+SHARD_THREADS=4     # cores per DIAMOND/hmmscan shard
 E_VALUE=1e-5
 MAX_TARGET_SEQS=1
 
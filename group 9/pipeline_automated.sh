@@ -13,7 +13,7 @@ if [[ ! -f /etc/debian_version ]]; then
 fi
 
 sudo apt update -y
-sudo apt install -y fastqc fastp spades quast abricate unzip wget git python3-biopython
+sudo apt install -y fastqc fastp spades quast abricate unzip wget git python3-biopython python3-numpy
 
 # Install Prokka if not installed
 if ! command -v prokka &>/dev/null; then
@@ -43,6 +43,7 @@ echo "===================================================="
 # 🔹 SECTION 2 — AUTOMATED GENOME ANALYSIS PIPELINE
 ################################################################################
 WORKDIR="/mnt/d/automated_pipeline"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 cd "$WORKDIR"
 
 echo "===================================================="
@@ -56,6 +57,102 @@ if ! ls *_R1_001.fastq.gz 1>/dev/null 2>&1; then
 fi
 
 THREADS=$(nproc)
+# SPAdes threads and memory are planned per sample from its trimmed reads and
+# past runs by group 5's spades_planner.py (THREADS is the upper limit); if it
+# cannot plan a sample, SPAdes gets THREADS and SPADES_MEM_GB
+SPADES_PLANNER="${SPADES_PLANNER:-$SCRIPT_DIR/../group 5/spades_planner.py}"
+SPADES_HISTORY="${SPADES_HISTORY:-${XDG_CACHE_HOME:-$HOME/.cache}/automated_pipeline/spades_history.tsv}"
+SPADES_MEM_GB="${SPADES_MEM_GB:-250}"    # SPAdes' own default
+# fastp's report has the FastQC metrics of the raw and the trimmed reads from
+# its single pass; set RUN_FASTQC=1 for a separate FastQC pass as well
+RUN_FASTQC="${RUN_FASTQC:-0}"
+
+################################################################################
+# 🔹 STEP MANIFESTS — resume at the first incomplete step
+################################################################################
+# Each step writes into .partial/<sample>/<step>/ and its outputs are moved into
+# place only after the tool exits 0. The manifest .manifest/<sample>/<step> is
+# then written atomically with the exit status, a digest of the inputs and the
+# size + SHA-256 of every output file. A step is skipped only when its manifest
+# says status 0, the inputs are unchanged and every output still has its
+# recorded size, so a killed SPAdes run is never mistaken for a finished one.
+MANIFEST_DIR=".manifest"
+STAGING_DIR=".partial"
+# size = check output sizes on restart, full = also re-check the checksums
+MANIFEST_VERIFY="${MANIFEST_VERIFY:-size}"
+
+# Digest of the inputs: path, size and mtime of every file under them
+inputs_digest() {
+    local path
+    for path in "$@"; do
+        find "$path" -type f -printf '%p\t%s\t%T@\n' 2>/dev/null
+    done | sort | sha256sum | cut -d' ' -f1
+}
+
+# Usage: step_done ID INPUT...  → 0 if the step finished and is still valid
+step_done() {
+    local manifest="$MANIFEST_DIR/$1"
+    shift
+    [[ -f "$manifest" ]] || return 1
+    grep -qx $'status\t0' "$manifest" || return 1
+    [[ "$(awk -F'\t' '$1 == "inputs" {print $2}' "$manifest")" == "$(inputs_digest "$@")" ]] || return 1
+
+    local kind path size sum
+    while IFS=$'\t' read -r kind path size sum; do
+        [[ "$kind" == "file" ]] || continue
+        [[ -f "$path" && "$(stat -c %s "$path")" == "$size" ]] || return 1
+        if [[ "$MANIFEST_VERIFY" == "full" ]]; then
+            [[ "$(sha256sum < "$path" | cut -d' ' -f1)" == "$sum" ]] || return 1
+        fi
+    done < "$manifest"
+}
+
+# Usage: step_stage ID  → prints a fresh staging directory for the step's outputs
+step_stage() {
+    rm -f "$MANIFEST_DIR/$1"
+    rm -rf "${STAGING_DIR:?}/$1"
+    mkdir -p "$STAGING_DIR/$1"
+    echo "$STAGING_DIR/$1"
+}
+
+# Usage: step_commit ID STATUS INPUT... -- OUTPUT...
+# On status 0 moves each OUTPUT from <stage>/<basename> into place; always
+# records the manifest, so failures are visible in .manifest/ as well
+step_commit() {
+    local id=$1 status=$2
+    shift 2
+    local inputs=() outputs=()
+    while [[ $# -gt 0 && "$1" != "--" ]]; do
+        inputs+=("$1")
+        shift
+    done
+    shift
+    outputs=("$@")
+
+    local stage="$STAGING_DIR/$id"
+    local manifest="$MANIFEST_DIR/$id"
+    mkdir -p "$(dirname "$manifest")"
+
+    {
+        printf 'step\t%s\n' "$id"
+        printf 'status\t%s\n' "$status"
+        printf 'inputs\t%s\n' "$(inputs_digest "${inputs[@]}")"
+        printf 'finished\t%s\n' "$(date '+%Y-%m-%d %H:%M:%S')"
+        if [[ "$status" -eq 0 ]]; then
+            local output file
+            for output in "${outputs[@]}"; do
+                rm -rf "$output"
+                mv "$stage/$(basename "$output")" "$output"
+                while IFS= read -r -d '' file; do
+                    printf 'file\t%s\t%s\t%s\n' "$file" "$(stat -c %s "$file")" "$(sha256sum < "$file" | cut -d' ' -f1)"
+                done < <(find "$output" -type f -print0 | sort -z)
+            done
+        fi
+    } > "$manifest.tmp"
+    mv "$manifest.tmp" "$manifest"
+    rm -rf "$stage"
+}
+
 SAMPLE_COUNT=0
 TOTAL_SAMPLES=$(ls *_R1_001.fastq.gz | wc -l)
 
@@ -74,38 +171,66 @@ for FWD in *_R1_001.fastq.gz; do
     echo "===================================================="
 
     # 1️⃣ FASTQC
-    if [[ ! -d "${SAMPLE}_fastqc" ]]; then
+    if [[ "$RUN_FASTQC" != "1" ]]; then
+        echo "✔ [1/6] FastQC skipped (QC metrics are in the fastp report)"
+    elif ! step_done "$SAMPLE/fastqc" "$FWD" "$REV"; then
         echo "[1/6] Running FastQC..."
-        mkdir -p "${SAMPLE}_fastqc"
-        fastqc "$FWD" "$REV" -o "${SAMPLE}_fastqc" -q
+        STAGE=$(step_stage "$SAMPLE/fastqc")
+        mkdir -p "$STAGE/${SAMPLE}_fastqc"
+        RC=0
+        fastqc "$FWD" "$REV" -o "$STAGE/${SAMPLE}_fastqc" -q || RC=$?
+        step_commit "$SAMPLE/fastqc" "$RC" "$FWD" "$REV" -- "${SAMPLE}_fastqc"
+        [[ $RC -eq 0 ]] || exit $RC
     else
         echo "✔ [1/6] FastQC already done"
     fi
 
     # 2️⃣ fastp
-    if [[ ! -f "${SAMPLE}_trimmed_R1.fastq" ]]; then
+    if ! step_done "$SAMPLE/fastp" "$FWD" "$REV"; then
         echo "[2/6] Running fastp..."
+        STAGE=$(step_stage "$SAMPLE/fastp")
+        RC=0
         fastp -i "$FWD" -I "$REV" -q \
-            -o "${SAMPLE}_trimmed_R1.fastq" \
-            -O "${SAMPLE}_trimmed_R2.fastq" \
-            -h "${SAMPLE}_fastp.html" \
-            -j "${SAMPLE}_fastp.json" \
-            --thread $THREADS
+            -o "$STAGE/${SAMPLE}_trimmed_R1.fastq.gz" \
+            -O "$STAGE/${SAMPLE}_trimmed_R2.fastq.gz" \
+            -h "$STAGE/${SAMPLE}_fastp.html" \
+            -j "$STAGE/${SAMPLE}_fastp.json" \
+            --thread $THREADS || RC=$?
+        step_commit "$SAMPLE/fastp" "$RC" "$FWD" "$REV" -- \
+            "${SAMPLE}_trimmed_R1.fastq.gz" "${SAMPLE}_trimmed_R2.fastq.gz" "${SAMPLE}_fastp.html" "${SAMPLE}_fastp.json"
+        [[ $RC -eq 0 ]] || exit $RC
     else
         echo "✔ [2/6] fastp already done"
     fi
 
     # 3️⃣ SPAdes
-    if [[ ! -s "${SAMPLE}_spades_output/contigs.fasta" ]]; then
+    if ! step_done "$SAMPLE/spades" "${SAMPLE}_trimmed_R1.fastq.gz" "${SAMPLE}_trimmed_R2.fastq.gz"; then
         echo "[3/6] Running SPAdes..."
-        spades.py --isolate \
-          -1 "${SAMPLE}_trimmed_R1.fastq" \
-          -2 "${SAMPLE}_trimmed_R2.fastq" \
-          -o "${SAMPLE}_spades_output" \
-          -t $THREADS
-        
+        STAGE=$(step_stage "$SAMPLE/spades")
+        SPADES_PLAN="$STAGE/${SAMPLE}_spades_plan.json"
+        SPADES_RECORD=(python3 "$SPADES_PLANNER" run --plan "$SPADES_PLAN" --history "$SPADES_HISTORY" --sample "$SAMPLE" --)
+        if ! read -r SPADES_THREADS SPADES_MEM _ < <(python3 "$SPADES_PLANNER" plan \
+            "${SAMPLE}_trimmed_R1.fastq.gz" "${SAMPLE}_trimmed_R2.fastq.gz" \
+            --fastp-json "${SAMPLE}_fastp.json" --history "$SPADES_HISTORY" \
+            --max-threads "$THREADS" --out "$SPADES_PLAN"); then
+            # Run SPAdes directly: "run" needs numpy just like "plan"
+            echo "⚠️  SPAdes planner failed for $SAMPLE - using $THREADS threads, ${SPADES_MEM_GB} GB"
+            SPADES_THREADS=$THREADS; SPADES_MEM=$SPADES_MEM_GB; SPADES_RECORD=()
+        fi
+        echo "   SPAdes: $SPADES_THREADS threads, ${SPADES_MEM} GB"
+        RC=0
+        "${SPADES_RECORD[@]}" spades.py --isolate \
+          -1 "${SAMPLE}_trimmed_R1.fastq.gz" \
+          -2 "${SAMPLE}_trimmed_R2.fastq.gz" \
+          -o "$STAGE/${SAMPLE}_spades_output" \
+          -t "$SPADES_THREADS" -m "$SPADES_MEM" || RC=$?
+
         # Verify assembly succeeded
-        if [[ ! -s "${SAMPLE}_spades_output/contigs.fasta" ]]; then
+        if [[ $RC -eq 0 && ! -s "$STAGE/${SAMPLE}_spades_output/contigs.fasta" ]]; then
+            RC=1
+        fi
+        step_commit "$SAMPLE/spades" "$RC" "${SAMPLE}_trimmed_R1.fastq.gz" "${SAMPLE}_trimmed_R2.fastq.gz" -- "${SAMPLE}_spades_output"
+        if [[ $RC -ne 0 ]]; then
             echo "❌ ERROR: SPAdes failed → Skipping $SAMPLE"
             continue
         fi
@@ -113,33 +238,47 @@ for FWD in *_R1_001.fastq.gz; do
         echo "✔ [3/6] SPAdes already done"
     fi
 
+    CONTIGS="${SAMPLE}_spades_output/contigs.fasta"
+
     # 4️⃣ QUAST
-    if [[ ! -d "${SAMPLE}_quast" ]]; then
+    if ! step_done "$SAMPLE/quast" "$CONTIGS"; then
         echo "[4/6] Running QUAST..."
-        quast.py "${SAMPLE}_spades_output/contigs.fasta" \
-          -o "${SAMPLE}_quast" \
-          --threads $THREADS
+        STAGE=$(step_stage "$SAMPLE/quast")
+        RC=0
+        quast.py "$CONTIGS" \
+          -o "$STAGE/${SAMPLE}_quast" \
+          --threads $THREADS || RC=$?
+        step_commit "$SAMPLE/quast" "$RC" "$CONTIGS" -- "${SAMPLE}_quast"
+        [[ $RC -eq 0 ]] || exit $RC
     else
         echo "✔ [4/6] QUAST already done"
     fi
 
     # 5️⃣ PROKKA
-    if [[ ! -f "${SAMPLE}_prokka/${SAMPLE}.txt" ]]; then
+    if ! step_done "$SAMPLE/prokka" "$CONTIGS"; then
         echo "[5/6] Running Prokka..."
-        prokka --outdir "${SAMPLE}_prokka" \
+        STAGE=$(step_stage "$SAMPLE/prokka")
+        RC=0
+        prokka --outdir "$STAGE/${SAMPLE}_prokka" \
                --prefix "$SAMPLE" \
                --cpus $THREADS \
                --force \
-               "${SAMPLE}_spades_output/contigs.fasta"
+               "$CONTIGS" || RC=$?
+        step_commit "$SAMPLE/prokka" "$RC" "$CONTIGS" -- "${SAMPLE}_prokka"
+        [[ $RC -eq 0 ]] || exit $RC
     else
         echo "✔ [5/6] Prokka already done"
     fi
 
     # 6️⃣ ABRICATE
-    if [[ ! -f "${SAMPLE}_abricate.txt" ]]; then
+    if ! step_done "$SAMPLE/abricate" "$CONTIGS"; then
         echo "[6/6] Running Abricate..."
-        abricate "${SAMPLE}_spades_output/contigs.fasta" > "${SAMPLE}_abricate.txt"
-        
+        STAGE=$(step_stage "$SAMPLE/abricate")
+        RC=0
+        abricate "$CONTIGS" > "$STAGE/${SAMPLE}_abricate.txt" || RC=$?
+        step_commit "$SAMPLE/abricate" "$RC" "$CONTIGS" -- "${SAMPLE}_abricate.txt"
+        [[ $RC -eq 0 ]] || exit $RC
+
         # Show AMR gene count
         AMR_COUNT=$(grep -v "^#" "${SAMPLE}_abricate.txt" | wc -l)
         echo "   📊 Found $AMR_COUNT AMR gene(s)"
@@ -158,10 +297,12 @@ echo " Output location: $WORKDIR"
 echo "===================================================="
 echo ""
 echo "📋 Output files per sample:"
-echo "   {SAMPLE}_fastqc/          → Quality control"
-echo "   {SAMPLE}_fastp.html       → Trimming stats"
+echo "   {SAMPLE}_fastp.html       → Quality control + trimming stats"
+echo "   {SAMPLE}_trimmed_R*.fastq.gz → Trimmed reads"
+echo "   {SAMPLE}_fastqc/          → FastQC (only with RUN_FASTQC=1)"
 echo "   {SAMPLE}_spades_output/   → Assembly"
 echo "   {SAMPLE}_quast/           → Assembly metrics"
 echo "   {SAMPLE}_prokka/          → Annotations"
 echo "   {SAMPLE}_abricate.txt     → AMR genes"
+echo "   .manifest/{SAMPLE}/       → Step completion records (used to resume)"
 echo ""
\ No newline at end of file